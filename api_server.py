@@ -1,21 +1,54 @@
 import uvicorn
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from pydantic import BaseModel
-from urllib.parse import urlparse
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from urllib.parse import urlsplit
+import base64
+import json
+import logging
 import os
-from utils.db_utils import DB_PATH
-from utils.db_utils import init_db, add_url_to_crawl
-from utils.data_utils import extract_domain
+from contextlib import asynccontextmanager
+from itertools import islice
+from utils.db_utils import init_db, add_url_to_crawl, add_urls_to_crawl, get_crawl_status, run_db, shutdown_db_executor
+from utils.export import MEDIA_TYPES, export_filename, iter_export
+from utils.job_notify import notify_workers
+from utils.log_utils import setup_logging
+from utils.metrics import CONTENT_TYPE, REGISTRY, collect_queue_depth, count_error
+from utils.url_utils import canonicalize_url
 from typing import Optional
+from config import (
+    API_MAX_PAGE_SIZE,
+    API_PAGE_SIZE,
+    CRAWL_CONCURRENCY,
+    CRAWL_ORDER,
+    DISCOVERY_MODE,
+    DOMAIN_PRODUCT_URL_PATTERNS,
+    MAX_CRAWL_BATCH,
+    RENDER_PROFILE,
+)
 
 init_db()
+setup_logging()
+REGISTRY.add_collector(collect_queue_depth)
+
+logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Web Crawler API", description="API for adding URLs to crawl queue")
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    shutdown_db_executor()
+
+app = FastAPI(title="Web Crawler API", description="API for adding URLs to crawl queue", lifespan=lifespan)
 
 class CrawlRequest(BaseModel):
     url: str
     max_pages: int = 10
     max_depth: int = 3
+    concurrency: int = CRAWL_CONCURRENCY
+    product_patterns: Optional[list[str]] = None
+    discovery: str = DISCOVERY_MODE
+    render_profile: str = RENDER_PROFILE
+    crawl_order: str = CRAWL_ORDER
 
 class CrawlResponse(BaseModel):
     id: int
@@ -23,26 +56,51 @@ class CrawlResponse(BaseModel):
     status: str
     message: str
 
+def make_crawl_job(crawl_request):
+    # Validates a request and returns the add_url_to_crawl arguments for it,
+    # parsing the URL only once for both the check and the domain.
+    try:
+        parsed_url = urlsplit(crawl_request.url)
+    except ValueError:
+        raise ValueError("Invalid URL format")
+    if not parsed_url.scheme or not parsed_url.netloc:
+        raise ValueError("Invalid URL format")
+    if crawl_request.concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    if crawl_request.discovery not in ("crawl", "sitemap", "hybrid"):
+        raise ValueError("discovery must be one of: crawl, sitemap, hybrid")
+    if crawl_request.render_profile not in ("full", "links"):
+        raise ValueError("render_profile must be one of: full, links")
+    if crawl_request.crawl_order not in ("best_first", "depth_first"):
+        raise ValueError("crawl_order must be one of: best_first, depth_first")
+    
+    domain = f"{parsed_url.scheme}://{parsed_url.netloc}"
+    return {
+        "url": crawl_request.url,
+        "domain": domain,
+        "max_pages": crawl_request.max_pages,
+        "max_depth": crawl_request.max_depth,
+        "concurrency": crawl_request.concurrency,
+        "product_patterns": (
+            crawl_request.product_patterns
+            if crawl_request.product_patterns is not None
+            else DOMAIN_PRODUCT_URL_PATTERNS.get(domain)
+        ),
+        "discovery": crawl_request.discovery,
+        "render_profile": crawl_request.render_profile,
+        "crawl_order": crawl_request.crawl_order,
+    }
+
 @app.post("/api/crawl", response_model=CrawlResponse)
 async def add_url(crawl_request: CrawlRequest):  # Add type annotation here
-    print("Received request to add URL to crawl queue:", crawl_request)
+    logger.info("Received request to add URL to crawl queue: %s", crawl_request.url)
     try:
-        parsed_url = urlparse(crawl_request.url)
-        if not parsed_url.scheme or not parsed_url.netloc:
-            raise HTTPException(status_code=400, detail="Invalid URL format")
-    except Exception:
-        print("Invalid URL format")
-        raise HTTPException(status_code=400, detail="Invalid URL format")
+        job = make_crawl_job(crawl_request)
+    except ValueError as e:
+        logger.info("Rejected crawl request for %s: %s", crawl_request.url, str(e))
+        raise HTTPException(status_code=400, detail=str(e))
     try:
-        print("Extracting domain", crawl_request)
-        domain = extract_domain(crawl_request.url)
-        
-        url_id = add_url_to_crawl(
-            url=crawl_request.url,
-            domain=domain,
-            max_pages=crawl_request.max_pages,
-            max_depth=crawl_request.max_depth
-        )
+        url_id = await run_db(add_url_to_crawl, **job)
         
         if url_id == -1:
             return CrawlResponse(
@@ -52,6 +110,7 @@ async def add_url(crawl_request: CrawlRequest):  # Add type annotation here
                 message="URL already exists in the crawl queue"
             )
         
+        notify_workers()
         return CrawlResponse(
             id=url_id,
             url=crawl_request.url,
@@ -59,23 +118,117 @@ async def add_url(crawl_request: CrawlRequest):  # Add type annotation here
             message="URL added to crawl queue successfully"
         )
     except Exception as e:
-        print(f"Error adding URL to crawl queue: {str(e)}")
+        logger.error("Error adding URL to crawl queue: %s", str(e))
+        count_error(e)
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+def parse_crawl_batch(body, content_type):
+    text = body.decode("utf-8")
+    if "ndjson" not in content_type and text.lstrip().startswith("["):
+        items = json.loads(text)
+    else:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    return items
+
+@app.post("/api/crawl/batch")
+async def add_urls(request: Request):
+    # Accepts a JSON array or NDJSON lines, each either a URL string or a
+    # CrawlRequest object, and queues them all in one transaction.
+    try:
+        items = parse_crawl_batch(await request.body(), request.headers.get("content-type", ""))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    if len(items) > MAX_CRAWL_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_CRAWL_BATCH} URLs per batch")
+    
+    results = []
+    jobs = {}
+    for index, item in enumerate(items):
+        item_url = item.get("url") if isinstance(item, dict) else item if isinstance(item, str) else None
+        try:
+            if isinstance(item, str):
+                crawl_request = CrawlRequest(url=item)
+            elif isinstance(item, dict):
+                crawl_request = CrawlRequest.model_validate(item)
+            else:
+                raise ValueError("Each item must be a URL string or an object")
+            job = make_crawl_job(crawl_request)
+        except ValidationError as e:
+            results.append({"index": index, "url": item_url, "id": None, "duplicate": False, "error": e.errors()[0]["msg"]})
+            continue
+        except ValueError as e:
+            results.append({"index": index, "url": item_url, "id": None, "duplicate": False, "error": str(e)})
+            continue
+        results.append({"index": index, "url": job["url"], "id": None, "duplicate": False})
+        jobs.setdefault(job["url"], job)
+    
+    try:
+        existing, inserted = await run_db(add_urls_to_crawl, list(jobs.values()))
+    except Exception as e:
+        logger.error("Error adding URLs to crawl queue: %s", str(e))
+        count_error(e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
+    
+    # The first occurrence of a new URL is the inserted one; repeats within
+    # the batch and URLs queued earlier are duplicates.
+    first_seen = set()
+    for result in results:
+        url = result["url"]
+        if "error" in result:
+            continue
+        if url in inserted and url not in first_seen:
+            result["id"] = inserted[url]
+            first_seen.add(url)
+        else:
+            result["id"] = existing.get(url, inserted.get(url))
+            result["duplicate"] = True
+    
+    if inserted:
+        notify_workers()
+    # The items are plain JSON already; skip FastAPI's per-value encoder.
+    return JSONResponse({
+        "inserted": len(inserted),
+        "duplicates": sum(result["duplicate"] for result in results),
+        "invalid": sum("error" in result for result in results),
+        "items": results,
+    })
+
+@app.get("/api/crawl/{url_id}")
+async def get_crawl(url_id: int):
+    # Running service jobs save their progress with each batch of products
+    # (see utils/product_sink.py), so the counts trail the crawl by at most
+    # one batch.
+    status = await run_db(get_crawl_status, url_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"No crawl with id {url_id}")
+    return status
 
 @app.get("/")
 async def root():
     return {"message": "Web Crawler API is running. Use /api/crawl to add URLs to crawl."}
 
+@app.get("/metrics")
+async def metrics():
+    # Rendering runs the queue-depth collector, which reads the database.
+    return Response(await run_db(REGISTRY.render), media_type=CONTENT_TYPE)
+
 from utils.db_utils import (
     get_pending_urls,
     update_url_status,
     save_crawled_products,
     add_url_to_crawl,
-    init_db
+    clear_crawled_products,
+    clear_urls_to_crawl,
+    delete_crawled_product,
+    delete_url_to_crawl,
+    get_products_page,
+    init_db,
+    iter_products,
+    PRODUCT_FIELDS,
+    run_db,
+    STREAM_BATCH_SIZE,
 )
 
-import sqlite3
-
 class StatusUpdateRequest(BaseModel):
     url_id: int
     status: str
@@ -90,70 +243,137 @@ class ProductSaveRequest(BaseModel):
     crawl_id: int
     products: list[Product]
 
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        created_at, product_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return created_at, int(product_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def ndjson_chunks(rows, size=STREAM_BATCH_SIZE):
+    # Starlette pulls each chunk of a sync iterator on a worker thread, so
+    # send rows in batches rather than paying that hop per line.
+    while True:
+        chunk = "".join(json.dumps(row) + "\n" for row in islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+async def list_products(request, domain, category, crawl_id, fields, limit, cursor, format):
+    selected = tuple(field.strip() for field in fields.split(",") if field.strip()) if fields else PRODUCT_FIELDS
+    unknown = set(selected) - set(PRODUCT_FIELDS)
+    if not selected or unknown:
+        raise HTTPException(status_code=400, detail=f"fields must be a subset of: {', '.join(PRODUCT_FIELDS)}")
+    before = decode_cursor(cursor) if cursor else None
+    
+    if format == "ndjson" or "application/x-ndjson" in request.headers.get("accept", ""):
+        # Without an explicit limit the stream covers every matching product;
+        # memory use stays flat because rows come straight off the cursor.
+        rows = iter_products(selected, domain, category, crawl_id, before, limit)
+        return StreamingResponse(ndjson_chunks(rows), media_type="application/x-ndjson")
+    if format != "json":
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
+    
+    limit = min(limit or API_PAGE_SIZE, API_MAX_PAGE_SIZE)
+    products, next_key = await run_db(get_products_page, selected, domain, category, crawl_id, before, limit)
+    return {
+        "products": products,
+        "next_cursor": encode_cursor(next_key) if next_key else None,
+    }
+
 @app.get("/api/products")
-async def get_products():
-    from utils.db_utils import get_all_products
-    products = get_all_products()
-    return {"products": products}
+async def get_products(
+    request: Request,
+    domain: Optional[str] = None,
+    category: Optional[str] = None,
+    crawl_id: Optional[int] = None,
+    fields: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    format: str = "json",
+):
+    return await list_products(request, domain, category, crawl_id, fields, limit, cursor, format)
 
 @app.get("/api/products/{crawl_id}")
-async def get_products_by_crawl_id(crawl_id):
-    from utils.db_utils import get_products_by_crawl_id
-    products = get_products_by_crawl_id(crawl_id)
-    return {"products": products}
+async def get_products_by_crawl_id(
+    request: Request,
+    crawl_id: int,
+    fields: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    format: str = "json",
+):
+    return await list_products(request, None, None, crawl_id, fields, limit, cursor, format)
+
+@app.get("/api/export")
+async def export(
+    format: str = "csv",
+    compression: Optional[str] = None,
+    fields: Optional[str] = None,
+    domain: Optional[str] = None,
+    category: Optional[str] = None,
+    crawl_id: Optional[int] = None,
+):
+    selected = tuple(field.strip() for field in fields.split(",") if field.strip()) if fields else PRODUCT_FIELDS
+    try:
+        chunks = iter_export(format, compression, selected, domain=domain, category=category, crawl_id=crawl_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    
+    media_type = MEDIA_TYPES[format]
+    if compression and format != "parquet":
+        media_type = f"application/{compression}"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(format, compression)}"'},
+    )
 
 @app.get("/api/pending-urls")
 async def get_pending():
-    return get_pending_urls()
+    return await run_db(get_pending_urls)
 
 @app.put("/api/update-status")
-async def update_status(req):
+async def update_status(req: StatusUpdateRequest):
     valid_status = ['pending', 'processing', 'completed', 'failed']
     if req.status not in valid_status:
         raise HTTPException(status_code=400, detail="Invalid status value")
     
-    update_url_status(req.url_id, req.status)
+    await run_db(update_url_status, req.url_id, req.status)
+    if req.status == 'pending':
+        notify_workers()
     return {"message": f"Status updated to {req.status} for ID {req.url_id}"}
 
 @app.post("/api/save-products")
-async def save_products(req):
-    save_crawled_products([p.dict() for p in req.products], req.crawl_id)
+async def save_products(req: ProductSaveRequest):
+    # Products are keyed on their canonical URL, as the crawler stores them.
+    products = [dict(p.model_dump(), url=canonicalize_url(p.url)) for p in req.products]
+    await run_db(save_crawled_products, products, req.crawl_id)
     return {"message": "Products saved successfully"}
 
 @app.delete("/api/delete-url/{url_id}")
 async def delete_url(url_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM urls_to_crawl WHERE id = ?", (url_id,))
-    conn.commit()
-    conn.close()
+    await run_db(delete_url_to_crawl, url_id)
     return {"message": f"Deleted URL with id {url_id}"}
 
 @app.delete("/api/delete-product/{product_id}")
 async def delete_product(product_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM crawled_products WHERE id = ?", (product_id,))
-    conn.commit()
-    conn.close()
+    await run_db(delete_crawled_product, product_id)
     return {"message": f"Deleted product with id {product_id}"}
 
 @app.delete("/api/clear-urls")
 async def clear_all_urls():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM urls_to_crawl")
-    conn.commit()
-    conn.close()
+    await run_db(clear_urls_to_crawl)
     return {"message": "All URLs cleared from crawl queue."}
 
 @app.delete("/api/clear-products")
 async def clear_all_products():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM crawled_products")
-    conn.commit()
-    conn.close()
+    await run_db(clear_crawled_products)
     return {"message": "All crawled products cleared."}
 
 if __name__ == "__main__":
@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from utils import db_utils
+
+# Run from the repository root:
+#   python -m benchmarks.bench_db_ingest [--products 100000] [--batch 100] [--readers 4]
+#
+# Ingests the same synthetic products twice into fresh temporary databases:
+# once the way save_crawled_products used to (a new connection per call,
+# rollback journal, one INSERT per row) and once through the pooled WAL layer,
+# while reader threads keep querying the latest products like API clients.
+
+READ_QUERY = "SELECT * FROM crawled_products ORDER BY id DESC LIMIT 100"
+
+def make_products(count, domains=20):
+    return [
+        {
+            "url": f"https://shop-{index % domains}.example.com/products/item-{index}",
+            "domain": f"shop-{index % domains}.example.com",
+            "product_id": str(index),
+            "category": f"category-{index % 37}",
+        }
+        for index in range(count)
+    ]
+
+def legacy_save_crawled_products(products, crawl_id):
+    conn = sqlite3.connect(db_utils.DB_PATH, timeout=db_utils.DB_TIMEOUT)
+    cursor = conn.cursor()
+
+    for product in products:
+        cursor.execute(
+            "INSERT INTO crawled_products (url, domain, product_id, category, crawl_id) VALUES (?, ?, ?, ?, ?)",
+            (product['url'], product['domain'], product.get('product_id'), product.get('category'), crawl_id)
+        )
+
+    conn.commit()
+    conn.close()
+
+def legacy_read():
+    conn = sqlite3.connect(db_utils.DB_PATH, timeout=db_utils.DB_TIMEOUT)
+    try:
+        return conn.execute(READ_QUERY).fetchall()
+    finally:
+        conn.close()
+
+def pooled_read():
+    return db_utils.get_connection().execute(READ_QUERY).fetchall()
+
+def reader_loop(read, stop, latencies, errors):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            read()
+        except sqlite3.OperationalError:
+            errors.append(1)
+            continue
+        latencies.append(time.perf_counter() - start)
+    if read is pooled_read:
+        db_utils.close_connection()
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def run_ingest(name, path, products, batch, readers, save, read):
+    db_utils.DB_PATH = path
+    db_utils.init_db()
+    if save is legacy_save_crawled_products:
+        # init_db opens databases in WAL mode; the old layer used the default
+        # rollback journal with full fsyncs.
+        db_utils.close_connection()
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+
+    stop = threading.Event()
+    latencies = []
+    errors = []
+    threads = [
+        threading.Thread(target=reader_loop, args=(read, stop, latencies, errors))
+        for _ in range(readers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    start = time.perf_counter()
+    for crawl_id, offset in enumerate(range(0, len(products), batch), 1):
+        save(products[offset:offset + batch], crawl_id)
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+    db_utils.close_connection()
+
+    return {
+        "layer": name,
+        "products": len(products),
+        "batch": batch,
+        "seconds": elapsed,
+        "products_per_sec": len(products) / elapsed if elapsed else float("inf"),
+        "reads": len(latencies),
+        "read_errors": len(errors),
+        "read_p50_ms": percentile(latencies, 0.5) * 1000,
+        "read_p99_ms": percentile(latencies, 0.99) * 1000,
+        "read_mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+    }
+
+def run(product_count, batch, readers):
+    products = make_products(product_count)
+    original_path = db_utils.DB_PATH
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            return [
+                run_ingest(
+                    "legacy", os.path.join(directory, "legacy.db"), products, batch, readers,
+                    legacy_save_crawled_products, legacy_read,
+                ),
+                run_ingest(
+                    "pooled-wal", os.path.join(directory, "pooled.db"), products, batch, readers,
+                    db_utils.save_crawled_products, pooled_read,
+                ),
+            ]
+    finally:
+        db_utils.DB_PATH = original_path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare product ingest through the old and pooled DB layers")
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=100, help="products saved per call, i.e. per crawl job")
+    parser.add_argument("--readers", type=int, default=4, help="concurrent reader threads")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.products, max(1, args.batch), max(0, args.readers))
+    print(f"{'layer':<12}{'seconds':>9}{'products/s':>12}{'reads':>9}{'errors':>8}{'p50 ms':>9}{'p99 ms':>9}")
+    for row in results:
+        print(
+            f"{row['layer']:<12}{row['seconds']:>9.2f}{row['products_per_sec']:>12.0f}"
+            f"{row['reads']:>9}{row['read_errors']:>8}{row['read_p50_ms']:>9.2f}{row['read_p99_ms']:>9.2f}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+if __name__ == "__main__":
+    main()
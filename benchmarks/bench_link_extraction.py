@@ -0,0 +1,113 @@
+import argparse
+import random
+import time
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+from utils.data_utils import extract_domain
+from utils.link_extractor import extract_links
+
+# Run from the repository root:
+#   python -m benchmarks.bench_link_extraction [--url BASE_URL page.html ...]
+
+def legacy_extract_links(html, url):
+    # The BeautifulSoup implementation extract_links_from_page used before.
+    soup = BeautifulSoup(html, "html.parser")
+    links = []
+
+    for a_tag in soup.find_all("a", href=True):
+        href = a_tag.get("href")
+        if href and not href.startswith("javascript:") and not href.startswith("#"):
+            absolute_url = urljoin(url, href)
+            if extract_domain(absolute_url) == extract_domain(url):
+                links.append(absolute_url)
+
+    return links
+
+def build_category_page(anchors, seed=0):
+    rng = random.Random(seed)
+    parts = ["<html><head><title>Women | Shop</title></head><body><nav>"]
+    for index in range(40):
+        parts.append(f'<a class="nav-link" href="/collections/cat-{index}">Category {index}</a>')
+    parts.append('</nav><main><ul class="grid">')
+    for index in range(anchors):
+        kind = rng.random()
+        if kind < 0.6:
+            href = f"/products/item-{rng.randint(1, 50000)}?variant={rng.randint(1, 9)}&amp;utm_source=grid"
+        elif kind < 0.75:
+            href = f"https://www.example-shop.com/p/{rng.randint(1, 50000)}"
+        elif kind < 0.85:
+            href = f"https://cdn.tracker.example/{index}"
+        elif kind < 0.9:
+            href = "javascript:void(0)"
+        elif kind < 0.95:
+            href = f"#review-{index}"
+        else:
+            href = f"../collections/sale?page={rng.randint(1, 40)}"
+        parts.append(
+            f'<li class="card"><div class="img"><img src="/img/{index}.jpg" alt=""></div>'
+            f'<a class="card-link" data-pos="{index}" href="{href}">'
+            f'<span class="title">Product {index}</span><span class="price">Rs. {rng.randint(199, 4999)}</span></a></li>'
+        )
+    parts.append("</ul></main><footer>")
+    for index in range(30):
+        parts.append(f'<a href="/pages/info-{index}">Info {index}</a>')
+    parts.append("</footer></body></html>")
+    return "".join(parts)
+
+def time_call(func, html, url, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(html, url)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def run(pages, url, repeat):
+    results = []
+    for name, html in pages:
+        legacy_links = legacy_extract_links(html, url)
+        links = extract_links(html, url)
+        if set(legacy_links) != set(links):
+            raise AssertionError(f"{name}: extracted link sets differ")
+
+        legacy_seconds = time_call(legacy_extract_links, html, url, repeat)
+        seconds = time_call(extract_links, html, url, repeat)
+        results.append({
+            "page": name,
+            "bytes": len(html),
+            "links": len(links),
+            "legacy_ms": legacy_seconds * 1000,
+            "new_ms": seconds * 1000,
+            "speedup": legacy_seconds / seconds if seconds else float("inf"),
+        })
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare link extraction engines")
+    parser.add_argument("pages", nargs="*", help="recorded HTML pages to benchmark")
+    parser.add_argument("--url", default="https://www.example-shop.com/collections/women", help="base URL of the pages")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.pages:
+        pages = []
+        for path in args.pages:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                pages.append((path, f.read()))
+    else:
+        pages = [(f"synthetic-{anchors}", build_category_page(anchors)) for anchors in (200, 2000, 10000)]
+
+    results = run(pages, args.url, args.repeat)
+    print(f"{'page':<24}{'bytes':>10}{'links':>8}{'legacy ms':>12}{'new ms':>10}{'speedup':>9}")
+    for row in results:
+        print(
+            f"{row['page']:<24}{row['bytes']:>10}{row['links']:>8}"
+            f"{row['legacy_ms']:>12.2f}{row['new_ms']:>10.2f}{row['speedup']:>8.1f}x"
+        )
+    return results
+
+if __name__ == "__main__":
+    main()
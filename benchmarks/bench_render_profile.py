@@ -0,0 +1,104 @@
+import argparse
+import asyncio
+import json
+import time
+import weakref
+
+from benchmarks.fixture_site import ShopSite, serve_site
+from utils.fetcher import extract_links_from_page
+from utils.render_profile import RENDER_PROFILES
+from utils.scraper_utils import make_crawler
+
+# Run from the repository root (needs Chromium: playwright install chromium):
+#   python -m benchmarks.bench_render_profile [--pages 50] [--url https://shop.example/ ...]
+#
+# Renders the same pages once per render profile and reports the time per
+# page, the requests the browser made, the requests the links profile
+# blocked and the bytes downloaded. Without --url the pages come from the
+# synthetic fixture shop, whose pages load images, a web font, a stylesheet
+# and a third-party tracker.
+
+# Counts every finished request of a crawler's pages, around the
+# on_page_context_created hook the resource blocker uses.
+class TrafficMeter:
+    def __init__(self, crawler):
+        self.strategy = crawler.crawler_strategy
+        self.hook = self.strategy.hooks.get("on_page_context_created")
+        self.strategy.set_hook("on_page_context_created", self.on_page_context_created)
+        self.pages = weakref.WeakSet()
+        self.requests = 0
+        self.bytes = 0
+
+    async def on_page_context_created(self, page, **kwargs):
+        if self.hook is not None:
+            page = await self.hook(page, **kwargs)
+        if page not in self.pages:
+            self.pages.add(page)
+            page.on("requestfinished", self.finished)
+        return page
+
+    async def finished(self, request):
+        self.requests += 1
+        try:
+            sizes = await request.sizes()
+        except Exception:
+            return
+        self.bytes += sizes["responseBodySize"] + sizes["responseHeadersSize"]
+
+    @property
+    def blocked_requests(self):
+        # The wrapped hook is the ResourceBlocker's bound method.
+        return getattr(getattr(self.hook, "__self__", None), "blocked_requests", 0)
+
+async def render_all(urls, profile):
+    crawler = make_crawler(profile)
+    meter = TrafficMeter(crawler)
+    async with crawler:
+        latencies = []
+        links = 0
+        for url in urls:
+            start = time.perf_counter()
+            links += len(await extract_links_from_page(crawler, url, "render_profile_benchmark", render_profile=profile) or [])
+            latencies.append(time.perf_counter() - start)
+    return {
+        "profile": profile,
+        "pages": len(urls),
+        "links": links,
+        "seconds": sum(latencies),
+        "ms_per_page": sum(latencies) * 1000 / len(urls),
+        "p50_ms": sorted(latencies)[len(latencies) // 2] * 1000,
+        "requests": meter.requests,
+        "blocked_requests": meter.blocked_requests,
+        "kb_per_page": meter.bytes / 1024 / len(urls),
+    }
+
+def run(urls, profiles):
+    return [asyncio.run(render_all(urls, profile)) for profile in profiles]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare bandwidth and render time of the render profiles")
+    parser.add_argument("--url", action="append", help="page to render (repeatable); defaults to the fixture shop")
+    parser.add_argument("--pages", type=int, default=50, help="fixture pages to render")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        results = run(args.url, RENDER_PROFILES)
+    else:
+        site = ShopSite(pages=max(1, args.pages))
+        with serve_site(site) as base_url:
+            results = run([base_url + site.path(index) for index in range(site.pages)], RENDER_PROFILES)
+
+    print(f"{'profile':<8}{'pages':>7}{'links':>8}{'ms/page':>10}{'p50 ms':>9}{'requests':>10}{'blocked':>9}{'KB/page':>10}")
+    for row in results:
+        print(
+            f"{row['profile']:<8}{row['pages']:>7}{row['links']:>8}{row['ms_per_page']:>10.1f}{row['p50_ms']:>9.1f}"
+            f"{row['requests']:>10}{row['blocked_requests']:>9}{row['kb_per_page']:>10.1f}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+if __name__ == "__main__":
+    main()
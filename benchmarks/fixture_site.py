@@ -0,0 +1,367 @@
+import argparse
+import json
+import multiprocessing
+import random
+import re
+import time
+import zlib
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode
+
+# Run from the repository root to browse or crawl the site by hand:
+#   python -m benchmarks.fixture_site [--pages 1000] [--port 8080]
+#
+# A synthetic shop generated on the fly from a seed, so every run of a
+# benchmark sees the same pages without any files on disk. Page 0 is the home
+# page; page n links to its children n*b+1 .. n*b+b (b = fanout // 2), which
+# makes every page reachable, plus random cross-links, navigation and the
+# usual noise (external, javascript: and fragment links, tracking parameters).
+# Product pages live under /products/, listings under /collections/. With
+# blog_pages every page also has a footer linking to a sign-in page, an about
+# page and a blog whose posts link on to further posts, the kind of pages a
+# crawl can spend its budget on without finding any products. With facets
+# every listing also links to sort, colour, size and price filters and a next
+# page of itself: an endless space of variants showing the same products.
+#
+# Pages also pull in what a real shop page does, so browser renders have
+# something to download: product images, a stylesheet with a web font and
+# a tracker script from a third-party host (the same server under its other
+# name, localhost vs 127.0.0.1). Pages carry an ETag and answer a matching
+# If-None-Match with 304, like a shop behind a CDN.
+
+PRODUCT_PATTERN = "/products/"
+
+# Footer pages that are neither products nor listings
+INFO_PAGES = {
+    "/account/login": "Sign in",
+    "/pages/about": "About us",
+}
+
+# Facet parameters of listing pages and their values; price_max takes any
+# multiple of 10, so its variants never run out
+FACETS = {
+    "sort": ["featured", "price-asc", "price-desc", "newest"],
+    "color": ["black", "white", "red", "blue", "green", "beige"],
+    "size": ["xs", "s", "m", "l", "xl"],
+}
+
+# Static assets as (content type, size in bytes)
+ASSETS = {
+    "/static/site.css": ("text/css", None),
+    "/static/font.woff2": ("font/woff2", 48 * 1024),
+    "/tracker.js": ("application/javascript", 16 * 1024),
+}
+IMAGE_BYTES = 24 * 1024
+
+SITE_CSS = (
+    "@font-face{font-family:Shop;src:url(/static/font.woff2) format('woff2')}"
+    "body{font-family:Shop,sans-serif}.grid{display:grid;grid-template-columns:repeat(4,1fr)}"
+)
+
+class ShopSite:
+    def __init__(
+        self,
+        pages=1000,
+        fanout=20,
+        product_ratio=0.5,
+        js_ratio=0.0,
+        slow_ratio=0.0,
+        slow_delay=0.5,
+        seed=0,
+        blog_pages=0,
+        facets=False,
+        broken_pages=(),
+        throttled_pages=(),
+    ):
+        self.pages = max(1, pages)
+        self.fanout = max(2, fanout)
+        self.branching = max(1, self.fanout // 2)
+        self.product_ratio = product_ratio
+        self.js_ratio = js_ratio
+        self.slow_ratio = slow_ratio
+        self.slow_delay = slow_delay
+        self.seed = seed
+        self.blog_pages = max(0, blog_pages)
+        self.facets = facets
+        # Indexes of pages that answer 500, a backend having a bad moment
+        self.broken_pages = frozenset(broken_pages)
+        # Indexes of pages that answer 429, a shop rate limiting the crawler
+        self.throttled_pages = frozenset(throttled_pages)
+
+    def params(self):
+        return {
+            "pages": self.pages,
+            "fanout": self.fanout,
+            "product_ratio": self.product_ratio,
+            "js_ratio": self.js_ratio,
+            "slow_ratio": self.slow_ratio,
+            "slow_delay": self.slow_delay,
+            "seed": self.seed,
+            "blog_pages": self.blog_pages,
+            "facets": self.facets,
+            "broken_pages": sorted(self.broken_pages),
+            "throttled_pages": sorted(self.throttled_pages),
+        }
+
+    def _rng(self, index):
+        return random.Random(self.seed * 1_000_003 + index)
+
+    def traits(self, index):
+        # (is_product, js_only, slow) of a page; the home page is always a
+        # static listing so every crawl gets started.
+        if index == 0:
+            return False, False, False
+        rng = self._rng(index)
+        return rng.random() < self.product_ratio, rng.random() < self.js_ratio, rng.random() < self.slow_ratio
+
+    def path(self, index):
+        if index == 0:
+            return "/"
+        if self.traits(index)[0]:
+            return f"/products/item-{index}"
+        return f"/collections/c-{index}"
+
+    def index_of(self, path):
+        found = re.fullmatch(r"/(?:products/item|collections/c)-(\d+)/?", path)
+        if path == "/":
+            return 0
+        if found is None:
+            return None
+        index = int(found.group(1))
+        if index >= self.pages or self.path(index) != path.rstrip("/"):
+            return None
+        return index
+
+    def product_count(self):
+        return sum(1 for index in range(1, self.pages) if self.traits(index)[0])
+
+    def links(self, index):
+        # Site-relative hrefs of a page, noise included.
+        rng = self._rng(index)
+        rng.random(), rng.random(), rng.random()
+        hrefs = [self.path(child) for child in range(index * self.branching + 1, min(self.pages, (index + 1) * self.branching + 1))]
+        for _ in range(self.fanout - len(hrefs)):
+            target = self.path(rng.randrange(self.pages))
+            hrefs.append(f"{target}?utm_source=related" if rng.random() < 0.2 else target)
+        hrefs.extend(self.path(nav) for nav in range(1, min(self.pages, 9)))
+        hrefs.extend(self.footer_links(index))
+        hrefs.extend([
+            f"https://cdn.tracker.example/pixel-{index}",
+            "javascript:void(0)",
+            f"#reviews-{index}",
+        ])
+        return hrefs
+
+    def footer_links(self, index):
+        if not self.blog_pages:
+            return []
+        return list(INFO_PAGES) + [self.blog_path(index % self.blog_pages)]
+
+    def facet_links(self, index, query=""):
+        # One link per facet to the listing with that facet moved on to its
+        # next value, plus the next page; all of them list the same products.
+        if not self.facets or self.traits(index)[0]:
+            return []
+        params = dict(parse_qsl(query))
+        path = self.path(index)
+        hrefs = []
+        for name, values in FACETS.items():
+            current = params.get(name)
+            value = values[(values.index(current) + 1) % len(values)] if current in values else values[0]
+            hrefs.append(path + "?" + urlencode(sorted({**params, name: value}.items())))
+        for name, step in (("price_max", 10), ("page", 1)):
+            current = params.get(name, "")
+            value = int(current) + step if current.isdigit() else step + (name == "page")
+            hrefs.append(path + "?" + urlencode(sorted({**params, name: str(value)}.items())))
+        return hrefs
+
+    def blog_path(self, post):
+        return f"/blogs/news/post-{post}"
+
+    def blog_index_of(self, path):
+        found = re.fullmatch(r"/blogs/news/post-(\d+)/?", path)
+        if found is None or int(found.group(1)) >= self.blog_pages:
+            return None
+        return int(found.group(1))
+
+    def label(self, href):
+        # Anchor text of a link, as a shop would word it.
+        path, _, query = href.partition("?")
+        if query and path.startswith("/collections/"):
+            return "Next page" if "page=" in query else "Refine"
+        if path in INFO_PAGES:
+            return INFO_PAGES[path]
+        if path.startswith("/blogs/"):
+            return "Read our blog"
+        if path.startswith("/products/"):
+            return f"Item {path.rsplit('-', 1)[1]}"
+        if path.startswith("/collections/"):
+            return f"Shop collection {path.rsplit('-', 1)[1]}"
+        return "Home" if path == "/" else "More"
+
+    def render_info(self, path):
+        # A blog post or footer page: navigation, more posts and the footer.
+        post = self.blog_index_of(path)
+        title = INFO_PAGES.get(path) or f"Blog post {post}"
+        hrefs = [self.path(nav) for nav in range(1, min(self.pages, 9))]
+        if post is not None:
+            hrefs.extend(self.blog_path((post + step) % self.blog_pages) for step in range(1, 4))
+        hrefs.extend(self.footer_links(post or 0))
+        anchors = "".join(f'<li><a href="{href}">{self.label(href)}</a></li>' for href in hrefs)
+        return (
+            f"<!doctype html><html><head><title>{title}</title></head><body>"
+            f"<main><h1>{title}</h1><p>Nothing to buy here.</p><ul>{anchors}</ul></main></body></html>"
+        )
+
+    def render(self, index, third_party_origin=None, query=""):
+        is_product, js_only, _ = self.traits(index)
+        tracker = f'<script async src="{third_party_origin}/tracker.js"></script>' if third_party_origin else ""
+        title = f"Item {index}" if is_product else f"Collection {index}"
+        hrefs = self.links(index) + self.facet_links(index, query)
+        if js_only:
+            # An app shell: the links only exist once the script has run.
+            return (
+                f"<!doctype html><html><head><title>{title}</title>{tracker}</head><body>"
+                '<div id="root"></div>'
+                "<noscript>This shop requires JavaScript.</noscript>"
+                f"<script>const links = {json.dumps([[href, self.label(href)] for href in hrefs])};"
+                "document.getElementById('root').innerHTML = links.map("
+                "([href, text]) => `<a href=\"${href}\">${text}</a>`).join('');</script>"
+                "</body></html>"
+            )
+        anchors = "".join(
+            f'<li class="card"><img src="/img/{position}.jpg" alt="">'
+            f'<a class="card-link" href="{href}"><span class="title">{self.label(href)}</span>'
+            f'<span class="price">Rs. {199 + position * 7}</span></a></li>'
+            for position, href in enumerate(hrefs)
+        )
+        return (
+            f"<!doctype html><html><head><title>{title}</title>"
+            f'<link rel="stylesheet" href="/static/site.css">{tracker}</head><body>'
+            f'<header><a href="/">Home</a></header><main><h1>{title}</h1><ul class="grid">{anchors}</ul></main>'
+            "<footer><p>Synthetic fixture shop</p></footer></body></html>"
+        )
+
+    def sitemap(self):
+        entries = "".join(
+            f"<url><loc>{{origin}}{self.path(index)}</loc></url>"
+            for index in range(self.pages)
+        )
+        return f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>'
+
+def make_handler(site):
+    sitemap_template = site.sitemap()
+
+    class FixtureHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            path, _, query = self.path.split("#", 1)[0].partition("?")
+            host = self.headers.get("Host", "localhost")
+            origin = f"http://{host}"
+            if path == "/robots.txt":
+                return self._send(200, "text/plain", f"User-agent: *\nAllow: /\nSitemap: {origin}/sitemap.xml\n")
+            if path == "/sitemap.xml":
+                return self._send(200, "application/xml", sitemap_template.replace("{origin}", origin))
+            if path in ASSETS:
+                content_type, size = ASSETS[path]
+                return self._send(200, content_type, SITE_CSS if size is None else "x" * size)
+            if path.startswith("/img/"):
+                return self._send(200, "image/jpeg", "x" * IMAGE_BYTES)
+
+            index = site.index_of(path)
+            if index is None and (path in INFO_PAGES or site.blog_index_of(path) is not None):
+                return self._send_page(site.render_info(path))
+            if index is None:
+                return self._send(404, "text/html", "<html><body>Not found</body></html>")
+            if index in site.broken_pages:
+                return self._send(500, "text/html", "<html><body>Internal error</body></html>")
+            if index in site.throttled_pages:
+                return self._send(429, "text/html", "<html><body>Too many requests</body></html>", retry_after=1)
+            if site.traits(index)[2]:
+                time.sleep(site.slow_delay)
+            name, _, port = host.rpartition(":")
+            third_party = f"http://{'localhost' if name == '127.0.0.1' else '127.0.0.1'}:{port}"
+            self._send_page(site.render(index, third_party, query))
+
+        def _send_page(self, text):
+            etag = f'"{zlib.crc32(text.encode("utf-8")):08x}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self._send(200, "text/html; charset=utf-8", text, etag)
+
+        def _send(self, status, content_type, text, etag=None, retry_after=None):
+            body = text.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            if etag is not None:
+                self.send_header("ETag", etag)
+            if retry_after is not None:
+                self.send_header("Retry-After", str(retry_after))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FixtureHandler
+
+def make_server(site, host="127.0.0.1", port=0):
+    server = ThreadingHTTPServer((host, port), make_handler(site))
+    server.daemon_threads = True
+    return server
+
+def _serve(params, host, port, ready):
+    server = make_server(ShopSite(**params), host, port)
+    ready.send(server.server_address[1])
+    ready.close()
+    server.serve_forever()
+
+@contextmanager
+def serve_site(site, host="127.0.0.1", port=0):
+    # Serves the site from a separate process, so the server never competes
+    # with the code under test for the GIL. Yields the site's base URL.
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_serve, args=(site.params(), host, port, sender), daemon=True)
+    process.start()
+    try:
+        if not receiver.poll(30):
+            raise RuntimeError("fixture site did not start")
+        yield f"http://{host}:{receiver.recv()}"
+    finally:
+        process.terminate()
+        process.join()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a synthetic shop for crawl benchmarks")
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--fanout", type=int, default=20, help="content links per page")
+    parser.add_argument("--product-ratio", type=float, default=0.5, help="share of pages that are products")
+    parser.add_argument("--js-ratio", type=float, default=0.0, help="share of pages whose links need JavaScript")
+    parser.add_argument("--slow-ratio", type=float, default=0.0, help="share of pages answered slowly")
+    parser.add_argument("--slow-delay", type=float, default=0.5, help="seconds a slow page takes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--blog-pages", type=int, default=0, help="blog posts linked from every page's footer")
+    parser.add_argument("--facets", action="store_true", help="link listings to endless facet and page variants")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args(argv)
+
+    site = ShopSite(
+        args.pages, args.fanout, args.product_ratio, args.js_ratio, args.slow_ratio, args.slow_delay, args.seed,
+        args.blog_pages, args.facets,
+    )
+    server = make_server(site, args.host, args.port)
+    print(f"Serving {site.pages} pages ({site.product_count()} products) on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+# Run from the repository root:
+#   python -m benchmarks.load_test_api [--duration 10] [--concurrency 32]
+#
+# Starts api_server in a separate process on a temporary database (or targets
+# --url), seeds it with products and then drives a mix of listing, filtering,
+# product-saving and enqueueing requests, reporting p50/p99 latency per
+# request type and overall requests per second.
+
+SERVER_SCRIPT = """
+import sys
+import uvicorn
+from utils import db_utils
+db_utils.DB_PATH = sys.argv[1]
+import api_server
+uvicorn.run(api_server.app, host="127.0.0.1", port=int(sys.argv[2]), log_level="warning")
+"""
+
+DOMAINS = [f"shop-{index}.example.com" for index in range(10)]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(db_path, port):
+    process = subprocess.Popen([sys.executable, "-c", SERVER_SCRIPT, db_path, str(port)])
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except httpx.HTTPError:
+            if process.poll() is not None:
+                raise RuntimeError("api_server exited during startup")
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("api_server did not start")
+
+def make_products(rng, count):
+    products = []
+    for _ in range(count):
+        domain = rng.choice(DOMAINS)
+        item = rng.randint(1, 10_000_000)
+        products.append({
+            "url": f"https://{domain}/products/item-{item}",
+            "domain": domain,
+            "product_id": str(item),
+            "category": f"category-{item % 20}",
+        })
+    return products
+
+async def list_products(client, rng):
+    return await client.get("/api/products", params={"limit": 50})
+
+async def filter_products(client, rng):
+    return await client.get(
+        "/api/products",
+        params={"domain": rng.choice(DOMAINS), "fields": "url,product_id", "limit": 50},
+    )
+
+async def save_products(client, rng):
+    return await client.post(
+        "/api/save-products",
+        json={"crawl_id": rng.randint(1, 100), "products": make_products(rng, 20)},
+    )
+
+async def add_crawl(client, rng):
+    return await client.post(
+        "/api/crawl",
+        json={"url": f"https://{rng.choice(DOMAINS)}/collections/{rng.getrandbits(64):x}", "max_pages": 10},
+    )
+
+# Request type, function and relative weight of the traffic mix
+OPERATIONS = [
+    ("list", list_products, 50),
+    ("filter", filter_products, 20),
+    ("save", save_products, 20),
+    ("enqueue", add_crawl, 10),
+]
+
+async def run_client(client, rng, deadline, latencies, errors):
+    names = [name for name, _, _ in OPERATIONS]
+    weights = [weight for _, _, weight in OPERATIONS]
+    calls = {name: call for name, call, _ in OPERATIONS}
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            response = await calls[name](client, rng)
+            failed = response.status_code >= 400
+        except httpx.HTTPError:
+            failed = True
+        latencies[name].append(time.perf_counter() - start)
+        if failed:
+            errors[name] = errors.get(name, 0) + 1
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def summarize(name, values, errors, elapsed):
+    return {
+        "request": name,
+        "count": len(values),
+        "errors": errors,
+        "rps": len(values) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(values, 0.5) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+    }
+
+async def run(url, duration, concurrency, seed_products, seed=0):
+    rng = random.Random(seed)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        for offset in range(0, seed_products, 1000):
+            response = await client.post(
+                "/api/save-products",
+                json={"crawl_id": 0, "products": make_products(rng, min(1000, seed_products - offset))},
+            )
+            response.raise_for_status()
+
+        latencies = {name: [] for name, _, _ in OPERATIONS}
+        errors = {}
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*(
+            run_client(client, random.Random(seed + index + 1), deadline, latencies, errors)
+            for index in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+
+    results = [summarize(name, values, errors.get(name, 0), elapsed) for name, values in latencies.items()]
+    all_latencies = [value for values in latencies.values() for value in values]
+    results.append(summarize("total", all_latencies, sum(errors.values()), elapsed))
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the API with mixed read/write traffic")
+    parser.add_argument("--url", help="test a running server instead of starting one on a temporary database")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent clients")
+    parser.add_argument("--seed-products", type=int, default=20000, help="products saved before measuring")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    process = None
+    directory = None
+    url = args.url
+    if url is None:
+        directory = tempfile.TemporaryDirectory()
+        port = free_port()
+        process = start_server(os.path.join(directory.name, "load_test.db"), port)
+        url = f"http://127.0.0.1:{port}"
+
+    try:
+        results = asyncio.run(run(url, args.duration, max(1, args.concurrency), max(0, args.seed_products)))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+            directory.cleanup()
+
+    print(f"{'request':<10}{'count':>8}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for row in results:
+        print(
+            f"{row['request']:<10}{row['count']:>8}{row['errors']:>8}"
+            f"{row['rps']:>10.1f}{row['p50_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from benchmarks.bench_db_ingest import make_products
+from benchmarks.bench_link_extraction import build_category_page
+from benchmarks.fixture_site import PRODUCT_PATTERN, ShopSite, serve_site
+from utils import db_utils, scraper_utils
+from config import CRAWL_ORDER, MAX_DEPTH, RENDER_PROFILE, TRAP_DETECTION
+from utils.classifier import ProductClassifier
+from utils.frontier import CRAWL_ORDERS, MemoryFrontier
+from utils.link_extractor import extract_links
+from utils.product_sink import DatabaseProductSink, ProductList
+from utils.rate_limiter import RateLimiter
+from utils.render_profile import RENDER_PROFILES
+from utils.trap_detector import TrapDetector
+from utils.url_utils import canonicalize_url
+
+# Run from the repository root:
+#   python -m benchmarks.suite [--json results.json] [--compare baseline.json]
+#
+# Runs the whole crawl pipeline against a synthetic shop served locally
+# (benchmarks/fixture_site.py) plus micro-benchmarks of link extraction,
+# product classification and database ingest, all offline and on temporary
+# databases. --json writes the results with the commit they were measured
+# on; --compare prints the change of every metric against an earlier file.
+
+BENCHMARKS = ("crawl", "link_extraction", "classifier", "db_ingest")
+
+# Metrics where a smaller value is an improvement. Rates (*_per_sec) and
+# HIGHER_IS_BETTER improve as they grow; everything else describes the
+# workload and is only reported.
+LOWER_IS_BETTER = {"seconds", "cpu_seconds", "cpu_ms_per_page", "us_per_url", "ms_per_page"}
+HIGHER_IS_BETTER = {"products_per_page"}
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def best_of(func, repeat):
+    # Best wall-clock time of repeat calls, the usual way to cut scheduler noise.
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+@contextmanager
+def temporary_database():
+    original_path = db_utils.DB_PATH
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            db_utils.DB_PATH = os.path.join(directory, "benchmark.db")
+            db_utils.init_db()
+            yield
+            db_utils.close_connection()
+    finally:
+        db_utils.DB_PATH = original_path
+
+async def _crawl(base_url, args, use_browser):
+    crawler = scraper_utils.make_crawler(args.render_profile)
+    if use_browser:
+        await crawler.start()
+    # Without a browser every page is taken from the plain HTTP fetch;
+    # JavaScript-only pages then contribute no links.
+    overrides = {} if use_browser else {base_url: "http"}
+    # Measures the crawler, not the politeness limits (unless asked to).
+    rate_limiter = RateLimiter(initial_rate=args.max_rate, max_rate=args.max_rate)
+    try:
+        async with scraper_utils.TieredFetcher(
+            crawler, mode_overrides=overrides, render_profile=args.render_profile, rate_limiter=rate_limiter
+        ) as fetcher:
+            frontier = MemoryFrontier(scraper_utils.make_seen_store(), args.crawl_order)
+            trap_detector = TrapDetector() if args.trap_detection else None
+            # "database" streams products into the temporary database in
+            # batches, as service jobs do.
+            if args.product_sink == "database":
+                sink = DatabaseProductSink(db_utils.add_url_to_crawl(base_url, base_url))
+            else:
+                sink = ProductList()
+            cpu_start = time.process_time()
+            start = time.perf_counter()
+            await scraper_utils.crawl_domain_for_products(
+                crawler=crawler,
+                domain=base_url,
+                max_pages=args.budget or args.pages,
+                max_depth=args.max_depth,
+                session_id="benchmark",
+                seen_urls=frontier.seen_urls,
+                concurrency=args.concurrency,
+                fetcher=fetcher,
+                classifier=ProductClassifier([PRODUCT_PATTERN]),
+                frontier=frontier,
+                render_profile=args.render_profile,
+                rate_limiter=rate_limiter,
+                trap_detection=args.trap_detection,
+                trap_detector=trap_detector,
+                sink=sink,
+            )
+            elapsed = time.perf_counter() - start
+            cpu_seconds = time.process_time() - cpu_start
+            http_pages, browser_pages = fetcher.http_pages, fetcher.browser_pages
+    finally:
+        if use_browser:
+            await crawler.close()
+    skipped = dict(trap_detector.skipped) if trap_detector is not None else {}
+    return sink.count, frontier.pages_visited, elapsed, cpu_seconds, http_pages, browser_pages, skipped
+
+async def _browser_available():
+    crawler = scraper_utils.make_crawler()
+    try:
+        await crawler.start()
+    except Exception:
+        return False
+    await crawler.close()
+    return True
+
+def bench_crawl(args):
+    site = make_site(args)
+    use_browser = args.browser == "yes" or (args.browser == "auto" and asyncio.run(_browser_available()))
+    with temporary_database(), serve_site(site) as base_url:
+        products, pages, elapsed, cpu_seconds, http_pages, browser_pages, skipped = asyncio.run(
+            _crawl(base_url, args, use_browser)
+        )
+
+    # Pages at max_depth are visited without being fetched.
+    return {
+        "browser": use_browser,
+        "render_profile": args.render_profile,
+        "crawl_order": args.crawl_order,
+        "product_sink": args.product_sink,
+        "pages": pages,
+        "fetched_pages": http_pages + browser_pages,
+        "http_pages": http_pages,
+        "browser_pages": browser_pages,
+        "products": products,
+        "site_products": site.product_count(),
+        "products_per_page": products / pages if pages else 0.0,
+        "trap_detection": args.trap_detection,
+        "skipped_urls": sum(skipped.values()),
+        **{f"skipped_{reason}": count for reason, count in sorted(skipped.items())},
+        "seconds": elapsed,
+        "cpu_seconds": cpu_seconds,
+        "pages_per_sec": pages / elapsed if elapsed else 0.0,
+        "products_per_sec": products / elapsed if elapsed else 0.0,
+        "cpu_ms_per_page": cpu_seconds * 1000 / pages if pages else 0.0,
+    }
+
+def bench_link_extraction(args):
+    site = make_site(args)
+    base_url = "http://127.0.0.1:8080"
+    pages = [site.render(index) for index in range(min(site.pages, 200))]
+    pages.append(build_category_page(2000))
+    total_bytes = sum(len(html) for html in pages)
+
+    def run():
+        for html in pages:
+            extract_links(html, base_url)
+
+    cpu_start = time.process_time()
+    seconds = best_of(run, args.repeat)
+    cpu_seconds = (time.process_time() - cpu_start) / args.repeat
+    return {
+        "pages": len(pages),
+        "bytes": total_bytes,
+        "seconds": seconds,
+        "cpu_seconds": cpu_seconds,
+        "pages_per_sec": len(pages) / seconds if seconds else 0.0,
+        "mb_per_sec": total_bytes / seconds / 1e6 if seconds else 0.0,
+        "ms_per_page": seconds * 1000 / len(pages),
+    }
+
+def bench_classifier(args):
+    site = make_site(args)
+    base_url = "http://127.0.0.1:8080"
+    # Every link of a page is classified together, as the crawler does.
+    batches = [
+        [canonicalize_url(link) for link in extract_links(site.render(index), base_url)]
+        for index in range(min(site.pages, 500))
+    ]
+    urls = sum(len(batch) for batch in batches)
+    classifier = ProductClassifier()
+
+    def run():
+        for batch in batches:
+            classifier.classify_many(batch)
+
+    seconds = best_of(run, args.repeat)
+    return {
+        "urls": urls,
+        "seconds": seconds,
+        "urls_per_sec": urls / seconds if seconds else 0.0,
+        "us_per_url": seconds * 1e6 / urls if urls else 0.0,
+    }
+
+def bench_db_ingest(args):
+    products = make_products(args.products)
+    batch = 100
+    with temporary_database():
+        start = time.perf_counter()
+        for crawl_id, offset in enumerate(range(0, len(products), batch), 1):
+            db_utils.save_crawled_products(products[offset:offset + batch], crawl_id)
+        insert_seconds = time.perf_counter() - start
+        # A recrawl finds the same products again and upserts them.
+        start = time.perf_counter()
+        db_utils.save_crawled_products(products, 0)
+        upsert_seconds = time.perf_counter() - start
+    return {
+        "products": len(products),
+        "seconds": insert_seconds + upsert_seconds,
+        "insert_per_sec": len(products) / insert_seconds if insert_seconds else 0.0,
+        "upsert_per_sec": len(products) / upsert_seconds if upsert_seconds else 0.0,
+    }
+
+def make_site(args):
+    return ShopSite(
+        args.pages, args.fanout, args.product_ratio, args.js_ratio, args.slow_ratio, args.slow_delay, args.seed,
+        args.blog_pages, args.facets,
+    )
+
+def compare(results, baseline):
+    # Yields (benchmark, metric, old, new, percent change, improved), where
+    # improved is None for workload metrics.
+    for name, metrics in results["results"].items():
+        old_metrics = baseline.get("results", {}).get(name, {})
+        for metric, value in metrics.items():
+            old = old_metrics.get(metric)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            change = (value - old) / old * 100 if old else 0.0
+            if metric in LOWER_IS_BETTER:
+                improved = change < 0
+            elif metric.endswith("_per_sec") or metric in HIGHER_IS_BETTER:
+                improved = change > 0
+            else:
+                improved = None
+            yield name, metric, old, value, change, improved
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the offline crawler benchmark suite")
+    parser.add_argument("--only", help=f"comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--pages", type=int, default=500, help="pages of the synthetic shop")
+    parser.add_argument("--budget", type=int, help="pages the crawl may visit (default: --pages)")
+    parser.add_argument("--fanout", type=int, default=20, help="content links per page")
+    parser.add_argument("--product-ratio", type=float, default=0.5, help="share of pages that are products")
+    parser.add_argument("--js-ratio", type=float, default=0.0, help="share of pages whose links need JavaScript")
+    parser.add_argument("--slow-ratio", type=float, default=0.0, help="share of pages answered slowly")
+    parser.add_argument("--slow-delay", type=float, default=0.5, help="seconds a slow page takes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--blog-pages", type=int, default=0, help="blog posts linked from every page's footer")
+    parser.add_argument("--facets", action="store_true", help="link listings to endless facet and page variants")
+    parser.add_argument("--concurrency", type=int, default=4, help="crawl workers")
+    parser.add_argument("--max-depth", type=int, default=MAX_DEPTH)
+    parser.add_argument("--max-rate", type=float, default=10000.0, help="requests per second allowed to the fixture host")
+    parser.add_argument("--browser", choices=("auto", "yes", "no"), default="auto", help="render pages in Chromium")
+    parser.add_argument("--render-profile", choices=RENDER_PROFILES, default=RENDER_PROFILE)
+    parser.add_argument("--crawl-order", choices=CRAWL_ORDERS, default=CRAWL_ORDER)
+    parser.add_argument("--trap-detection", action=argparse.BooleanOptionalAction, default=TRAP_DETECTION)
+    parser.add_argument("--product-sink", choices=("memory", "database"), default="memory", help="where the crawl puts its products")
+    parser.add_argument("--products", type=int, default=50000, help="products for the ingest benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions of the micro-benchmarks")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results file of an earlier run to compare against")
+    args = parser.parse_args(argv)
+    args.repeat = max(1, args.repeat)
+
+    selected = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    functions = {
+        "crawl": bench_crawl,
+        "link_extraction": bench_link_extraction,
+        "classifier": bench_classifier,
+        "db_ingest": bench_db_ingest,
+    }
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "site": make_site(args).params(),
+            "argv": sys.argv[1:] if argv is None else list(argv),
+        },
+        "results": {},
+    }
+    for name in BENCHMARKS:
+        if name in selected:
+            results["results"][name] = functions[name](args)
+
+    for name, metrics in results["results"].items():
+        print(name)
+        for metric, value in metrics.items():
+            print(f"  {metric:<18}{value:>14.3f}" if isinstance(value, float) else f"  {metric:<18}{value!s:>14}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {baseline.get('meta', {}).get('commit') or args.compare}:")
+        if baseline.get("meta", {}).get("site") != results["meta"]["site"]:
+            print("  (the synthetic site differs between the runs)")
+        for name, metric, old, value, change, improved in compare(results, baseline):
+            marker = "" if improved is None or abs(change) < 5 else (" better" if improved else " WORSE")
+            print(f"  {name + '.' + metric:<36}{old:>14.3f}{value:>14.3f}{change:>+9.1f}%{marker}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+if __name__ == "__main__":
+    main()
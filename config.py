@@ -1,5 +1,8 @@
 # config.py
 
+import os
+import tempfile
+
 # List of e-commerce domains to crawl
 DOMAINS = [
     # "https://www.virgio.com",
@@ -10,7 +13,7 @@ DOMAINS = [
 
 # Common product URL patterns to identify product pages
 PRODUCT_URL_PATTERNS = [
-    "/collections/luna-blu-women-footwear/"
+    "/collections/luna-blu-women-footwear/",
     "/collections/all/",
     "/product/",
     "/item/",
@@ -22,11 +25,318 @@ PRODUCT_URL_PATTERNS = [
     "pdp"
 ]
 
+# Per-domain product URL patterns used instead of PRODUCT_URL_PATTERNS
+DOMAIN_PRODUCT_URL_PATTERNS = {
+    # "https://www.westside.com": ["/products/"],
+}
+
+# Regexes that capture the product id from a product URL (the leftmost match wins)
+PRODUCT_ID_PATTERNS = [
+    r"/p/([\w-]+)",
+    r"/product/([\w-]+)",
+    r"/products/([\w-]+)",
+    r"pid=([\w]+)",
+    r"product_id=([\w]+)",
+    r"id=([\w]+)",
+]
+
+# Order in which a crawl visits its frontier: "best_first" scores links by how likely they
+# lead to products, "depth_first" follows the most recently found link. Crawl requests can
+# choose their own.
+CRAWL_ORDER = "best_first"
+
+# URL fragments of listing pages (collections, categories, catalogs), visited early by best-first crawls
+LISTING_URL_PATTERNS = [
+    "/collections/",
+    "/collection/",
+    "/category/",
+    "/categories/",
+    "/catalog/",
+    "/department/",
+    "/c/",
+    "/sale",
+]
+
+# URL fragments of pages that rarely lead to products, visited last by best-first crawls
+LOW_VALUE_URL_PATTERNS = [
+    "/account",
+    "/login",
+    "/register",
+    "/cart",
+    "/checkout",
+    "/wishlist",
+    "/blog",
+    "/pages/",
+    "/policies/",
+    "/privacy",
+    "/terms",
+    "/help",
+    "/faq",
+    "/contact",
+    "/about",
+    "/careers",
+    "/store-locator",
+    "/cdn-cgi/",
+]
+
+# Anchor text words of links that promise products or listings
+PRODUCT_ANCHOR_WORDS = [
+    "shop",
+    "buy",
+    "sale",
+    "new in",
+    "collection",
+    "category",
+    "men",
+    "women",
+    "kids",
+    "view all",
+    "item",
+    "products",
+]
+
+# Anchor text words of links that rarely lead to products
+LOW_VALUE_ANCHOR_WORDS = [
+    "login",
+    "log in",
+    "sign in",
+    "account",
+    "cart",
+    "blog",
+    "privacy",
+    "terms",
+    "policy",
+    "help",
+    "faq",
+    "contact",
+    "about",
+    "careers",
+    "returns",
+    "shipping",
+    "track order",
+]
+
+# Skip crawler traps: endless facet and sort variants, looping paths, deep pagination and
+# listings whose links nearly repeat a page already expanded
+TRAP_DETECTION = True
+
+# Distinct values one query parameter may take on one path template (numbers in the path
+# ignored) before further values are skipped; product URLs are exempt
+TRAP_MAX_PARAM_VALUES = 100
+
+# Times one segment may appear in a URL path
+TRAP_MAX_SEGMENT_REPEATS = 2
+
+# Highest page number followed in paginated listings
+TRAP_MAX_PAGINATION = 50
+
+# Pages whose link-set SimHash fingerprints differ in at most this many of 64 bits are
+# near duplicates; the later one's links are not expanded
+TRAP_SIMHASH_DISTANCE = 3
+
+# Pages with fewer links than this (boilerplate left out) are never treated as near duplicates
+TRAP_MIN_FINGERPRINT_LINKS = 10
+
+# Links found on more than this share of a crawl's pages (menus, footers) are boilerplate and
+# left out of near-duplicate fingerprints
+TRAP_BOILERPLATE_SHARE = 0.5
+
 # Maximum number of pages to crawl per domain
 MAX_PAGES_PER_DOMAIN = 10
 
 # Maximum depth for crawling (how many links deep to follow)
 MAX_DEPTH = 10
 
-# Delay between requests in seconds (to be polite to servers)
-REQUEST_DELAY = 1
\ No newline at end of file
+# Requests per second a host starts at; its rate then adapts to how it responds
+RATE_LIMIT_INITIAL = 1.0
+
+# Lowest and highest requests per second per host (a robots.txt Crawl-delay lowers the highest)
+RATE_LIMIT_MIN = 0.1
+RATE_LIMIT_MAX = 10.0
+
+# Requests per second added after each quick, successful response
+RATE_LIMIT_INCREASE = 0.1
+
+# Factor the rate is multiplied by after an error or a 429/503 response
+RATE_LIMIT_DECREASE = 0.5
+
+# Responses slower than this multiple of a host's usual latency slow it down as well
+RATE_LIMIT_SLOW_FACTOR = 3
+
+# Hosts whose rate state is kept per process (least recently used ones are dropped)
+RATE_LIMIT_MAX_HOSTS = 10000
+
+# Number of concurrent page workers per domain crawl
+CRAWL_CONCURRENCY = 4
+
+# Crawl all DOMAINS at the same time on one shared browser instead of one after another
+PARALLEL_DOMAINS = True
+
+# Maximum number of browser pages rendering at once across all domains (in
+# crawler_service, across all jobs of a process)
+MAX_OPEN_PAGES = 8
+
+# Number of crawl jobs each crawler_service process runs at the same time
+SERVICE_WORKERS = 4
+
+# Number of crawler_service processes to start on this machine
+SERVICE_PROCESSES = 1
+
+# Chromium instances each crawler_service process keeps running and lends to its jobs
+BROWSER_POOL_SIZE = 1
+
+# Pages a pooled browser renders before it is replaced with a fresh one
+BROWSER_RECYCLE_PAGES = 500
+
+# Memory (RSS of all its processes, in MB) above which a pooled browser is replaced
+BROWSER_RECYCLE_MEMORY_MB = 1500
+
+# Seconds a claimed job stays leased to its worker without a heartbeat
+JOB_LEASE_SECONDS = 120
+
+# Directory of the Unix sockets the API uses to wake idle service workers
+JOB_NOTIFY_DIR = os.path.join(tempfile.gettempdir(), "crawler_dispatch")
+
+# Seconds between queue polls while job notifications are available (a fallback
+# for missed notifications); without them workers poll every 10 seconds
+JOB_POLL_FALLBACK_SECONDS = 60
+
+# Try a plain HTTP fetch of each page before rendering it in the browser
+HTTP_FAST_PATH = True
+
+# Pages whose raw HTML has fewer same-domain links than this are rendered in the browser
+MIN_STATIC_LINKS = 5
+
+# Per-domain fetch overrides: "http" never renders, "browser" always renders
+FETCH_MODE_OVERRIDES = {
+    # "https://www.tatacliq.com": "browser",
+}
+
+# Browser render profile: "full" loads every resource, "links" blocks images, media,
+# fonts, stylesheets and trackers and returns once the DOM is ready.
+# Crawl requests can choose their own.
+RENDER_PROFILE = "links"
+
+# Seconds a "links" render may take before the page is given up
+RENDER_PAGE_TIMEOUT = 30
+
+# Playwright resource types the "links" profile never downloads
+BLOCKED_RESOURCE_TYPES = ["image", "media", "font", "stylesheet", "texttrack", "manifest"]
+
+# Analytics and ad hosts (subdomains included) the "links" profile never loads; other
+# third-party scripts load, since shops often serve their app from a CDN
+TRACKER_HOSTS = [
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googleadservices.com",
+    "googlesyndication.com",
+    "doubleclick.net",
+    "facebook.net",
+    "analytics.tiktok.com",
+    "bat.bing.com",
+    "clarity.ms",
+    "hotjar.com",
+    "segment.com",
+    "segment.io",
+    "mixpanel.com",
+    "amplitude.com",
+    "criteo.com",
+    "criteo.net",
+    "taboola.com",
+    "outbrain.com",
+    "klaviyo.com",
+    "newrelic.com",
+    "nr-data.net",
+]
+
+# Timeout in seconds for plain HTTP fetches
+HTTP_TIMEOUT = 15
+
+# Maximum number of pooled HTTP connections
+HTTP_MAX_CONNECTIONS = 100
+
+# User agent sent with plain HTTP fetches
+HTTP_USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+
+# Tracking and session id query parameters dropped when canonicalizing URLs (any "utm_*"
+# parameter and ";jsessionid=" path parameter is dropped too)
+TRACKING_PARAMS = [
+    "gclid",
+    "gclsrc",
+    "dclid",
+    "fbclid",
+    "msclkid",
+    "yclid",
+    "mc_cid",
+    "mc_eid",
+    "_ga",
+    "_gl",
+    "ref",
+    "ref_src",
+    "sid",
+    "sessionid",
+    "session_id",
+    "phpsessid",
+    "jsessionid",
+]
+
+# Seen-URL store: "set" (exact strings), "fingerprint" (64-bit hashes) or "bloom" (fixed memory)
+SEEN_STORE = "set"
+
+# Expected number of URLs per crawl, used to size the bloom seen-URL store
+SEEN_STORE_CAPACITY = 1000000
+
+# Target false-positive rate of the bloom seen-URL store
+SEEN_STORE_ERROR_RATE = 0.001
+
+# How product URLs are discovered: "crawl" follows links, "sitemap" reads robots.txt
+# and sitemaps (crawling only when a site has none), "hybrid" reads sitemaps and then
+# crawls for products they missed
+DISCOVERY_MODE = "crawl"
+
+# Maximum number of sitemap files read per domain (including nested sitemap indexes)
+MAX_SITEMAPS = 1000
+
+# Maximum number of URLs read from a domain's sitemaps
+MAX_SITEMAP_URLS = 500000
+
+# Store service crawl frontiers in crawler.db so restarted jobs resume where they stopped
+PERSISTENT_FRONTIER = True
+
+# Completed pages between frontier checkpoints
+FRONTIER_CHECKPOINT_PAGES = 20
+
+# Seconds between frontier checkpoints
+FRONTIER_CHECKPOINT_SECONDS = 30
+
+# Frontier entries kept in memory; the rest (the oldest depth-first, the lowest scored
+# best-first) are read back from the database when needed
+FRONTIER_MEMORY_LIMIT = 10000
+
+# Products a service crawl buffers before writing them to crawled_products
+PRODUCT_SINK_BATCH_SIZE = 500
+
+# Seconds a service crawl keeps found products (and its progress) unsaved at most
+PRODUCT_SINK_FLUSH_SECONDS = 5
+
+# Recrawl with conditional requests and skip link expansion on unchanged pages
+INCREMENTAL_RECRAWL = True
+
+# Products returned per page by /api/products when no limit is given
+API_PAGE_SIZE = 100
+
+# Largest page /api/products returns; use format=ndjson to stream more
+API_MAX_PAGE_SIZE = 1000
+
+# Most URLs accepted by one /api/crawl/batch request
+MAX_CRAWL_BATCH = 100000
+
+# Log level of the crawler, service and API ("DEBUG" also logs every visited page)
+LOG_LEVEL = "INFO"
+
+# "text" for key=value lines, "json" for one JSON object per line
+LOG_FORMAT = "text"
+
+# Port of the crawler service's Prometheus /metrics endpoint (process N of
+# --processes uses METRICS_PORT + N); 0 disables it. The API serves /metrics itself.
+METRICS_PORT = 9100
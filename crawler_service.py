@@ -1,76 +1,233 @@
+import argparse
 import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import socket
 import time
 import sys
-import os
-from datetime import datetime
 
-from utils.db_utils import init_db, get_pending_urls, update_url_status, save_crawled_products
-from utils.scraper_utils import AsyncWebCrawler, get_browser_config, crawl_domain_for_products
-from models.product import Product
+from utils.db_utils import (
+    init_db,
+    claim_next_url,
+    renew_lease,
+    requeue_expired_urls,
+    update_url_status,
+)
+from utils.browser_pool import BrowserPool
+from utils.scraper_utils import crawl_domain_for_products
+from utils.classifier import get_classifier
+from utils.fetcher import TieredFetcher
+from utils.frontier import PersistentFrontier
+from utils.job_notify import JobListener, notify_workers
+from utils.log_utils import setup_logging
+from utils.metrics import REGISTRY, collect_queue_depth, count_error, start_metrics_server
+from utils.product_sink import DatabaseProductSink
+from utils.seen_store import make_seen_store
+from config import (
+    CRAWL_CONCURRENCY,
+    CRAWL_ORDER,
+    DISCOVERY_MODE,
+    HTTP_FAST_PATH,
+    JOB_LEASE_SECONDS,
+    JOB_POLL_FALLBACK_SECONDS,
+    METRICS_PORT,
+    RENDER_PROFILE,
+    PERSISTENT_FRONTIER,
+    SERVICE_PROCESSES,
+    SERVICE_WORKERS,
+)
 
 init_db()
 
+logger = logging.getLogger(__name__)
+
 async def process_url(url_data):
     url_id = url_data['id']
     url = url_data['url']
     domain = url_data['domain']
     max_pages = url_data['max_pages']
     max_depth = url_data['max_depth']
+    concurrency = url_data.get('concurrency') or CRAWL_CONCURRENCY
+    product_patterns = url_data.get('product_patterns')
+    discovery = url_data.get('discovery') or DISCOVERY_MODE
+    render_profile = url_data.get('render_profile') or RENDER_PROFILE
+    crawl_order = url_data.get('crawl_order') or CRAWL_ORDER
     
-    print(f"Processing URL: {url} (ID: {url_id})")
-    
-    update_url_status(url_id, 'processing')
+    logger.info("Processing URL: %s (ID: %s)", url, url_id, extra={"crawl_id": url_id})
     
     try:
-        browser_config = get_browser_config()
         session_id = f"crawler_service_{url_id}_{int(time.time())}"
-        seen_urls = set()
+        seen_urls = make_seen_store()
+        # Products are saved in batches while the crawl runs, which also
+        # keeps the job's progress current for /api/crawl/{id}.
+        sink = DatabaseProductSink(url_id)
+        frontier = PersistentFrontier(url_id, seen_urls, crawl_order, sink=sink) if PERSISTENT_FRONTIER else None
         
-        async with AsyncWebCrawler(config=browser_config) as crawler:
-            products = await crawl_domain_for_products(
-                crawler=crawler,
-                domain=url,
-                max_pages=max_pages,
-                max_depth=max_depth,
-                session_id=session_id,
-                seen_urls=seen_urls,
-            )
+        async with browser_pool.lease() as crawler:
+            async with TieredFetcher(crawler, browser_pool.page_semaphore, render_profile=render_profile) as fetcher:
+                await crawl_domain_for_products(
+                    crawler=crawler,
+                    domain=url,
+                    max_pages=max_pages,
+                    max_depth=max_depth,
+                    session_id=session_id,
+                    seen_urls=seen_urls,
+                    concurrency=concurrency,
+                    page_semaphore=browser_pool.page_semaphore,
+                    fetcher=fetcher if HTTP_FAST_PATH else None,
+                    classifier=get_classifier(
+                        domain,
+                        json.loads(product_patterns) if product_patterns else None,
+                    ),
+                    discovery=discovery,
+                    frontier=frontier,
+                    crawl_id=url_id,
+                    render_profile=render_profile,
+                    crawl_order=crawl_order,
+                    sink=sink,
+                )
             
-            product_dicts = [product.dict() for product in products]
+            await asyncio.to_thread(update_url_status, url_id, 'completed')
             
-            save_crawled_products(product_dicts, url_id)
-            
-            update_url_status(url_id, 'completed')
-            
-            print(f"Completed processing URL: {url} (ID: {url_id}). Found {len(products)} products.")
-            print("products", products)
+            logger.info(
+                "Completed processing URL: %s (ID: %s). Found %d products.", url, url_id, sink.count,
+                extra={"crawl_id": url_id, "products": sink.count},
+            )
     except Exception as e:
-        print(f"Error processing URL: {url} (ID: {url_id}): {str(e)}")
-        update_url_status(url_id, 'failed')
+        logger.error("Error processing URL: %s (ID: %s): %s", url, url_id, str(e), extra={"crawl_id": url_id})
+        count_error("job_failed")
+        try:
+            await asyncio.to_thread(update_url_status, url_id, 'failed')
+        except Exception as status_error:
+            # The lease expires and the job is requeued.
+            count_error(status_error)
+            logger.error("Could not mark URL ID %s as failed: %s", url_id, str(status_error), extra={"crawl_id": url_id})
 
 CHECK_INTERVAL = 10
 
-async def run_crawler_service():
-    print(f"[{datetime.now()}] Starting crawler service loop...")
+# Lets newly queued jobs wake idle workers; see utils/job_notify.py.
+job_listener = None
+
+# Browsers shared by all jobs of this process; see utils/browser_pool.py.
+browser_pool = None
 
+async def keep_lease_alive(url_id, worker_id, job):
+    # Renew well before expiry so a slow page never lets a live job be
+    # requeued. A failed renewal is retried on the next beat; once the lease
+    # is lost the job belongs to whichever worker claims it next, so this
+    # copy is cancelled rather than left crawling the same frontier.
     while True:
-        print(f"[{datetime.now()}] Checking for pending URLs...")
-        pending_urls = get_pending_urls()
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        try:
+            renewed = await asyncio.to_thread(renew_lease, url_id, worker_id, JOB_LEASE_SECONDS)
+        except Exception as e:
+            count_error(e)
+            logger.warning("Could not renew the lease on URL ID %s: %s", url_id, str(e), extra={"crawl_id": url_id})
+            continue
+        if not renewed:
+            logger.warning("Worker %s lost the lease on URL ID %s; stopping the job.", worker_id, url_id, extra={"crawl_id": url_id})
+            count_error("lease_lost")
+            job.cancel()
+            return
 
-        if not pending_urls:
-            print(f"[{datetime.now()}] No pending URLs found. Sleeping for {CHECK_INTERVAL} seconds.")
-        else:
-            print(f"[{datetime.now()}] Found {len(pending_urls)} pending URLs to process.")
+async def run_worker(worker_id):
+    while True:
+        job_listener.clear()
+        try:
+            url_data = await asyncio.to_thread(claim_next_url, worker_id, JOB_LEASE_SECONDS)
+        except Exception as e:
+            count_error(e)
+            logger.error("Worker %s could not claim a job: %s", worker_id, str(e))
+            url_data = None
+
+        if url_data is None:
+            await job_listener.wait(JOB_POLL_FALLBACK_SECONDS if job_listener.active else CHECK_INTERVAL)
+            continue
+
+        job = asyncio.create_task(process_url(url_data))
+        heartbeat = asyncio.create_task(keep_lease_alive(url_data['id'], worker_id, job))
+        try:
+            # Waiting instead of awaiting job directly keeps a job cancelled
+            # by its heartbeat from cancelling this worker as well.
+            await asyncio.wait((job,))
+        finally:
+            heartbeat.cancel()
+            if not job.done():
+                job.cancel()
+                await asyncio.wait((job,))
+
+async def requeue_expired_jobs():
+    # Jobs whose worker died stop heartbeating; put them back in the queue.
+    while True:
+        try:
+            requeued = await asyncio.to_thread(requeue_expired_urls)
+        except Exception as e:
+            count_error(e)
+            logger.error("Could not requeue expired jobs: %s", str(e))
+            requeued = 0
+        if requeued:
+            logger.info("Requeued %d URLs with expired leases.", requeued)
+            notify_workers()
+        # Leases only expire after JOB_LEASE_SECONDS, so checking a few
+        # times per lease is enough.
+        await asyncio.sleep(JOB_LEASE_SECONDS / 4)
+
+async def run_crawler_service(workers=SERVICE_WORKERS, metrics_port=None):
+    global job_listener, browser_pool
+    worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+    logger.info("Starting crawler service with %d workers (%s)...", workers, worker_prefix)
+
+    metrics_server = None
+    if metrics_port:
+        REGISTRY.add_collector(collect_queue_depth)
+        try:
+            metrics_server = start_metrics_server(metrics_port)
+        except OSError as e:
+            logger.warning("Metrics endpoint unavailable on port %s: %s", metrics_port, str(e))
+
+    job_listener = JobListener()
+    job_listener.start()
+    browser_pool = await BrowserPool().start()
+    try:
+        await asyncio.gather(
+            requeue_expired_jobs(),
+            *(run_worker(f"{worker_prefix}:{index}") for index in range(workers)),
+        )
+    finally:
+        job_listener.close()
+        await browser_pool.close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
 
-            for url_data in pending_urls:
-                await process_url(url_data)
+def run_process(workers, metrics_port=None):
+    setup_logging()
+    asyncio.run(run_crawler_service(workers, metrics_port))
 
-            print(f"[{datetime.now()}] Finished processing current batch of URLs.")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crawl queued URLs from the database")
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS, help="concurrent jobs per process")
+    parser.add_argument("--processes", type=int, default=SERVICE_PROCESSES, help="worker processes to start")
+    parser.add_argument(
+        "--metrics-port", type=int, default=METRICS_PORT,
+        help="serve /metrics here (process N uses port + N); 0 disables",
+    )
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
 
-        await asyncio.sleep(CHECK_INTERVAL)
+    workers = max(1, args.workers)
+    if args.processes <= 1:
+        run_process(workers, args.metrics_port)
+        return
 
-def main():
-    asyncio.run(run_crawler_service())
+    processes = [
+        multiprocessing.Process(target=run_process, args=(workers, args.metrics_port and args.metrics_port + index))
+        for index in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
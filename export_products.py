@@ -0,0 +1,37 @@
+import argparse
+import sys
+
+from utils.db_utils import PRODUCT_FIELDS, init_db
+from utils.export import EXPORT_COMPRESSIONS, EXPORT_FORMATS, export_products
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export crawled products from the database")
+    parser.add_argument("output", help='file to write, e.g. products.csv.gz, or "-" for stdout')
+    parser.add_argument("--format", choices=EXPORT_FORMATS, help="defaults to the output file extension, else jsonl")
+    parser.add_argument("--compression", choices=EXPORT_COMPRESSIONS, help="defaults to the output file extension")
+    parser.add_argument("--fields", help=f"comma-separated subset of: {','.join(PRODUCT_FIELDS)}")
+    parser.add_argument("--domain", help="only products of this domain, e.g. https://www.example.com")
+    parser.add_argument("--category")
+    parser.add_argument("--crawl-id", type=int)
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    fields = tuple(field.strip() for field in args.fields.split(",") if field.strip()) if args.fields else PRODUCT_FIELDS
+
+    init_db()
+    try:
+        written = export_products(
+            args.output,
+            args.format,
+            args.compression,
+            fields,
+            domain=args.domain,
+            category=args.category,
+            crawl_id=args.crawl_id,
+        )
+    except (ValueError, RuntimeError) as e:
+        parser.error(str(e))
+    if args.output != "-":
+        print(f"Exported products to '{args.output}' ({written} bytes).")
+
+if __name__ == "__main__":
+    main()
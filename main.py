@@ -3,8 +3,21 @@ import os
 
 from dotenv import load_dotenv
 
-from config import DOMAINS, MAX_DEPTH, MAX_PAGES_PER_DOMAIN
+from config import (
+    CRAWL_CONCURRENCY,
+    CRAWL_ORDER,
+    DISCOVERY_MODE,
+    DOMAINS,
+    MAX_DEPTH,
+    MAX_OPEN_PAGES,
+    MAX_PAGES_PER_DOMAIN,
+    PARALLEL_DOMAINS,
+    RENDER_PROFILE,
+)
 from utils.data_utils import save_products_by_domain
+from utils.db_utils import init_db
+from utils.export import export_products
+from utils.log_utils import setup_logging
 from utils.scraper_utils import crawl_multiple_domains
 
 load_dotenv()
@@ -17,15 +30,32 @@ async def main():
         print(f"  - {domain}")
     print(f"Max pages per domain: {MAX_PAGES_PER_DOMAIN}")
     print(f"Max crawl depth: {MAX_DEPTH}")
+    print(f"Concurrent workers per domain: {CRAWL_CONCURRENCY}")
+    print(f"Discovery mode: {DISCOVERY_MODE}")
+    print(f"Render profile: {RENDER_PROFILE}")
+    print(f"Crawl order: {CRAWL_ORDER}")
+    if PARALLEL_DOMAINS:
+        print(f"Crawling domains in parallel (max {MAX_OPEN_PAGES} open pages)")
     print("\nStarting crawl...\n")
 
+    # Crawls read the page_state table, so the schema must be current first.
+    init_db()
     products_by_domain = await crawl_multiple_domains(
         domains=DOMAINS,
         max_pages_per_domain=MAX_PAGES_PER_DOMAIN,
         max_depth=MAX_DEPTH,
+        concurrency=CRAWL_CONCURRENCY,
+        parallel=PARALLEL_DOMAINS,
+        max_open_pages=MAX_OPEN_PAGES,
+        discovery=DISCOVERY_MODE,
+        render_profile=RENDER_PROFILE,
+        crawl_order=CRAWL_ORDER,
     )
 
     save_products_by_domain(products_by_domain)
+    # Streams every product in the database, so memory stays flat however
+    # large the catalog grows.
+    export_products(os.path.join("output", "all_products.jsonl"))
 
     print("\nCrawl completed!")
     print("================")
@@ -36,4 +66,5 @@ async def main():
     print("\nResults have been saved to the 'output' directory.")
 
 if __name__ == "__main__":
+    setup_logging()
     asyncio.run(main())
\ No newline at end of file
@@ -4,6 +4,30 @@ from typing import Optional
 
 class Product(BaseModel):
     url: str
-    domain: str 
+    domain: str
     product_id: Optional[str] = None
-    category: Optional[str] = None
\ No newline at end of file
+    category: Optional[str] = None
+
+
+# What crawls emit for each product URL they find. Crawls create one per
+# product page and sitemap entry, so it skips Product's validation and
+# keeps no per-instance __dict__.
+class ProductRecord:
+    __slots__ = ("url", "domain", "product_id", "category")
+
+    def __init__(self, url, domain, product_id=None, category=None):
+        self.url = url
+        self.domain = domain
+        self.product_id = product_id
+        self.category = category
+
+    def __repr__(self):
+        return f"ProductRecord(url={self.url!r}, domain={self.domain!r}, product_id={self.product_id!r}, category={self.category!r})"
+
+    def as_dict(self):
+        return {
+            "url": self.url,
+            "domain": self.domain,
+            "product_id": self.product_id,
+            "category": self.category,
+        }
@@ -0,0 +1,53 @@
+import pytest
+
+from benchmarks.fixture_site import PRODUCT_PATTERN, ShopSite, serve_site
+from utils import db_utils, scraper_utils
+from utils.classifier import ProductClassifier
+from utils.rate_limiter import RateLimiter
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    # Every test gets its own migrated database file.
+    monkeypatch.setattr(db_utils, "DB_PATH", str(tmp_path / "crawler.db"))
+    db_utils.init_db()
+    yield db_utils.DB_PATH
+    db_utils.close_connection()
+
+@pytest.fixture(scope="module")
+def shop():
+    site = ShopSite(pages=200)
+    with serve_site(site) as base_url:
+        yield site, base_url
+
+async def crawl(base_url, max_pages=1000, concurrency=4, fetched=None, max_depth=10, **kwargs):
+    # Crawls the fixture shop over plain HTTP with no rate limit. fetched, a
+    # list, collects every URL the fetcher was asked for.
+    crawler = scraper_utils.make_crawler()
+    rate_limiter = RateLimiter(initial_rate=10000, max_rate=10000)
+    async with scraper_utils.TieredFetcher(
+        crawler, mode_overrides={base_url: "http"}, rate_limiter=rate_limiter
+    ) as fetcher:
+        if fetched is not None:
+            fetch_page = fetcher.fetch_page
+
+            async def recording_fetch_page(url, *args, **kwargs):
+                fetched.append(url)
+                return await fetch_page(url, *args, **kwargs)
+            fetcher.fetch_page = recording_fetch_page
+        seen_urls = kwargs.pop("seen_urls", None)
+        frontier = kwargs.get("frontier")
+        if seen_urls is None:
+            seen_urls = frontier.seen_urls if frontier is not None else scraper_utils.make_seen_store()
+        return await scraper_utils.crawl_domain_for_products(
+            crawler=crawler,
+            domain=base_url,
+            max_pages=max_pages,
+            max_depth=max_depth,
+            session_id="test",
+            seen_urls=seen_urls,
+            concurrency=concurrency,
+            fetcher=fetcher,
+            classifier=ProductClassifier([PRODUCT_PATTERN]),
+            rate_limiter=rate_limiter,
+            **kwargs,
+        )
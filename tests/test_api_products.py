@@ -0,0 +1,82 @@
+import importlib
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from utils import db_utils
+
+# Three products share each timestamp, so pages of two always split a tie.
+PRODUCTS = [
+    (f"https://{shop}.test/products/{n}", f"https://{shop}.test", str(n), category, crawl_id, f"2025-05-0{n // 3 + 1} 09:00:00")
+    for shop, crawl_id in (("north", 1), ("south", 2))
+    for n, category in enumerate(["shoes", "bags"] * 6)
+]
+
+@pytest.fixture
+def api(database):
+    # api_server migrates DB_PATH when first imported, so the database
+    # fixture has to point it at the test's file before then.
+    api_server = importlib.import_module("api_server")
+    with db_utils.transaction() as cursor:
+        cursor.executemany(
+            "INSERT INTO crawled_products (url, domain, product_id, category, crawl_id, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            PRODUCTS,
+        )
+    with TestClient(api_server.app) as client:
+        yield api_server, client
+
+def newest_first(**filters):
+    rows = db_utils.get_connection().execute(
+        "SELECT id, created_at, url, domain, category, crawl_id FROM crawled_products ORDER BY created_at DESC, id DESC"
+    ).fetchall()
+    return [row["url"] for row in rows if all(row[column] == value for column, value in filters.items())]
+
+def read_pages(client, path, **params):
+    urls = []
+    cursor = None
+    while True:
+        response = client.get(path, params={**params, "cursor": cursor} if cursor else params)
+        assert response.status_code == 200
+        body = response.json()
+        assert len(body["products"]) <= params["limit"]
+        urls.extend(product["url"] for product in body["products"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return urls
+
+def test_cursor_round_trips(api):
+    api_server, _ = api
+    key = ("2025-05-01 09:00:00", 42)
+    assert api_server.decode_cursor(api_server.encode_cursor(key)) == key
+    # Only URL-safe characters, so the cursor needs no escaping in a query.
+    assert set(api_server.encode_cursor(key)) <= set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_=")
+
+@pytest.mark.parametrize("limit", [1, 2, 5])
+def test_pages_cover_ties_exactly_once(api, limit):
+    _, client = api
+    assert read_pages(client, "/api/products", limit=limit) == newest_first()
+
+def test_pages_keep_their_filters(api):
+    _, client = api
+    assert read_pages(client, "/api/products", limit=2, domain="https://south.test") == newest_first(domain="https://south.test")
+    assert read_pages(client, "/api/products", limit=2, category="bags", crawl_id=1) == newest_first(category="bags", crawl_id=1)
+    assert read_pages(client, "/api/products/2", limit=4) == newest_first(crawl_id=2)
+
+def test_stream_resumes_from_cursor(api):
+    _, client = api
+    first = client.get("/api/products", params={"limit": 4, "domain": "https://north.test"}).json()
+    response = client.get(
+        "/api/products",
+        params={"format": "ndjson", "domain": "https://north.test", "cursor": first["next_cursor"]},
+    )
+    rest = [json.loads(line)["url"] for line in response.text.splitlines()]
+    assert [product["url"] for product in first["products"]] + rest == newest_first(domain="https://north.test")
+
+@pytest.mark.parametrize("cursor", ["not base64!", "bm90IGpzb24", "WzFd", "WyJ4IiwgInkiXQ==", "NDI="])
+def test_invalid_cursor_is_rejected(api, cursor):
+    # Not base64, not JSON, [1], ["x", "y"] and 42.
+    _, client = api
+    response = client.get("/api/products", params={"cursor": cursor})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
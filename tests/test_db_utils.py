@@ -0,0 +1,53 @@
+import os
+import shutil
+import sqlite3
+
+from utils import db_utils
+
+BASELINE_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "crawler.db")
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def test_init_db_upgrades_baseline_database(tmp_path, monkeypatch):
+    # A copy of the database shipped before migrations existed, with a
+    # product crawled twice and once more behind a tracking parameter.
+    path = str(tmp_path / "crawler.db")
+    shutil.copy(BASELINE_DB, path)
+    conn = sqlite3.connect(path)
+    url = "https://www.virgio.com/products/veronicas-playful-cotton-checked-skirt"
+    conn.executemany(
+        "INSERT INTO crawled_products (url, domain, product_id, category, crawl_id, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (url, "https://www.virgio.com", "veronicas-playful-cotton-checked-skirt", "products", 18, "2025-04-16 09:00:00"),
+            (url + "?utm_source=mail", "https://www.virgio.com", "veronicas-playful-cotton-checked-skirt", "products", 18, "2025-04-17 09:00:00"),
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(db_utils, "DB_PATH", path)
+    try:
+        db_utils.init_db()
+        conn = db_utils.get_connection()
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(db_utils.MIGRATIONS)
+
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert {"crawl_frontier", "crawl_visited", "page_state", "product_changes"} <= tables
+        assert {"concurrency", "worker_id", "lease_expires_at", "render_profile", "crawl_order",
+                "skipped_urls", "pages_visited", "products_found"} <= columns(conn, "urls_to_crawl")
+        assert {"first_seen", "last_seen"} <= columns(conn, "crawled_products")
+        assert {"score", "fetch_url"} <= columns(conn, "crawl_frontier")
+
+        rows = [dict(row) for row in conn.execute("SELECT * FROM crawled_products")]
+        assert len(rows) == 1
+        assert rows[0]["url"] == url
+        assert rows[0]["product_id"] == "veronicas-playful-cotton-checked-skirt"
+        assert (rows[0]["first_seen"], rows[0]["last_seen"]) == ("2025-04-15 21:31:40", "2025-04-17 09:00:00")
+        assert db_utils.get_crawl_status(18)["status"] == "completed"
+
+        # Running it again changes nothing.
+        db_utils.init_db()
+        assert conn.execute("SELECT COUNT(*) FROM crawled_products").fetchone()[0] == 1
+    finally:
+        db_utils.close_connection()
@@ -0,0 +1,137 @@
+import asyncio
+import gzip
+
+import httpx
+import pytest
+
+from utils.rate_limiter import RateLimiter
+from utils.scraper_utils import fetch_robots, iter_sitemap_urls, parse_robots
+
+ROBOTS_URL = "https://shop.test/robots.txt"
+
+def urlset(*urls):
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        + "".join(f"<url><loc>{url}</loc><lastmod>2025-05-01</lastmod></url>" for url in urls)
+        + "</urlset>"
+    ).encode()
+
+def sitemapindex(*urls):
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        + "".join(f"<sitemap>\n  <loc> {url} </loc>\n</sitemap>" for url in urls)
+        + "</sitemapindex>"
+    ).encode()
+
+async def chunks(body, size=64):
+    # Small chunks make the parser and the inflater resume mid-element.
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+def client_for(files, requested):
+    def handler(request):
+        url = str(request.url)
+        requested.append(url)
+        if url not in files:
+            return httpx.Response(404)
+        return httpx.Response(200, content=chunks(files[url]))
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+def read_sitemaps(files, sitemap_urls, **kwargs):
+    requested = []
+
+    async def run():
+        async with client_for(files, requested) as client:
+            rate_limiter = RateLimiter(initial_rate=10000, max_rate=10000)
+            return [url async for url in iter_sitemap_urls(client, sitemap_urls, rate_limiter=rate_limiter, **kwargs)]
+
+    return asyncio.run(run()), requested
+
+def test_crawl_delay_comes_from_the_wildcard_group():
+    sitemaps, crawl_delay = parse_robots(
+        "User-agent: Googlebot\n"
+        "Crawl-delay: 10\n"
+        "Disallow: /private\n"
+        "\n"
+        "# Shared by both agents\n"
+        "User-agent: bingbot\n"
+        "USER-AGENT: *  # everyone else\n"
+        "Crawl-delay: 2.5\n"
+        "Disallow: /cart\n"
+        "\n"
+        "Sitemap: /sitemap_index.xml\n"
+        "Sitemap: https://cdn.shop.test/sitemap.xml.gz\n",
+        ROBOTS_URL,
+    )
+    assert crawl_delay == 2.5
+    assert sitemaps == ["https://shop.test/sitemap_index.xml", "https://cdn.shop.test/sitemap.xml.gz"]
+
+@pytest.mark.parametrize("text", [
+    # A User-agent line after rules starts a new group.
+    "User-agent: *\nDisallow: /cart\nUser-agent: slowbot\nCrawl-delay: 30\n",
+    "User-agent: slowbot\nCrawl-delay: 30\n",
+    "User-agent: *\nCrawl-delay: soon\n",
+    "",
+])
+def test_crawl_delay_of_other_groups_is_ignored(text):
+    assert parse_robots(text, ROBOTS_URL) == ([], None)
+
+def test_missing_robots_falls_back_to_default_sitemaps():
+    async def run():
+        async with client_for({}, []) as client:
+            return await fetch_robots(client, "https://shop.test")
+
+    assert asyncio.run(run()) == (["https://shop.test/sitemap.xml", "https://shop.test/sitemap_index.xml"], None)
+
+def test_sitemap_indexes_are_followed_into_gzipped_children():
+    files = {
+        "https://shop.test/sitemap_index.xml": sitemapindex(
+            "https://shop.test/sitemaps/products.xml.gz",
+            "https://shop.test/sitemaps/nested.xml",
+            "https://shop.test/sitemaps/missing.xml",
+        ),
+        "https://shop.test/sitemaps/products.xml.gz": gzip.compress(
+            urlset(*(f"https://shop.test/products/{n}" for n in range(50)))
+        ),
+        # Lists a sitemap already read, which is not read twice.
+        "https://shop.test/sitemaps/nested.xml": sitemapindex(
+            "https://shop.test/sitemaps/pages.xml",
+            "https://shop.test/sitemaps/products.xml.gz",
+        ),
+        "https://shop.test/sitemaps/pages.xml": urlset("https://shop.test/about", "https://shop.test/contact"),
+    }
+    urls, requested = read_sitemaps(files, ["https://shop.test/sitemap_index.xml"])
+
+    assert urls == [f"https://shop.test/products/{n}" for n in range(50)] + ["https://shop.test/about", "https://shop.test/contact"]
+    assert requested == [
+        "https://shop.test/sitemap_index.xml",
+        "https://shop.test/sitemaps/products.xml.gz",
+        "https://shop.test/sitemaps/nested.xml",
+        "https://shop.test/sitemaps/missing.xml",
+        "https://shop.test/sitemaps/pages.xml",
+    ]
+
+@pytest.mark.parametrize("broken", [
+    b"\x1f\x8b" + b"\x00" * 60,
+    b"<urlset><url><loc>https://shop.test/products/1</loc></url></sitemapindex>",
+])
+def test_broken_sitemap_does_not_stop_the_others(broken):
+    files = {
+        "https://shop.test/broken.xml": broken,
+        "https://shop.test/sitemap.xml": urlset("https://shop.test/products/2"),
+    }
+    urls, _ = read_sitemaps(files, ["https://shop.test/broken.xml", "https://shop.test/sitemap.xml"])
+    assert urls[-1] == "https://shop.test/products/2"
+
+def test_sitemap_limits():
+    files = {
+        "https://shop.test/sitemap_index.xml": sitemapindex(*(f"https://shop.test/sitemap-{n}.xml" for n in range(5))),
+        **{f"https://shop.test/sitemap-{n}.xml": urlset(*(f"https://shop.test/{n}/{i}" for i in range(10))) for n in range(5)},
+    }
+    urls, _ = read_sitemaps(files, ["https://shop.test/sitemap_index.xml"], max_urls=25)
+    assert len(urls) == 25
+
+    urls, requested = read_sitemaps(files, ["https://shop.test/sitemap_index.xml"], max_sitemaps=3)
+    assert len(urls) == 20 and len(requested) == 3
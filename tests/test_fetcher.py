@@ -0,0 +1,98 @@
+import asyncio
+import json
+import re
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from benchmarks.fixture_site import ShopSite, serve_site
+from utils.fetcher import TieredFetcher
+from utils.rate_limiter import RateLimiter
+
+# Stands in for the crawl4ai crawler where no Chromium is installed: it
+# "runs" the fixture shop's app-shell script by reading the links it would
+# have written into the page.
+class ScriptRunningCrawler:
+    def __init__(self):
+        self.rendered = []
+
+    async def arun(self, url, config=None):
+        self.rendered.append(url)
+        async with httpx.AsyncClient() as client:
+            response = await client.get(url)
+        found = re.search(r"const links = (\[.*?\]);", response.text)
+        links = json.loads(found.group(1)) if found else []
+        html = response.text + "".join(f'<a href="{href}">{text}</a>' for href, text in links)
+        return SimpleNamespace(
+            success=True, status_code=response.status_code, response_headers=dict(response.headers),
+            cleaned_html=html, error_message=None,
+        )
+
+@pytest.fixture(scope="module")
+def js_shop():
+    site = ShopSite(pages=50, js_ratio=1.0)
+    with serve_site(site) as base_url:
+        yield site, base_url
+
+def fetch(crawler, *requests, rate_limiter=None):
+    # Fetches (url, etag) pairs in order with one fetcher and returns it with
+    # the results.
+    if rate_limiter is None:
+        rate_limiter = RateLimiter(initial_rate=10000, max_rate=10000)
+
+    async def run():
+        async with TieredFetcher(crawler, rate_limiter=rate_limiter) as fetcher:
+            return fetcher, [await fetcher.fetch_page(url, "test", etag) for url, etag in requests]
+
+    return asyncio.run(run())
+
+def test_static_pages_take_the_http_fast_path(shop):
+    site, base_url = shop
+    crawler = ScriptRunningCrawler()
+    fetcher, (result,) = fetch(crawler, (base_url + "/", None))
+
+    assert len(result.links) >= fetcher.min_static_links
+    assert base_url + site.path(1) in result.links
+    assert (fetcher.http_pages, fetcher.browser_pages) == (1, 0)
+    assert crawler.rendered == []
+    assert result.etag and not result.not_modified
+
+def test_js_only_pages_fall_back_to_the_browser(js_shop):
+    site, base_url = js_shop
+    crawler = ScriptRunningCrawler()
+    shell = base_url + site.path(1)
+    fetcher, (result, home) = fetch(crawler, (shell, None), (base_url + "/", None))
+
+    assert base_url + site.path(site.branching + 1) in result.links
+    # An app shell pins its domain to the browser, static pages included.
+    assert crawler.rendered == [shell, base_url + "/"]
+    assert (fetcher.http_pages, fetcher.browser_pages) == (0, 2)
+    assert home.links
+
+def test_unchanged_pages_answer_not_modified(shop):
+    site, base_url = shop
+    crawler = ScriptRunningCrawler()
+    url = base_url + site.path(1)
+    fetcher, (first,) = fetch(crawler, (url, None))
+    fetcher, (unchanged, changed) = fetch(crawler, (url, first.etag), (url, '"stale"'))
+
+    assert unchanged.not_modified and unchanged.links == []
+    assert unchanged.etag == first.etag
+    assert not changed.not_modified and changed.links == first.links
+    assert (fetcher.http_pages, fetcher.browser_pages) == (2, 0)
+    assert crawler.rendered == []
+
+def test_throttled_pages_are_not_rendered():
+    site = ShopSite(pages=50, broken_pages=(1,), throttled_pages=(2,))
+    crawler = ScriptRunningCrawler()
+    rate_limiter = RateLimiter(initial_rate=100, max_rate=100)
+    with serve_site(site) as base_url:
+        broken, throttled = base_url + site.path(1), base_url + site.path(2)
+        fetcher, (error, backoff) = fetch(crawler, (broken, None), (throttled, None), rate_limiter=rate_limiter)
+
+    # A server error gets a second chance in the browser; a 429 does not.
+    assert crawler.rendered == [broken]
+    assert backoff.failed and backoff.links == []
+    assert (fetcher.http_pages, fetcher.browser_pages) == (1, 1)
+    assert rate_limiter.rate(throttled) < 100
@@ -0,0 +1,31 @@
+import asyncio
+
+from tests.conftest import crawl
+from utils.frontier import MemoryFrontier
+from utils.product_sink import ProductList
+from utils.url_utils import canonicalize_url
+
+def test_frontier_fetches_urls_as_found_and_dedups_canonically():
+    frontier = MemoryFrontier(set(), "depth_first")
+    assert frontier.push("https://shop.example/search?q=a%20b&flag", 1, None)
+    assert frontier.push("https://shop.example/collections/men/", 1, None)
+
+    async def run():
+        return await frontier.pop(), await frontier.pop(), await frontier.pop()
+
+    men, search, empty = asyncio.run(run())
+    assert men[0] == "https://shop.example/collections/men/"
+    assert search[0] == "https://shop.example/search?q=a%20b&flag"
+    assert empty is None
+    assert frontier.seen_urls == {"https://shop.example/collections/men", "https://shop.example/search?flag=&q=a+b"}
+    assert not frontier.push("https://shop.example/collections/men?utm_source=nav", 2, None)
+
+def test_crawl_fetches_each_canonical_url_once(shop):
+    site, base_url = shop
+    fetched = []
+    products = asyncio.run(crawl(base_url, fetched=fetched, sink=ProductList(), incremental=False)).products
+
+    keys = [canonicalize_url(url) for url in fetched]
+    assert len(keys) == len(set(keys)) == site.pages
+    assert all(product.url == canonicalize_url(product.url) for product in products)
+    assert len(products) == site.product_count()
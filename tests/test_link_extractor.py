@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from benchmarks.bench_link_extraction import build_category_page, legacy_extract_links
+from utils.link_extractor import extract_links
+
+BASE_URL = "https://shop.example/collections/all"
+
+# Markup the old BeautifulSoup parser read correctly and a naive href regex
+# does not.
+PAGES = {
+    "data_href_first": '<a data-href="/quickview/1" href="/products/shoe-1">Shoe</a>',
+    "data_track_href": "<a data-track-href=\"/t\" class=\"x\" href='/products/shoe-2'>Shoe</a>",
+    "comment": '<!-- <a href="/products/hidden">old</a> --><a href="/products/shown">new</a>',
+    "script": (
+        "<script>var card = '<a href=\"/products/in-script\">';</script>"
+        '<a href="/products/after-script">x</a>'
+    ),
+    "style": '<style>a[href="/products/in-style"] { color: red }</style><a href="/products/after-style">x</a>',
+    "gt_in_value": '<a title="shoes > boots" href="/products/boot-1">Boot</a>',
+    "no_space": '<a class="card"href="/products/packed">x</a><A HREF=/products/upper>x</A>',
+    "entities": '<a href="/products/shoe?a=1&amp;b=2">x</a>',
+    "not_anchors": '<abbr href="/no">x</abbr><area href="/products/area"><a>none</a><a href>empty</a>',
+    "layout": '<a\nhref="/products/newline"\n>x</a><a href="/products/self-closing"/>',
+    "other_hosts": '<a href="https://cdn.example/x">x</a><a href="javascript:void(0)">x</a><a href="#top">x</a>',
+    "unquoted_slashes": '<a href=/collections/men/>x</a><a href=shoes/ class=card>x</a><a/href=/products/slash>x</a>',
+    "stray_quote": '<a title=men"s href=/products/quote>x</a><a href=/products/it\'s>x</a>',
+}
+
+# Malformed tags the pattern must reject or accept in linear time, however
+# long; each once took seconds (or forever) to backtrack through.
+SLOW_PAGES = {
+    "slashes_in_unquoted_value": lambda n: '<p><a href=/search?' + 'k=v/' * n + ' title=men"s>Shoes</a></p>',
+    "slashes_between_names": lambda n: "<a " + "b/" * n,
+    "unterminated_anchors": lambda n: "<a x=y/ " * n,
+    "unterminated_before_a_quote": lambda n: "<a x=y/ " * n + '"">',
+}
+
+@pytest.mark.parametrize("name", sorted(PAGES))
+def test_matches_beautifulsoup(name):
+    html = PAGES[name]
+    assert set(extract_links(html, BASE_URL)) == set(legacy_extract_links(html, BASE_URL))
+
+def test_matches_beautifulsoup_on_category_page():
+    html = build_category_page(500)
+    assert set(extract_links(html, BASE_URL)) == set(legacy_extract_links(html, BASE_URL))
+
+def test_href_not_taken_from_data_attribute():
+    assert extract_links(PAGES["data_href_first"], BASE_URL) == ["https://shop.example/products/shoe-1"]
+
+def test_anchor_texts():
+    anchor_texts = {}
+    extract_links('<a href="/products/a"><span>Shop  Men&#39;s</span></a>', BASE_URL, anchor_texts)
+    assert anchor_texts == {"https://shop.example/products/a": "shop men's"}
+
+@pytest.mark.parametrize("name", sorted(SLOW_PAGES))
+def test_malformed_markup_does_not_backtrack(name):
+    html = SLOW_PAGES[name](2000)
+    start = time.perf_counter()
+    extract_links(html, BASE_URL)
+    assert time.perf_counter() - start < 0.5
+
+def test_keeps_link_with_slashes_in_unquoted_value():
+    html = SLOW_PAGES["slashes_in_unquoted_value"](22)
+    assert extract_links(html, BASE_URL) == legacy_extract_links(html, BASE_URL)
+    assert len(extract_links(html, BASE_URL)) == 1
@@ -0,0 +1,62 @@
+import asyncio
+from urllib.parse import urlsplit
+
+from benchmarks.fixture_site import ShopSite, serve_site
+from tests.conftest import crawl
+from utils import db_utils
+from utils.product_sink import ProductList
+
+def recrawl(base_url, **kwargs):
+    crawl_id = db_utils.add_url_to_crawl(f"{base_url}/?run={db_utils.count_urls_by_status()}", base_url)
+    asyncio.run(crawl(base_url, crawl_id=crawl_id, sink=ProductList(), **kwargs))
+    return db_utils.get_crawl_status(crawl_id), crawl_id
+
+def product_states(base_url):
+    return db_utils.get_connection().execute(
+        "SELECT COUNT(*) FROM page_state WHERE is_product = 1 AND etag IS NOT NULL AND url LIKE ?", (base_url + "%",)
+    ).fetchone()[0]
+
+def removed_changes(crawl_id):
+    return db_utils.get_connection().execute(
+        "SELECT COUNT(*) FROM product_changes WHERE crawl_id = ? AND change = 'removed'", (crawl_id,)
+    ).fetchone()[0]
+
+def test_transient_failure_reports_no_removals(database):
+    site = ShopSite(pages=200)
+    with serve_site(site) as base_url:
+        status, _ = recrawl(base_url)
+    assert status["removed_products"] == 0
+    known = product_states(base_url)
+    assert known == site.product_count()
+
+    # The next crawl finds the home page failing on the same host and port.
+    port = urlsplit(base_url).port
+    with serve_site(ShopSite(pages=200, broken_pages=(0,)), port=port):
+        status, crawl_id = recrawl(base_url)
+    assert status["removed_products"] is None
+    assert removed_changes(crawl_id) == 0
+    assert product_states(base_url) == known
+
+    # Once it is back, nothing was lost and nothing is reported gone.
+    with serve_site(site, port=port):
+        status, crawl_id = recrawl(base_url)
+    assert (status["new_products"], status["removed_products"]) == (0, 0)
+
+def test_depth_limited_recrawl_reports_no_removals(database, shop):
+    site, base_url = shop
+    status, _ = recrawl(base_url)
+    assert status["removed_products"] == 0
+
+    status, crawl_id = recrawl(base_url, max_depth=1)
+    assert status["removed_products"] is None
+    assert removed_changes(crawl_id) == 0
+    assert product_states(base_url) == site.product_count()
+
+def test_sitemap_products_are_not_removed(database, shop):
+    site, base_url = shop
+    recrawl(base_url)
+
+    # Products read from the sitemap are never visited by the crawl.
+    status, crawl_id = recrawl(base_url, discovery="hybrid")
+    assert status["removed_products"] == 0
+    assert product_states(base_url) == site.product_count()
@@ -0,0 +1,85 @@
+import asyncio
+import contextlib
+
+from models.product import ProductRecord
+from tests.conftest import crawl
+from utils import db_utils
+from utils.frontier import PersistentFrontier
+from utils.product_sink import DatabaseProductSink, ProductList
+
+def records(count, start=0):
+    return [
+        ProductRecord(f"https://shop.example/products/item-{index}", "https://shop.example", f"item-{index}", "products")
+        for index in range(start, start + count)
+    ]
+
+def test_database_sink_writes_in_batches(database):
+    crawl_id = db_utils.add_url_to_crawl("https://shop.example/", "https://shop.example")
+    sink = DatabaseProductSink(crawl_id, batch_size=3, flush_seconds=3600)
+
+    async def run():
+        sink.add(records(2))
+        assert not sink.flush_due()
+        sink.add(records(1, start=2))
+        assert sink.flush_due()
+        sink.pages_visited = 7
+        await sink.flush()
+        # The same products again add no rows.
+        sink.add(records(3))
+        await sink.flush()
+
+    asyncio.run(run())
+    status = db_utils.get_crawl_status(crawl_id)
+    assert (status["pages_visited"], status["products_found"], status["products_saved"]) == (7, 3, 3)
+    assert sink.count == 3
+
+def test_product_batches_keep_a_running_count(database):
+    first = db_utils.add_url_to_crawl("https://shop.example/a", "https://shop.example")
+    second = db_utils.add_url_to_crawl("https://shop.example/b", "https://shop.example")
+    assert db_utils.save_product_batch(first, [record.as_dict() for record in records(3)], 1) == 3
+
+    # Duplicates within a batch count once; products stored under another
+    # job move to this one and count; its own products never count twice.
+    batch = [record.as_dict() for record in records(3, start=2) + records(1, start=4)]
+    assert db_utils.save_product_batch(second, batch, 1) == 3
+    assert db_utils.save_product_batch(second, [record.as_dict() for record in records(5)], 2) == 5
+    assert db_utils.save_product_batch(second, [], 3) == 5
+    assert db_utils.count_crawl_products(second) == 5
+
+def test_database_sink_flushes_progress_after_interval(database):
+    crawl_id = db_utils.add_url_to_crawl("https://shop.example/", "https://shop.example")
+    sink = DatabaseProductSink(crawl_id, batch_size=100, flush_seconds=0)
+    asyncio.run(sink.flush())
+    assert not sink.flush_due()
+    sink.pages_visited = 1
+    assert sink.flush_due()
+    asyncio.run(sink.flush())
+    assert not sink.flush_due()
+    assert db_utils.get_crawl_status(crawl_id)["pages_visited"] == 1
+
+def test_resumed_crawl_counts_every_product_once(database, shop):
+    site, base_url = shop
+    expected = asyncio.run(crawl(base_url, sink=ProductList(), incremental=False)).count
+    crawl_id = db_utils.add_url_to_crawl(base_url, base_url)
+
+    async def interrupted():
+        sink = DatabaseProductSink(crawl_id, batch_size=5)
+        frontier = PersistentFrontier(crawl_id, set(), checkpoint_pages=5, sink=sink)
+        task = asyncio.create_task(crawl(base_url, frontier=frontier, crawl_id=crawl_id, sink=sink))
+        while frontier.pages_visited < 60 and not task.done():
+            await asyncio.sleep(0.005)
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+    async def resumed():
+        sink = DatabaseProductSink(crawl_id, batch_size=5)
+        frontier = PersistentFrontier(crawl_id, set(), checkpoint_pages=5, sink=sink)
+        await crawl(base_url, frontier=frontier, crawl_id=crawl_id, sink=sink)
+        assert frontier.resumed
+        return sink
+
+    asyncio.run(interrupted())
+    sink = asyncio.run(resumed())
+    status = db_utils.get_crawl_status(crawl_id)
+    assert sink.count == status["products_found"] == status["products_saved"] == expected
@@ -0,0 +1,53 @@
+import time
+
+from utils.rate_limiter import RateLimiter, parse_retry_after
+
+URL = "https://shop.example/products/item-1"
+
+def make_limiter():
+    return RateLimiter(initial_rate=1.0, min_rate=0.1, max_rate=10.0, increase=0.1, decrease=0.5)
+
+def test_backoff_never_exceeds_crawl_delay():
+    limiter = make_limiter()
+    limiter.set_crawl_delay(URL, 30)
+    assert limiter.rate(URL) == 1 / 30
+    limiter.record(URL, status=503)
+    assert limiter.rate(URL) <= 1 / 30
+
+def test_crawl_delay_applied_to_existing_host():
+    limiter = make_limiter()
+    assert limiter.rate(URL) == 1.0
+    limiter.set_crawl_delay(URL, 30)
+    assert limiter.rate(URL) == 1 / 30
+    limiter.bucket(URL).decreased_at = float("-inf")
+    limiter.record(URL, error=True)
+    assert limiter.rate(URL) <= 1 / 30
+    for _ in range(20):
+        limiter.record(URL, latency=0.01, status=200)
+    assert limiter.rate(URL) <= 1 / 30
+
+def test_rate_grows_on_quick_responses_and_halves_on_throttling():
+    limiter = make_limiter()
+    for _ in range(10):
+        limiter.record(URL, latency=0.05, status=200)
+    assert abs(limiter.rate(URL) - 2.0) < 1e-9
+    limiter.record(URL, status=429)
+    assert abs(limiter.rate(URL) - 1.0) < 1e-9
+
+def test_rate_stays_within_bounds():
+    limiter = make_limiter()
+    for _ in range(200):
+        limiter.record(URL, latency=0.05, status=200)
+    assert limiter.rate(URL) == 10.0
+    bucket = limiter.bucket(URL)
+    for _ in range(20):
+        bucket.decreased_at = float("-inf")
+        limiter.record(URL, status=503)
+    assert limiter.rate(URL) == 0.1
+
+def test_retry_after_pauses_host():
+    limiter = make_limiter()
+    limiter.record(URL, status=429, retry_after="5")
+    assert limiter.bucket(URL).reserve(time.monotonic()) >= 4.9
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
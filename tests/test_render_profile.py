@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from utils.render_profile import ResourceBlocker, make_run_config
+
+class Request:
+    def __init__(self, url, resource_type, navigation=False):
+        self.url = url
+        self.resource_type = resource_type
+        self.navigation = navigation
+
+    def is_navigation_request(self):
+        return self.navigation
+
+# Records what the blocker did with one request, like a Playwright Route.
+class Route:
+    def __init__(self, request):
+        self.request = request
+        self.outcome = None
+
+    async def continue_(self):
+        self.outcome = "continued"
+
+    async def abort(self):
+        self.outcome = "aborted"
+
+class Page:
+    def __init__(self):
+        self.handler = None
+
+    async def route(self, pattern, handler):
+        self.handler = handler
+
+@pytest.mark.parametrize(
+    "resource_type, url, blocked",
+    [
+        ("script", "https://shop.example.co.uk/assets/app.js", False),
+        ("script", "https://cdn.shopify.com/s/files/1/theme.js", False),
+        ("script", "https://d1abc.cloudfront.net/bundle.js", False),
+        ("fetch", "https://api.shop-search.example/products.json", False),
+        ("document", "https://reviews.example/widget", False),
+        ("image", "https://shop.example.co.uk/img/1.jpg", True),
+        ("font", "https://fonts.gstatic.com/s/roboto.woff2", True),
+        ("stylesheet", "https://cdn.shopify.com/s/files/1/theme.css", True),
+        ("media", "https://videos.example/intro.mp4", True),
+        ("script", "https://www.googletagmanager.com/gtm.js?id=GTM-1", True),
+        ("fetch", "https://region1.google-analytics.com/g/collect", True),
+        ("script", "https://connect.facebook.net/en_US/fbevents.js", True),
+        ("script", "https://notdoubleclick.net/app.js", False),
+    ],
+)
+def test_blocks_resource_types_and_trackers(resource_type, url, blocked):
+    assert ResourceBlocker().blocks(resource_type, url) is blocked
+
+def test_routes_only_links_profile_pages():
+    blocker = ResourceBlocker()
+    page = Page()
+
+    async def route(*requests):
+        routes = [Route(request) for request in requests]
+        for item in routes:
+            await page.handler(item)
+        return [item.outcome for item in routes]
+
+    async def run():
+        config = make_run_config("test", "links")
+        config.url = "https://shop.example.co.uk/"
+        await blocker.on_page_context_created(page, config=config)
+        links = await route(
+            Request("https://shop.example.co.uk/", "document", navigation=True),
+            Request("https://cdn.shopify.com/s/files/1/theme.js", "script"),
+            Request("https://shop.example.co.uk/img/1.jpg", "image"),
+            Request("https://www.google-analytics.com/analytics.js", "script"),
+        )
+        # The same page reused by a full-profile run loads everything.
+        await blocker.on_page_context_created(page, config=make_run_config("test", "full"))
+        full = await route(Request("https://shop.example.co.uk/img/1.jpg", "image"))
+        return links, full
+
+    links, full = asyncio.run(run())
+    assert links == ["continued", "continued", "aborted", "aborted"]
+    assert full == ["continued"]
+    assert (blocker.blocked_requests, blocker.allowed_requests) == (2, 1)
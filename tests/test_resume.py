@@ -0,0 +1,92 @@
+import asyncio
+import contextlib
+import re
+
+from benchmarks.fixture_site import PRODUCT_PATTERN
+from tests.conftest import crawl
+from utils import db_utils
+from utils.frontier import PersistentFrontier
+from utils.product_sink import DatabaseProductSink, ProductList
+from utils.url_utils import canonicalize_url
+
+CONCURRENCY = 4
+CHECKPOINT_PAGES = 5
+
+def visited_urls(crawl_id):
+    return set(db_utils.load_visited_urls(crawl_id))
+
+def stored_urls(crawl_id):
+    rows = db_utils.get_connection().execute("SELECT url FROM crawled_products WHERE crawl_id = ?", (crawl_id,))
+    return {url for (url,) in rows}
+
+def run_job(base_url, crawl_id, fetched, stop_after=None, memory_limit=10000):
+    # Runs the job's crawl, cancelled once stop_after pages are visited. A
+    # batch size larger than the shop keeps products in the sink until a
+    # checkpoint flushes them.
+    async def run():
+        sink = DatabaseProductSink(crawl_id, batch_size=100000, flush_seconds=3600)
+        frontier = PersistentFrontier(
+            crawl_id, set(), checkpoint_pages=CHECKPOINT_PAGES, memory_limit=memory_limit, sink=sink
+        )
+        task = asyncio.create_task(
+            crawl(base_url, concurrency=CONCURRENCY, fetched=fetched, frontier=frontier, crawl_id=crawl_id, sink=sink)
+        )
+        while stop_after is not None and frontier.pages_visited < stop_after and not task.done():
+            await asyncio.sleep(0.005)
+        if stop_after is not None:
+            task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+        return frontier
+
+    return asyncio.run(run())
+
+def test_resume_refetches_only_pages_in_flight(database, shop):
+    site, base_url = shop
+    everything = []
+    asyncio.run(crawl(base_url, concurrency=CONCURRENCY, fetched=everything, sink=ProductList(), incremental=False))
+    crawl_id = db_utils.add_url_to_crawl(base_url, base_url)
+
+    first, second = [], []
+    run_job(base_url, crawl_id, first, stop_after=60)
+    saved = visited_urls(crawl_id)
+    assert saved and len(saved) < len(everything)
+    frontier = run_job(base_url, crawl_id, second)
+
+    assert frontier.resumed
+    # Pages are fetched under whichever URL they were first found at.
+    first, second, everything = ({canonicalize_url(url) for url in urls} for urls in (first, second, everything))
+    refetched = first & second
+    # Pages saved as visited are never fetched again; only those in flight
+    # or completed since the last checkpoint are.
+    assert not refetched & saved
+    assert len(refetched) <= CONCURRENCY + CHECKPOINT_PAGES
+    assert first | second == everything
+
+def test_checkpoint_saves_products_before_pages(database, shop):
+    site, base_url = shop
+    crawl_id = db_utils.add_url_to_crawl(base_url, base_url)
+    run_job(base_url, crawl_id, [], stop_after=60)
+
+    visited_products = {url for url in visited_urls(crawl_id) if re.search(PRODUCT_PATTERN, url)}
+    assert visited_products
+    assert visited_products <= stored_urls(crawl_id)
+
+def test_resume_keys_frontier_rows_by_canonical_url(database, shop):
+    site, base_url = shop
+    crawl_id = db_utils.add_url_to_crawl(base_url, base_url)
+    first, second = [], []
+    run_job(base_url, crawl_id, first, stop_after=60, memory_limit=20)
+
+    rows = db_utils.get_connection().execute(
+        "SELECT url, fetch_url FROM crawl_frontier WHERE crawl_id = ?", (crawl_id,)
+    ).fetchall()
+    # Links found with tracking parameters are stored as found, under their
+    # canonical URL, and completed pages leave the frontier.
+    assert any(fetch_url and "utm_source=" in fetch_url for url, fetch_url in rows)
+    assert all(url == canonicalize_url(fetch_url or url) for url, fetch_url in rows)
+    assert not {url for url, fetch_url in rows} & visited_urls(crawl_id)
+
+    frontier = run_job(base_url, crawl_id, second, memory_limit=20)
+    assert any("utm_source=" in url for url in second)
+    assert frontier.pages_visited == site.pages
@@ -0,0 +1,50 @@
+import pytest
+
+from utils.trap_detector import TrapDetector
+
+SITE = "https://shop.example"
+
+def category_links(category, nav_links):
+    nav = [f"{SITE}/collections/menu-{index}" for index in range(nav_links)]
+    products = [f"{SITE}/products/c{category}-item-{index}" for index in range(24)]
+    return nav + products
+
+@pytest.mark.parametrize("nav_links", [150, 300, 600])
+def test_shared_navigation_does_not_make_pages_duplicates(nav_links):
+    detector = TrapDetector()
+    duplicates = [
+        category
+        for category in range(100)
+        if detector.is_near_duplicate(f"{SITE}/collections/c-{category}", category_links(category, nav_links))
+    ]
+    assert duplicates == []
+    assert detector.skipped["near_duplicate"] == 0
+
+@pytest.mark.parametrize("nav_links", [0, 300])
+def test_facet_variants_are_near_duplicates(nav_links):
+    detector = TrapDetector()
+    for category in range(20):
+        assert not detector.is_near_duplicate(f"{SITE}/collections/c-{category}", category_links(category, nav_links))
+
+    # The same listing under other filters: its own variant links change,
+    # the products it lists do not.
+    for color in ("red", "blue", "black"):
+        url = f"{SITE}/collections/c-3?color={color}"
+        links = category_links(3, nav_links) + [f"{SITE}/collections/c-3?color={color}&page=2"]
+        assert detector.is_near_duplicate(url, links)
+    assert detector.skipped["near_duplicate"] == 3
+
+def test_variants_of_first_page_are_near_duplicates():
+    detector = TrapDetector()
+    links = category_links(0, 50)
+    assert not detector.is_near_duplicate(f"{SITE}/", links)
+    assert detector.is_near_duplicate(f"{SITE}/?sort=price", links)
+
+def test_check_url_reasons():
+    detector = TrapDetector(max_param_values=2, max_pagination=5)
+    assert detector.check_url(f"{SITE}/a/b/a/b/a/b") == "repeated_segments"
+    assert detector.check_url(f"{SITE}/collections/c-1?page=6") == "pagination_depth"
+    assert detector.check_url(f"{SITE}/collections/c-1?color=red") is None
+    assert detector.check_url(f"{SITE}/collections/c-2?color=blue") is None
+    assert detector.check_url(f"{SITE}/collections/c-3?color=green") == "param_cardinality"
+    assert detector.check_url(f"{SITE}/products/item-1?color=green", is_product=True) is None
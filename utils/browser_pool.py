@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+from config import (
+    BROWSER_POOL_SIZE,
+    BROWSER_RECYCLE_MEMORY_MB,
+    BROWSER_RECYCLE_PAGES,
+    MAX_OPEN_PAGES,
+)
+from utils.metrics import (
+    ACTIVE_BROWSER_PAGES,
+    BROWSER_LAUNCH_SECONDS,
+    BROWSER_MEMORY_BYTES,
+    BROWSER_POOL_BROWSERS,
+    BROWSER_POOL_LEASES,
+    BROWSER_POOL_UTILIZATION,
+    BROWSER_RECYCLES_TOTAL,
+    REGISTRY,
+)
+from utils.scraper_utils import make_crawler
+
+logger = logging.getLogger(__name__)
+
+# Process tree helpers for the memory threshold. Each crawler starts its own
+# Playwright driver, so the processes a launch adds under this one are that
+# browser's: the driver, Chromium and its renderers below it. Without /proc
+# (anything but Linux) memory is not measured.
+
+def _process_tree():
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name can contain spaces; fields resume after its ")".
+        parent = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(parent, []).append(int(entry))
+    return children
+
+def _descendants(roots, children):
+    found = []
+    stack = list(roots)
+    while stack:
+        pid = stack.pop()
+        found.append(pid)
+        stack.extend(children.get(pid, ()))
+    return found
+
+def _rss_bytes(pids):
+    total = 0
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+def _memory_supported():
+    return os.path.isdir("/proc/self")
+
+# One Chromium instance of the pool, shared by every job leasing it.
+class PooledBrowser:
+    def __init__(self, crawler, root_pids):
+        self.crawler = crawler
+        self.root_pids = root_pids
+        self.pages = 0
+        self.leases = 0
+        self.retiring = None
+        self.launched_at = time.monotonic()
+        crawler.crawler_strategy.set_hook("before_goto", self._count_page)
+
+    async def _count_page(self, page, **kwargs):
+        self.pages += 1
+        return page
+
+    def memory_bytes(self, children=None):
+        if not self.root_pids:
+            return None
+        if children is None:
+            children = _process_tree()
+        return _rss_bytes(_descendants(self.root_pids, children))
+
+    def connected(self):
+        browser = getattr(self.crawler.crawler_strategy.browser_manager, "browser", None)
+        return browser is None or browser.is_connected()
+
+# Keeps BROWSER_POOL_SIZE browsers running and lends them to crawl jobs, so
+# a job no longer pays for a Chromium launch. Jobs share browsers (each in
+# its own sessions) and one page semaphore, which caps the pages rendering
+# at once across all of them. A browser is retired after recycle_pages
+# pages, when its processes pass recycle_memory_mb or when it disconnects,
+# and closed once the last job using it is done; the next lease starts a
+# fresh one.
+class BrowserPool:
+    def __init__(
+        self,
+        size=BROWSER_POOL_SIZE,
+        max_open_pages=MAX_OPEN_PAGES,
+        recycle_pages=BROWSER_RECYCLE_PAGES,
+        recycle_memory_mb=BROWSER_RECYCLE_MEMORY_MB,
+    ):
+        self.size = max(1, size)
+        self.max_open_pages = max(1, max_open_pages)
+        self.page_semaphore = asyncio.Semaphore(self.max_open_pages)
+        self.recycle_pages = recycle_pages
+        self.recycle_memory_bytes = recycle_memory_mb * 1024 * 1024 if recycle_memory_mb else None
+        self.browsers = []
+        self.lock = asyncio.Lock()
+        self.launches = 0
+        self.recycles = 0
+        self.closed = False
+
+    async def start(self):
+        # Launches the first browser up front so the first job finds it warm.
+        # A failed launch is only logged; leases try again.
+        REGISTRY.add_collector(self.collect_metrics)
+        async with self.lock:
+            if not self.browsers:
+                try:
+                    self.browsers.append(await self._launch())
+                except Exception as e:
+                    logger.warning("Could not start a pooled browser: %s", str(e))
+        return self
+
+    async def close(self):
+        async with self.lock:
+            self.closed = True
+            browsers, self.browsers = self.browsers, []
+        for browser in browsers:
+            await self._close_browser(browser)
+        logger.info(
+            "Browser pool closed after %d launches and %d recycles.", self.launches, self.recycles,
+            extra={"launches": self.launches, "recycles": self.recycles},
+        )
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @asynccontextmanager
+    async def lease(self):
+        # Yields a started crawler; pass pool.page_semaphore along with it.
+        async with self.lock:
+            if self.closed:
+                raise RuntimeError("browser pool is closed")
+            browser = await self._acquire()
+            browser.leases += 1
+        try:
+            yield browser.crawler
+        finally:
+            browser.leases -= 1
+            if browser.retiring is None and not browser.connected():
+                self._retire(browser, "disconnected")
+            if browser.retiring is not None and browser.leases == 0:
+                await self._remove(browser)
+
+    async def _acquire(self):
+        children = _process_tree() if self.recycle_memory_bytes and _memory_supported() else None
+        for browser in list(self.browsers):
+            if browser.retiring is None:
+                reason = self._recycle_reason(browser, children)
+                if reason:
+                    self._retire(browser, reason)
+            if browser.retiring is not None and browser.leases == 0:
+                self.browsers.remove(browser)
+                await self._close_browser(browser)
+
+        available = [browser for browser in self.browsers if browser.retiring is None]
+        if len(available) < self.size and (not available or min(b.leases for b in available) > 0):
+            browser = await self._launch()
+            self.browsers.append(browser)
+            return browser
+        return min(available, key=lambda browser: browser.leases)
+
+    def _recycle_reason(self, browser, children):
+        if self.recycle_pages and browser.pages >= self.recycle_pages:
+            return "pages"
+        if children is not None:
+            memory = browser.memory_bytes(children)
+            if memory is not None and memory > self.recycle_memory_bytes:
+                return "memory"
+        if not browser.connected():
+            return "disconnected"
+        return None
+
+    def _retire(self, browser, reason):
+        browser.retiring = reason
+        self.recycles += 1
+        BROWSER_RECYCLES_TOTAL.labels(reason=reason).inc()
+        logger.info(
+            "Recycling browser after %d pages (%s)", browser.pages, reason,
+            extra={"pages": browser.pages, "reason": reason},
+        )
+
+    async def _remove(self, browser):
+        async with self.lock:
+            if browser not in self.browsers:
+                return
+            self.browsers.remove(browser)
+        await self._close_browser(browser)
+
+    async def _launch(self):
+        # Called with the lock held, so no other launch adds processes while
+        # this one is told apart by the pids it added.
+        track_memory = self.recycle_memory_bytes is not None and _memory_supported()
+        before = set(_process_tree().get(os.getpid(), ())) if track_memory else set()
+        crawler = make_crawler()
+        start = time.perf_counter()
+        await crawler.start()
+        BROWSER_LAUNCH_SECONDS.observe(time.perf_counter() - start)
+        self.launches += 1
+        root_pids = set(_process_tree().get(os.getpid(), ())) - before if track_memory else set()
+        return PooledBrowser(crawler, root_pids)
+
+    async def _close_browser(self, browser):
+        try:
+            await browser.crawler.close()
+        except Exception as e:
+            logger.warning("Error closing pooled browser: %s", str(e))
+
+    def stats(self):
+        open_pages = ACTIVE_BROWSER_PAGES.labels().value
+        children = _process_tree() if _memory_supported() else None
+        memory = sum(browser.memory_bytes(children) or 0 for browser in self.browsers) if children is not None else None
+        return {
+            "browsers": len(self.browsers),
+            "retiring": sum(browser.retiring is not None for browser in self.browsers),
+            "leases": sum(browser.leases for browser in self.browsers),
+            "open_pages": open_pages,
+            "max_open_pages": self.max_open_pages,
+            "utilization": open_pages / self.max_open_pages,
+            "pages_rendered": sum(browser.pages for browser in self.browsers),
+            "launches": self.launches,
+            "recycles": self.recycles,
+            "memory_bytes": memory,
+        }
+
+    def collect_metrics(self):
+        stats = self.stats()
+        BROWSER_POOL_BROWSERS.set(stats["browsers"])
+        BROWSER_POOL_LEASES.set(stats["leases"])
+        BROWSER_POOL_UTILIZATION.set(stats["utilization"])
+        if stats["memory_bytes"] is not None:
+            BROWSER_MEMORY_BYTES.set(stats["memory_bytes"])
@@ -0,0 +1,69 @@
+import re
+from bisect import bisect_right
+from collections import namedtuple
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+from config import DOMAIN_PRODUCT_URL_PATTERNS, PRODUCT_ID_PATTERNS, PRODUCT_URL_PATTERNS
+
+ProductMatch = namedtuple("ProductMatch", ["product_id", "category"])
+
+class ProductClassifier:
+    # Matches every product URL pattern with one compiled alternation instead
+    # of a Python loop of substring checks, and extracts the id the same way.
+
+    def __init__(self, patterns=PRODUCT_URL_PATTERNS, id_patterns=PRODUCT_ID_PATTERNS):
+        self.patterns = tuple(pattern for pattern in patterns if pattern)
+        # Longest first so overlapping patterns prefer the most specific one.
+        alternation = "|".join(
+            re.escape(pattern) for pattern in sorted(self.patterns, key=len, reverse=True)
+        )
+        self.pattern_regex = re.compile(alternation or r"(?!)", re.IGNORECASE)
+        self.id_regex = re.compile("|".join(f"(?:{pattern})" for pattern in id_patterns) or r"(?!)")
+
+    def is_product_url(self, url):
+        return self.pattern_regex.search(url) is not None
+
+    def classify(self, url):
+        if self.pattern_regex.search(url) is None:
+            return None
+        return self._match(url)
+
+    def classify_many(self, urls):
+        # Scan a whole page of links with a single regex pass over the joined
+        # text, then extract ids and categories for the product URLs only.
+        urls = list(urls)
+        if not urls:
+            return {}
+
+        starts = []
+        offset = 0
+        for url in urls:
+            starts.append(offset)
+            offset += len(url) + 1
+
+        matches = {}
+        for found in self.pattern_regex.finditer("\n".join(urls)):
+            url = urls[bisect_right(starts, found.start()) - 1]
+            if url not in matches:
+                matches[url] = self._match(url)
+        return matches
+
+    def _match(self, url):
+        product_id = None
+        found = self.id_regex.search(url)
+        if found:
+            product_id = next(group for group in found.groups() if group is not None)
+
+        parts = urlsplit(url).path.strip("/").split("/")
+        category = parts[-2] if len(parts) >= 2 else None
+        return ProductMatch(product_id, category)
+
+@lru_cache(maxsize=128)
+def _cached_classifier(patterns):
+    return ProductClassifier(patterns)
+
+def get_classifier(domain=None, patterns=None):
+    if patterns is None:
+        patterns = DOMAIN_PRODUCT_URL_PATTERNS.get(domain, PRODUCT_URL_PATTERNS)
+    return _cached_classifier(tuple(patterns))
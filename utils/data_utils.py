@@ -1,10 +1,13 @@
 import csv
 import json
+import logging
 import os
 from typing import Dict, List, Set
 from urllib.parse import urlparse
 
-from models.product import Product
+from models.product import ProductRecord
+
+logger = logging.getLogger(__name__)
 
 def is_duplicate_url(url, seen_urls):
     return url in seen_urls
@@ -18,27 +21,28 @@ def extract_domain(url):
 
 def save_products_to_csv(products, filename):
     if not products:
-        print("No products to save.")
+        logger.info("No products to save.")
         return
 
-    fieldnames = Product.model_fields.keys()
-    print("kjdnfjkdsf", filename)
+    fieldnames = ProductRecord.__slots__
+    count = 0
     with open(filename, mode="w", newline="", encoding="utf-8") as file:
         writer = csv.DictWriter(file, fieldnames=fieldnames)
         writer.writeheader()
-        writer.writerows([product.model_dump() for product in products])
-    print(f"Saved {len(products)} product URLs to '{filename}'.")
+        for product in products:
+            writer.writerow(product.as_dict())
+            count += 1
+    logger.info("Saved %d product URLs to '%s'.", count, filename)
 
-def save_products_by_domain(products_by_domain, crawl_id):
-    print("jkjkdsfnsd", products_by_domain)
+def save_products_by_domain(products_by_domain, crawl_id=None, output_dir="output"):
     from utils.db_utils import save_crawled_products
     
     for domain, products in products_by_domain.items():
-        save_crawled_products(products, crawl_id)
+        save_crawled_products((product.as_dict() for product in products), crawl_id)
     
-    print(f"Saved {sum(len(products) for products in products_by_domain.values())} products to database.")
+    logger.info("Saved %d products to database.", sum(len(products) for products in products_by_domain.values()))
 
-    print("kjdsnfdsfsd", products_by_domain)
+    os.makedirs(output_dir, exist_ok=True)
     summary_filename = os.path.join(output_dir, "summary.txt")
     with open(summary_filename, "w", encoding="utf-8") as f:
         f.write("E-commerce Product URL Crawler - Summary\n")
@@ -50,4 +54,4 @@ def save_products_by_domain(products_by_domain, crawl_id):
             f.write(f"{domain}: {count} product URLs\n")
         f.write(f"\nTotal: {total_products} product URLs across {len(products_by_domain)} domains\n")
     
-    print(f"Created summary at '{summary_filename}'.")
\ No newline at end of file
+    logger.info("Created summary at '%s'.", summary_filename)
@@ -1,15 +1,178 @@
+import asyncio
+import json
 import sqlite3
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+from functools import partial, wraps
+from itertools import islice
+
+from utils.metrics import DB_WRITE_SECONDS
+from utils.url_utils import canonicalize_url
 
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'crawler.db')
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
+# Seconds to wait on a lock held by another worker process before failing
+DB_TIMEOUT = 30
+
+# Page cache of each connection, in KiB
+DB_CACHE_SIZE_KB = 64000
+
+# Bytes of the database file each connection may memory-map for reads
+DB_MMAP_SIZE = 256 * 1024 * 1024
+
+# Rows written per transaction by bulk inserts
+BULK_INSERT_CHUNK = 5000
+
+# Threads (and so connections) that run database calls for async code
+DB_EXECUTOR_THREADS = 8
+
+# Rows fetched per round trip when streaming query results
+STREAM_BATCH_SIZE = 1000
+
+# Columns of crawled_products that listings and exports may select
+PRODUCT_FIELDS = ('id', 'url', 'domain', 'product_id', 'category', 'crawl_id', 'created_at', 'first_seen', 'last_seen')
+
+# Recrawled products refresh their existing row instead of adding another.
+UPSERT_PRODUCT_SQL = """
+    INSERT INTO crawled_products (url, domain, product_id, category, crawl_id, first_seen, last_seen)
+    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+    ON CONFLICT(url) DO UPDATE SET
+        product_id = COALESCE(excluded.product_id, crawled_products.product_id),
+        category = COALESCE(excluded.category, crawled_products.category),
+        crawl_id = excluded.crawl_id,
+        last_seen = excluded.last_seen
+"""
+
+_local = threading.local()
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_connection():
+    # One long-lived connection per thread instead of a connect/close per
+    # call. Connections are keyed by process too, since a sqlite connection
+    # must never be used on both sides of a fork().
+    key = (os.getpid(), DB_PATH)
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.key == key:
+        return conn
+    if conn is not None and _local.key[0] == key[0]:
+        conn.close()
+    
+    conn = _open_connection()
+    _local.conn = conn
+    _local.key = key
+    return conn
+
+def _open_connection(check_same_thread=True):
+    conn = sqlite3.connect(DB_PATH, timeout=DB_TIMEOUT, check_same_thread=check_same_thread)
+    conn.row_factory = sqlite3.Row
+    # WAL lets API readers keep reading while a crawler commits, and with
+    # synchronous=NORMAL a commit no longer waits for an fsync.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+def close_connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.key[0] == os.getpid():
+        conn.close()
+    _local.conn = None
+
+async def run_db(func, *args, **kwargs):
+    # Runs a blocking db_utils call on a bounded pool of threads so it never
+    # stalls the event loop. Each pool thread keeps its own connection, so
+    # the executor is also a connection pool of DB_EXECUTOR_THREADS.
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_THREADS, thread_name_prefix="db")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
+
+def shutdown_db_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+@contextmanager
+def transaction(immediate=False):
+    # immediate takes the write lock up front, for transactions that read
+    # before they write and must not see the data change in between.
+    conn = get_connection()
     cursor = conn.cursor()
+    if immediate:
+        cursor.execute("BEGIN IMMEDIATE")
+    try:
+        yield cursor
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _timed_write(func):
+    # Records the write's latency under crawler_db_write_seconds, labelled
+    # with the function name.
+    histogram = DB_WRITE_SECONDS.labels(operation=func.__name__)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with histogram.time():
+            return func(*args, **kwargs)
+    return wrapper
+
+def init_db():
+    # Brings the schema up to the newest version. Each migration commits
+    # together with its user_version bump, and BEGIN IMMEDIATE makes
+    # processes starting at the same time apply it only once.
+    conn = get_connection()
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= len(MIGRATIONS):
+        return
     
-    # Drop existing table if it exists
-    cursor.execute('DROP TABLE IF EXISTS crawled_products')
+    for version, migration in enumerate(MIGRATIONS, 1):
+        with transaction(immediate=True) as cursor:
+            if cursor.execute("PRAGMA user_version").fetchone()[0] < version:
+                migration(cursor)
+                cursor.execute(f"PRAGMA user_version = {version}")
+
+def _migrate_base_schema(cursor):
+    # Databases created before migrations existed already have some of
+    # these tables and columns, so this step only adds what is missing.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS urls_to_crawl (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        url TEXT NOT NULL UNIQUE,
+        domain TEXT NOT NULL,
+        max_pages INTEGER NOT NULL DEFAULT 10,
+        max_depth INTEGER NOT NULL DEFAULT 3,
+        status TEXT DEFAULT 'pending',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        started_at TIMESTAMP,
+        completed_at TIMESTAMP
+    )
+    ''')
+    _add_column_if_missing(cursor, 'urls_to_crawl', 'concurrency', 'INTEGER NOT NULL DEFAULT 1')
+    _add_column_if_missing(cursor, 'urls_to_crawl', 'worker_id', 'TEXT')
+    _add_column_if_missing(cursor, 'urls_to_crawl', 'lease_expires_at', 'TIMESTAMP')
+    _add_column_if_missing(cursor, 'urls_to_crawl', 'product_patterns', 'TEXT')
+    _add_column_if_missing(cursor, 'urls_to_crawl', 'discovery', 'TEXT')
     
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS crawled_products (
@@ -24,130 +187,525 @@ def init_db():
     )
     ''')
     
-    conn.commit()
-    conn.close()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS crawl_frontier (
+        crawl_id INTEGER NOT NULL,
+        url TEXT NOT NULL,
+        depth INTEGER NOT NULL,
+        is_product INTEGER NOT NULL DEFAULT 0,
+        product_id TEXT,
+        category TEXT,
+        PRIMARY KEY (crawl_id, url)
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_crawl_frontier_crawl_id ON crawl_frontier (crawl_id)')
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS crawl_visited (
+        crawl_id INTEGER NOT NULL,
+        url TEXT NOT NULL,
+        PRIMARY KEY (crawl_id, url)
+    ) WITHOUT ROWID
+    ''')
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS page_state (
+        url TEXT PRIMARY KEY,
+        domain TEXT NOT NULL,
+        etag TEXT,
+        last_modified TEXT,
+        links_hash TEXT,
+        links BLOB,
+        is_product INTEGER NOT NULL DEFAULT 0,
+        last_crawled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_page_state_domain ON page_state (domain, is_product)')
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS product_changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        crawl_id INTEGER,
+        domain TEXT NOT NULL,
+        url TEXT NOT NULL,
+        change TEXT NOT NULL,
+        detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    _add_column_if_missing(cursor, 'urls_to_crawl', 'new_products', 'INTEGER')
+    _add_column_if_missing(cursor, 'urls_to_crawl', 'removed_products', 'INTEGER')
 
-def add_url_to_crawl(url, domain, max_pages = 10, max_depth = 3):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+def _migrate_indexes(cursor):
+    # claim_next_url and get_pending_urls pick the oldest pending job;
+    # product listings filter by crawl and sort by age.
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_urls_to_crawl_status ON urls_to_crawl (status, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_crawled_products_crawl_id ON crawled_products (crawl_id, created_at)')
+
+def _migrate_unique_products(cursor):
+    # One row per canonical product URL, with the first and last time any
+    # crawl saw it, instead of a new row every time a product is recrawled.
+    cursor.connection.create_function('canonicalize_url', 1, _canonicalize_stored_url, deterministic=True)
+    _add_column_if_missing(cursor, 'crawled_products', 'first_seen', 'TIMESTAMP')
+    _add_column_if_missing(cursor, 'crawled_products', 'last_seen', 'TIMESTAMP')
     
+    cursor.execute("UPDATE crawled_products SET url = canonicalize_url(url)")
+    cursor.execute('CREATE INDEX idx_crawled_products_url_dedupe ON crawled_products (url)')
+    cursor.execute('''
+    UPDATE crawled_products SET
+        first_seen = (SELECT MIN(created_at) FROM crawled_products AS seen WHERE seen.url = crawled_products.url),
+        last_seen = (SELECT MAX(created_at) FROM crawled_products AS seen WHERE seen.url = crawled_products.url)
+    ''')
+    # The newest row of each URL carries the latest crawl_id and product_id.
+    cursor.execute("DELETE FROM crawled_products WHERE id NOT IN (SELECT MAX(id) FROM crawled_products GROUP BY url)")
+    cursor.execute("UPDATE crawled_products SET created_at = first_seen")
+    cursor.execute('DROP INDEX idx_crawled_products_url_dedupe')
+    cursor.execute('CREATE UNIQUE INDEX idx_crawled_products_url ON crawled_products (url)')
+
+def _canonicalize_stored_url(url):
     try:
-        cursor.execute(
-            "INSERT INTO urls_to_crawl (url, domain, max_pages, max_depth) VALUES (?, ?, ?, ?)",
-            (url, domain, max_pages, max_depth)
-        )
-        conn.commit()
-        last_id = cursor.lastrowid
-        return last_id
+        return canonicalize_url(url)
+    except ValueError:
+        return url
+
+def _migrate_product_listing_indexes(cursor):
+    # Keyset pages over all products, or over one domain or category.
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_crawled_products_created_at ON crawled_products (created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_crawled_products_domain ON crawled_products (domain, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_crawled_products_category ON crawled_products (category, created_at)')
+
+def _migrate_render_profile(cursor):
+    _add_column_if_missing(cursor, 'urls_to_crawl', 'render_profile', 'TEXT')
+
+def _migrate_crawl_order(cursor):
+    # Best-first frontiers store each entry's static score, which includes
+    # its anchor text, so resumed crawls keep their order.
+    _add_column_if_missing(cursor, 'urls_to_crawl', 'crawl_order', 'TEXT')
+    _add_column_if_missing(cursor, 'crawl_frontier', 'score', 'REAL')
+
+def _migrate_skipped_urls(cursor):
+    # JSON object of trap URLs and pages a crawl skipped, by reason
+    _add_column_if_missing(cursor, 'urls_to_crawl', 'skipped_urls', 'TEXT')
+
+def _migrate_crawl_progress(cursor):
+    # Progress of a running job, saved with each batch of its products
+    _add_column_if_missing(cursor, 'urls_to_crawl', 'pages_visited', 'INTEGER')
+    _add_column_if_missing(cursor, 'urls_to_crawl', 'products_found', 'INTEGER')
+    _add_column_if_missing(cursor, 'urls_to_crawl', 'progress_at', 'TIMESTAMP')
+
+def _migrate_frontier_fetch_url(cursor):
+    # Frontier rows are keyed by canonical URL, like crawl_visited; fetch_url
+    # is the URL as the crawl found it, when that differs.
+    _add_column_if_missing(cursor, 'crawl_frontier', 'fetch_url', 'TEXT')
+
+# Applied in order; the database's PRAGMA user_version is the number of
+# migrations it has already run. Only ever append to this list.
+MIGRATIONS = [
+    _migrate_base_schema,
+    _migrate_indexes,
+    _migrate_unique_products,
+    _migrate_product_listing_indexes,
+    _migrate_render_profile,
+    _migrate_crawl_order,
+    _migrate_skipped_urls,
+    _migrate_crawl_progress,
+    _migrate_frontier_fetch_url,
+]
+
+def _add_column_if_missing(cursor, table, column, definition):
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def add_url_to_crawl(url, domain, max_pages = 10, max_depth = 3, concurrency = 1, product_patterns = None, discovery = None, render_profile = None, crawl_order = None):
+    try:
+        with transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO urls_to_crawl (url, domain, max_pages, max_depth, concurrency, product_patterns, discovery, render_profile, crawl_order) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, domain, max_pages, max_depth, concurrency,
+                 json.dumps(product_patterns) if product_patterns is not None else None, discovery, render_profile, crawl_order)
+            )
+            return cursor.lastrowid
     except sqlite3.IntegrityError:
         return -1
-    finally:
-        conn.close()
+
+@_timed_write
+def add_urls_to_crawl(jobs):
+    # Queues many jobs in one transaction. jobs are dicts with the arguments
+    # of add_url_to_crawl and unique urls. Returns the ids of urls that were
+    # already queued and of the newly inserted ones, both keyed by url.
+    with transaction(immediate=True) as cursor:
+        existing = _get_url_ids(cursor, [job['url'] for job in jobs])
+        new_jobs = [job for job in jobs if job['url'] not in existing]
+        cursor.executemany(
+            "INSERT INTO urls_to_crawl (url, domain, max_pages, max_depth, concurrency, product_patterns, discovery, render_profile, crawl_order) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (job['url'], job['domain'], job.get('max_pages', 10), job.get('max_depth', 3), job.get('concurrency', 1),
+                 json.dumps(job['product_patterns']) if job.get('product_patterns') is not None else None,
+                 job.get('discovery'), job.get('render_profile'), job.get('crawl_order'))
+                for job in new_jobs
+            ]
+        )
+        inserted = _get_url_ids(cursor, [job['url'] for job in new_jobs])
+    return existing, inserted
+
+def _get_url_ids(cursor, urls):
+    ids = {}
+    # Stay well below SQLite's limit on bound parameters per statement.
+    for chunk in _chunks(urls, 500):
+        cursor.execute(
+            f"SELECT id, url FROM urls_to_crawl WHERE url IN ({', '.join('?' * len(chunk))})",
+            chunk
+        )
+        ids.update((url, url_id) for url_id, url in cursor.fetchall())
+    return ids
+
+def count_urls_by_status():
+    rows = get_connection().execute(
+        "SELECT status, COUNT(*) FROM urls_to_crawl GROUP BY status"
+    ).fetchall()
+    return {status: count for status, count in rows}
 
 def get_pending_urls():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    rows = get_connection().execute(
+        "SELECT * FROM urls_to_crawl WHERE status = 'pending' ORDER BY created_at ASC"
+    ).fetchall()
     
-    cursor.execute("SELECT * FROM urls_to_crawl WHERE status = 'pending' ORDER BY created_at ASC")
-    rows = cursor.fetchall()
-    print("kdfkdsnfkjdsdsd0d0d", rows)
-    result = [dict(row) for row in rows]
-    conn.close()
-    
-    return result
+    return [dict(row) for row in rows]
 
-def update_url_status(url_id, status):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    if status == 'processing':
+def claim_next_url(worker_id, lease_seconds):
+    # A single UPDATE ... RETURNING both picks and claims the oldest pending
+    # row, so concurrent workers (in any process) can never claim the same job.
+    with transaction() as cursor:
         cursor.execute(
-            "UPDATE urls_to_crawl SET status = ?, started_at = CURRENT_TIMESTAMP WHERE id = ?",
-            (status, url_id)
+            """
+            UPDATE urls_to_crawl
+            SET status = 'processing',
+                started_at = CURRENT_TIMESTAMP,
+                worker_id = ?,
+                lease_expires_at = datetime('now', ?)
+            WHERE id = (
+                SELECT id FROM urls_to_crawl
+                WHERE status = 'pending'
+                ORDER BY created_at ASC, id ASC
+                LIMIT 1
+            )
+            RETURNING *
+            """,
+            (worker_id, f"+{int(lease_seconds)} seconds")
         )
-    elif status in ['completed', 'failed']:
+        row = cursor.fetchone()
+    return dict(row) if row else None
+
+def renew_lease(url_id, worker_id, lease_seconds):
+    with transaction() as cursor:
         cursor.execute(
-            "UPDATE urls_to_crawl SET status = ?, completed_at = CURRENT_TIMESTAMP WHERE id = ?",
-            (status, url_id)
+            """
+            UPDATE urls_to_crawl
+            SET lease_expires_at = datetime('now', ?)
+            WHERE id = ? AND worker_id = ? AND status = 'processing'
+            """,
+            (f"+{int(lease_seconds)} seconds", url_id, worker_id)
         )
-    else:
+        return cursor.rowcount > 0
+
+def requeue_expired_urls():
+    with transaction() as cursor:
         cursor.execute(
-            "UPDATE urls_to_crawl SET status = ? WHERE id = ?",
-            (status, url_id)
+            """
+            UPDATE urls_to_crawl
+            SET status = 'pending', worker_id = NULL, lease_expires_at = NULL, started_at = NULL
+            WHERE status = 'processing' AND lease_expires_at < datetime('now')
+            """
         )
-    
-    conn.commit()
-    conn.close()
+        return cursor.rowcount
+
+def update_url_status(url_id, status):
+    with transaction() as cursor:
+        if status == 'processing':
+            cursor.execute(
+                "UPDATE urls_to_crawl SET status = ?, started_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (status, url_id)
+            )
+        elif status in ['completed', 'failed']:
+            cursor.execute(
+                "UPDATE urls_to_crawl SET status = ?, completed_at = CURRENT_TIMESTAMP, worker_id = NULL, lease_expires_at = NULL WHERE id = ?",
+                (status, url_id)
+            )
+        else:
+            cursor.execute(
+                "UPDATE urls_to_crawl SET status = ? WHERE id = ?",
+                (status, url_id)
+            )
+
+def delete_url_to_crawl(url_id):
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM urls_to_crawl WHERE id = ?", (url_id,))
+        return cursor.rowcount
+
+def clear_urls_to_crawl():
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM urls_to_crawl")
+        return cursor.rowcount
 
 def get_all_products():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT * FROM crawled_products ORDER BY created_at DESC")
-    rows = cursor.fetchall()
+    return list(iter_products())
+
+def get_products_by_crawl_id(crawl_id):
+    return list(iter_products(crawl_id=crawl_id))
+
+def _product_query(fields, domain, category, crawl_id, before, limit, key_columns=('id', 'created_at')):
+    # Newest first, keyed on (created_at, id) so every page is an index range
+    # scan instead of an OFFSET that rereads all earlier rows.
+    unknown = set(fields) - set(PRODUCT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown product fields: {', '.join(sorted(unknown))}")
+    columns = ', '.join(dict.fromkeys(key_columns + tuple(fields)))
     
-    result = [dict(row) for row in rows]
-    conn.close()
+    conditions = []
+    params = []
+    for column, value in (('domain', domain), ('category', category), ('crawl_id', crawl_id)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+    if before is not None:
+        conditions.append("(created_at, id) < (?, ?)")
+        params.extend(before)
     
-    return result
+    sql = f"SELECT {columns} FROM crawled_products"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY created_at DESC, id DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
 
-def get_products_by_crawl_id(crawl_id):
-    print(f"\nDebug - Connecting to database at {DB_PATH}")
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+def get_products_page(fields=PRODUCT_FIELDS, domain=None, category=None, crawl_id=None, before=None, limit=100):
+    # Returns one page of products and the (created_at, id) key to pass as
+    # before for the next page, or None after the last page.
+    sql, params = _product_query(fields, domain, category, crawl_id, before, limit + 1)
+    rows = get_connection().execute(sql, params).fetchall()
     
+    next_key = (rows[limit - 1]['created_at'], rows[limit - 1]['id']) if len(rows) > limit else None
+    return [{field: row[field] for field in fields} for row in rows[:limit]], next_key
+
+def iter_products(fields=PRODUCT_FIELDS, domain=None, category=None, crawl_id=None, before=None, limit=None, batch_size=STREAM_BATCH_SIZE):
+    # Streams matching products from a server-side cursor, batch_size rows
+    # at a time. The cursor runs on its own connection because a streaming
+    # response may resume this generator on a different thread each time.
+    fields = tuple(dict.fromkeys(fields))
+    sql, params = _product_query(fields, domain, category, crawl_id, before, limit, key_columns=())
+    conn = _open_connection(check_same_thread=False)
+    # Plain tuples in exactly the order of fields are cheaper than Rows.
+    conn.row_factory = None
     try:
-        cursor.execute("SELECT * FROM urls_to_crawl WHERE id = ?", (crawl_id,))
-        url_data = cursor.fetchone()
-        if url_data:
-            url_data_dict = dict(url_data)
-            print(f"Debug - Found URL data for crawl_id {crawl_id}:")
-            print(f"  Status: {url_data_dict.get('status')}")
-            print(f"  URL: {url_data_dict.get('url')}")
-        else:
-            print(f"Debug - No URL found for crawl_id {crawl_id}")
-        
-        cursor.execute("SELECT * FROM crawled_products WHERE crawl_id = ? ORDER BY created_at DESC", (crawl_id,))
-        rows = cursor.fetchall()
-        
-        if rows:
-            print(f"Debug - Found {len(rows)} products for crawl_id {crawl_id}")
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
             for row in rows:
-                row_dict = dict(row)
-                print(f"  Product URL: {row_dict.get('url')}")
-                print(f"  Product ID: {row_dict.get('product_id')}")
-        else:
-            print(f"Debug - No products found for crawl_id {crawl_id}")
-        
-        result = [dict(row) for row in rows]
-        return result
-    except Exception as e:
-        print(f"Debug - Error occurred: {str(e)}")
-        raise
+                yield dict(zip(fields, row))
     finally:
         conn.close()
+
+def delete_crawled_product(product_id):
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM crawled_products WHERE id = ?", (product_id,))
+        return cursor.rowcount
+
+def clear_crawled_products():
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM crawled_products")
+        return cursor.rowcount
+
+@_timed_write
+def save_frontier_checkpoint(crawl_id, frontier_entries, visited_urls):
+    # Frontier additions, as (canonical url, url as found, depth, match,
+    # score), and completed pages, by canonical url, are written in one
+    # transaction. The products found on those pages were saved by the
+    # crawl's product sink just before, so a resumed crawl never loses a
+    # product whose page it will not fetch again.
+    with transaction() as cursor:
+        cursor.executemany(
+            "INSERT OR IGNORE INTO crawl_frontier (crawl_id, url, fetch_url, depth, is_product, product_id, category, score) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (crawl_id, key, url if url != key else None, depth, match is not None,
+                 match.product_id if match else None, match.category if match else None, score)
+                for key, url, depth, match, score in frontier_entries
+            ]
+        )
+        cursor.executemany(
+            "INSERT OR IGNORE INTO crawl_visited (crawl_id, url) VALUES (?, ?)",
+            [(crawl_id, url) for url in visited_urls]
+        )
+        cursor.executemany(
+            "DELETE FROM crawl_frontier WHERE crawl_id = ? AND url = ?",
+            [(crawl_id, url) for url in visited_urls]
+        )
+
+def load_visited_urls(crawl_id):
+    cursor = get_connection().cursor()
     
-    return result
+    try:
+        cursor.execute("SELECT url FROM crawl_visited WHERE crawl_id = ?", (crawl_id,))
+        for (url,) in cursor:
+            yield url
+    finally:
+        cursor.close()
 
+def load_frontier_entries(crawl_id, before_rowid, limit, before_score=None):
+    # Depth-first frontiers read their entries newest first, best-first ones
+    # (given before_score) highest stored score first, a missing score
+    # counting as 0. Each row's url is the one to fetch.
+    if before_score is not None:
+        return get_connection().execute(
+            """
+            SELECT rowid, IFNULL(fetch_url, url), depth, is_product, product_id, category, score FROM crawl_frontier
+            WHERE crawl_id = ? AND (IFNULL(score, 0) < ? OR (IFNULL(score, 0) = ? AND rowid < ?))
+            ORDER BY IFNULL(score, 0) DESC, rowid DESC
+            LIMIT ?
+            """,
+            (crawl_id, before_score, before_score, before_rowid, limit)
+        ).fetchall()
+    return get_connection().execute(
+        """
+        SELECT rowid, IFNULL(fetch_url, url), depth, is_product, product_id, category, score FROM crawl_frontier
+        WHERE crawl_id = ? AND rowid < ?
+        ORDER BY rowid DESC
+        LIMIT ?
+        """,
+        (crawl_id, before_rowid, limit)
+    ).fetchall()
+
+def clear_frontier(crawl_id):
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM crawl_frontier WHERE crawl_id = ?", (crawl_id,))
+        cursor.execute("DELETE FROM crawl_visited WHERE crawl_id = ?", (crawl_id,))
+
+def get_page_state(url):
+    row = get_connection().execute("SELECT * FROM page_state WHERE url = ?", (url,)).fetchone()
+    return dict(row) if row else None
+
+@_timed_write
+def save_page_states(states):
+    with transaction() as cursor:
+        cursor.executemany(
+            """
+            INSERT INTO page_state (url, domain, etag, last_modified, links_hash, links, is_product, last_crawled_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(url) DO UPDATE SET
+                etag = excluded.etag,
+                last_modified = excluded.last_modified,
+                links_hash = excluded.links_hash,
+                links = excluded.links,
+                is_product = excluded.is_product,
+                last_crawled_at = CURRENT_TIMESTAMP
+            """,
+            [
+                (state['url'], state['domain'], state.get('etag'), state.get('last_modified'),
+                 state.get('links_hash'), state.get('links'), state.get('is_product', False))
+                for state in states
+            ]
+        )
+
+def get_known_product_urls(domain):
+    rows = get_connection().execute(
+        "SELECT url FROM page_state WHERE domain = ? AND is_product = 1", (domain,)
+    ).fetchall()
+    return {row[0] for row in rows}
+
+@_timed_write
+def save_product_changes(crawl_id, domain, new_urls, removed_urls):
+    with transaction() as cursor:
+        cursor.executemany(
+            "INSERT INTO product_changes (crawl_id, domain, url, change) VALUES (?, ?, ?, ?)",
+            [(crawl_id, domain, url, 'new') for url in new_urls]
+            + [(crawl_id, domain, url, 'removed') for url in removed_urls or []]
+        )
+        cursor.executemany(
+            "DELETE FROM page_state WHERE url = ?",
+            [(url,) for url in removed_urls or []]
+        )
+        if crawl_id is not None:
+            cursor.execute(
+                "UPDATE urls_to_crawl SET new_products = ?, removed_products = ? WHERE id = ?",
+                (len(new_urls), len(removed_urls) if removed_urls is not None else None, crawl_id)
+            )
+
+def save_skipped_urls(crawl_id, skipped):
+    with transaction() as cursor:
+        cursor.execute("UPDATE urls_to_crawl SET skipped_urls = ? WHERE id = ?", (json.dumps(skipped), crawl_id))
+
+@_timed_write
+def save_product_batch(crawl_id, products, pages_visited):
+    # One batch of a running job's products and its progress, in one
+    # transaction. products_found is the number of product rows stored under
+    # the job, so products a resumed job finds again are not counted twice.
+    # It grows by the batch's products not yet stored under the job, which
+    # only looks up the batch's own URLs. Returns it.
+    with transaction() as cursor:
+        urls = list({product['url'] for product in products})
+        already_saved = 0
+        # Stay well below SQLite's limit on bound parameters per statement.
+        for chunk in _chunks(urls, 500):
+            cursor.execute(
+                f"SELECT COUNT(*) FROM crawled_products WHERE crawl_id = ? AND url IN ({', '.join('?' * len(chunk))})",
+                [crawl_id, *chunk]
+            )
+            already_saved += cursor.fetchone()[0]
+        cursor.executemany(
+            UPSERT_PRODUCT_SQL,
+            [
+                (product['url'], product['domain'], product.get('product_id'), product.get('category'), crawl_id)
+                for product in products
+            ]
+        )
+        cursor.execute(
+            """
+            UPDATE urls_to_crawl
+            SET pages_visited = ?, products_found = IFNULL(products_found, 0) + ?, progress_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            RETURNING products_found
+            """,
+            (pages_visited, len(urls) - already_saved, crawl_id)
+        )
+        row = cursor.fetchone()
+    return row[0] if row is not None else len(urls) - already_saved
+
+def get_crawl_status(crawl_id):
+    # The job's row with its skipped URLs decoded and the number of products
+    # stored under it so far, or None for an unknown job.
+    conn = get_connection()
+    row = conn.execute("SELECT * FROM urls_to_crawl WHERE id = ?", (crawl_id,)).fetchone()
+    if row is None:
+        return None
+    status = dict(row)
+    status['skipped_urls'] = json.loads(status['skipped_urls']) if status.get('skipped_urls') else {}
+    status['products_saved'] = count_crawl_products(crawl_id)
+    return status
+
+def count_crawl_products(crawl_id):
+    return get_connection().execute(
+        "SELECT COUNT(*) FROM crawled_products WHERE crawl_id = ?", (crawl_id,)
+    ).fetchone()[0]
+
+@_timed_write
 def save_crawled_products(products, crawl_id):
     if not products:
         return crawl_id
-        
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    print("Saving products:", products, "crawl_id:", crawl_id)
     
-    for product in products:
-        cursor.execute(
-            "INSERT INTO crawled_products (url, domain, product_id, category, crawl_id) VALUES (?, ?, ?, ?, ?)",
-            (product['url'], product['domain'], product.get('product_id'), product.get('category'), crawl_id)
-        )
-        print(f"Inserted product: {product['url']}")
-    
-    conn.commit()
-    conn.close()
+    rows = (
+        (product['url'], product['domain'], product.get('product_id'), product.get('category'), crawl_id)
+        for product in products
+    )
+    # Chunked transactions keep a huge job from holding the write lock
+    # (and growing the WAL) for the whole insert.
+    for chunk in _chunks(rows, BULK_INSERT_CHUNK):
+        with transaction() as cursor:
+            cursor.executemany(
+                UPSERT_PRODUCT_SQL,
+                chunk
+            )
     
-    return crawl_id
\ No newline at end of file
+    return crawl_id
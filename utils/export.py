@@ -0,0 +1,197 @@
+import csv
+import io
+import json
+import os
+import sys
+import zlib
+
+from utils.db_utils import PRODUCT_FIELDS, iter_products
+
+# Products read from the database and encoded per chunk (and per Parquet row group)
+EXPORT_CHUNK_SIZE = 10000
+
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+EXPORT_COMPRESSIONS = ("gzip", "zstd")
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+FILE_EXTENSIONS = {"csv": ".csv", "jsonl": ".jsonl", "parquet": ".parquet", "gzip": ".gz", "zstd": ".zst"}
+
+def guess_export_options(path):
+    # "products.csv.gz" -> ("csv", "gzip"); unknown extensions give None.
+    name = os.path.basename(path).lower()
+    compression = None
+    for codec in EXPORT_COMPRESSIONS:
+        if name.endswith(FILE_EXTENSIONS[codec]):
+            compression = codec
+            name = name[:-len(FILE_EXTENSIONS[codec])]
+    export_format = None
+    for candidate in EXPORT_FORMATS:
+        if name.endswith(FILE_EXTENSIONS[candidate]):
+            export_format = candidate
+    return export_format, compression
+
+def export_filename(export_format, compression=None, stem="products"):
+    # Parquet compresses its column chunks itself instead of the whole file.
+    name = stem + FILE_EXTENSIONS[export_format]
+    if compression and export_format != "parquet":
+        name += FILE_EXTENSIONS[compression]
+    return name
+
+def iter_export(export_format="jsonl", compression=None, fields=PRODUCT_FIELDS, chunk_size=EXPORT_CHUNK_SIZE, **filters):
+    # Yields the encoded export as byte chunks while rows stream off a
+    # database cursor, so memory stays flat however many products match.
+    # filters are passed on to iter_products (domain, category, crawl_id).
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if compression is not None and compression not in EXPORT_COMPRESSIONS:
+        raise ValueError(f"compression must be one of: {', '.join(EXPORT_COMPRESSIONS)}")
+    fields = tuple(fields)
+    unknown = set(fields) - set(PRODUCT_FIELDS)
+    if not fields or unknown:
+        raise ValueError(f"fields must be a subset of: {', '.join(PRODUCT_FIELDS)}")
+
+    # Missing optional packages fail here, before any bytes are produced.
+    if export_format == "parquet":
+        parquet_modules = _import_pyarrow()
+        rows = iter_products(fields, batch_size=chunk_size, **filters)
+        return _iter_parquet(parquet_modules, rows, fields, compression, chunk_size)
+
+    compressor = _make_compressor(compression) if compression else None
+    rows = iter_products(fields, batch_size=chunk_size, **filters)
+    encode = _encode_csv if export_format == "csv" else _encode_jsonl
+    return _compress(encode(rows, fields, chunk_size), compressor)
+
+def export_products(destination, export_format=None, compression=None, fields=PRODUCT_FIELDS, chunk_size=EXPORT_CHUNK_SIZE, **filters):
+    # destination is a path, "-" for stdout, or a binary file object. The
+    # format and compression default to what a path's extension implies.
+    if isinstance(destination, str) and export_format is None:
+        export_format, guessed = guess_export_options(destination)
+        compression = compression or guessed
+    chunks = iter_export(export_format or "jsonl", compression, fields, chunk_size, **filters)
+
+    if destination == "-":
+        return _write_chunks(chunks, sys.stdout.buffer)
+    if isinstance(destination, str):
+        directory = os.path.dirname(destination)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write next to the target and rename, so a failed export never
+        # leaves a truncated file behind.
+        partial = destination + ".partial"
+        try:
+            with open(partial, "wb") as f:
+                written = _write_chunks(chunks, f)
+            os.replace(partial, destination)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        return written
+    return _write_chunks(chunks, destination)
+
+def _write_chunks(chunks, f):
+    written = 0
+    for chunk in chunks:
+        f.write(chunk)
+        written += len(chunk)
+    return written
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _encode_csv(rows, fields, chunk_size):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    writer.writeheader()
+    for batch in _batches(rows, chunk_size):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+def _encode_jsonl(rows, fields, chunk_size):
+    for batch in _batches(rows, chunk_size):
+        yield "".join(json.dumps(row) + "\n" for row in batch).encode("utf-8")
+
+def _make_compressor(compression):
+    if compression == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd exports require the zstandard package")
+    return zstandard.ZstdCompressor().compressobj()
+
+def _compress(chunks, compressor):
+    if compressor is None:
+        yield from chunks
+        return
+
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+# File object for pyarrow that hands written bytes back to the caller instead
+# of storing them, while reporting the total position Parquet offsets need.
+class _ParquetSink(io.RawIOBase):
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet exports require the pyarrow package")
+    return pyarrow, pyarrow.parquet
+
+def _iter_parquet(parquet_modules, rows, fields, compression, chunk_size):
+    pa, pq = parquet_modules
+    schema = pa.schema([
+        (field, pa.int64() if field in ("id", "crawl_id") else pa.string())
+        for field in fields
+    ])
+    sink = _ParquetSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression=compression or "none")
+    try:
+        for batch in _batches(rows, chunk_size):
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
@@ -0,0 +1,227 @@
+import logging
+import re
+import time
+from collections import namedtuple
+
+import httpx
+
+from config import (
+    FETCH_MODE_OVERRIDES,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_TIMEOUT,
+    HTTP_USER_AGENT,
+    MIN_STATIC_LINKS,
+    RENDER_PROFILE,
+)
+from utils.data_utils import extract_domain
+from utils.link_extractor import extract_links
+from utils.metrics import (
+    ACTIVE_BROWSER_PAGES,
+    FETCH_SECONDS,
+    PARSE_SECONDS,
+    RENDER_SECONDS,
+    count_error,
+)
+from utils.rate_limiter import RATE_LIMITER, THROTTLE_STATUSES
+from utils.render_profile import make_run_config
+
+logger = logging.getLogger(__name__)
+
+# Markup of client-rendered app shells whose links only exist after JavaScript runs
+SPA_SHELL_PATTERN = re.compile(
+    r'<div[^>]+id=["\'](?:root|app|__next|__nuxt|svelte)["\'][^>]*>\s*</div>'
+    r'|<app-root[\s>]'
+    r'|<noscript>[^<]*(?:enable|requires?) javascript',
+    re.IGNORECASE,
+)
+
+async def _render(crawler, url, run_config, rate_limiter):
+    start = time.perf_counter()
+    with ACTIVE_BROWSER_PAGES.track():
+        result = await crawler.arun(url=url, config=run_config)
+    elapsed = time.perf_counter() - start
+    RENDER_SECONDS.labels(outcome="success" if result.success else "failed").observe(elapsed)
+    rate_limiter.record(
+        url,
+        elapsed,
+        result.status_code,
+        (result.response_headers or {}).get("retry-after"),
+        error=not result.success and result.status_code is None,
+    )
+    return result
+
+async def extract_links_from_page(
+    crawler,
+    url,
+    session_id,
+    page_semaphore=None,
+    render_profile=RENDER_PROFILE,
+    rate_limiter=RATE_LIMITER,
+    anchor_texts=None,
+):
+    # Returns None when the page could not be rendered.
+    logger.debug("Rendering %s", url)
+
+    run_config = make_run_config(session_id, render_profile)
+    if page_semaphore is None:
+        result = await _render(crawler, url, run_config, rate_limiter)
+    else:
+        async with page_semaphore:
+            result = await _render(crawler, url, run_config, rate_limiter)
+
+    if not result.success:
+        count_error("render_failed")
+        logger.warning("Error rendering page %s: %s", url, result.error_message)
+        return None
+
+    with PARSE_SECONDS.labels(source="browser").time():
+        links = extract_links(result.cleaned_html, url, anchor_texts)
+
+    logger.debug("Found %d links on %s (browser)", len(links), url)
+    return links
+
+# Links of a fetched page plus the HTTP validators used for conditional recrawls.
+# not_modified is set when the server answered 304 and nothing was parsed,
+# failed when the page could be neither fetched nor rendered.
+FetchResult = namedtuple("FetchResult", ["links", "not_modified", "etag", "last_modified", "failed"], defaults=(False,))
+
+def make_http_client():
+    return httpx.AsyncClient(
+        follow_redirects=True,
+        timeout=HTTP_TIMEOUT,
+        headers={"User-Agent": HTTP_USER_AGENT},
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+        ),
+    )
+
+# Fetches page links over plain HTTP and renders in the browser only when the
+# raw HTML looks like a JavaScript app shell, has too few same-domain links or
+# cannot be fetched. Domains that turn out to need JavaScript are remembered
+# and go straight to the browser afterwards.
+class TieredFetcher:
+    def __init__(
+        self,
+        crawler,
+        page_semaphore=None,
+        mode_overrides=FETCH_MODE_OVERRIDES,
+        min_static_links=MIN_STATIC_LINKS,
+        render_profile=RENDER_PROFILE,
+        rate_limiter=RATE_LIMITER,
+    ):
+        self.crawler = crawler
+        self.page_semaphore = page_semaphore
+        self.render_profile = render_profile
+        self.rate_limiter = rate_limiter
+        self.min_static_links = min_static_links
+        self.domain_modes = dict(mode_overrides)
+        self.client = None
+        self.http_pages = 0
+        self.browser_pages = 0
+
+    async def __aenter__(self):
+        self.client = make_http_client()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.client.aclose()
+        self.client = None
+        logger.info(
+            "Fetched %d pages over HTTP and %d in the browser.", self.http_pages, self.browser_pages,
+            extra={"http_pages": self.http_pages, "browser_pages": self.browser_pages},
+        )
+
+    async def fetch_links(self, url, session_id):
+        return (await self.fetch_page(url, session_id)).links
+
+    async def fetch_page(self, url, session_id, etag=None, last_modified=None, anchor_texts=None):
+        # anchor_texts, when a dict, is filled as described in extract_links.
+        domain = extract_domain(url)
+        mode = self.domain_modes.get(domain)
+        links = []
+
+        if mode != "browser":
+            html, response = await self._fetch_html(url, etag, last_modified)
+            if response is not None and response.status_code == 304:
+                self.http_pages += 1
+                logger.debug("Not modified since last crawl: %s", url)
+                return FetchResult([], True, etag, last_modified)
+            if response is not None and response.status_code in THROTTLE_STATUSES:
+                # A render would be a second, heavier request to a host that
+                # just asked us to back off; the rate limiter has slowed it
+                # down and the page counts as failed.
+                self.http_pages += 1
+                logger.info("Throttled by %s (HTTP %d), not rendering it", url, response.status_code)
+                return FetchResult([], False, None, None, True)
+            if html is not None:
+                with PARSE_SECONDS.labels(source="http").time():
+                    links = extract_links(html, url, anchor_texts)
+                if mode == "http" or not self._needs_browser(domain, html, links):
+                    self.http_pages += 1
+                    logger.debug("Found %d links on %s (http)", len(links), url)
+                    return FetchResult(
+                        links,
+                        False,
+                        response.headers.get("etag") if response is not None else None,
+                        response.headers.get("last-modified") if response is not None else None,
+                    )
+            elif mode == "http":
+                return FetchResult([], False, None, None, True)
+
+        self.browser_pages += 1
+        if mode != "browser":
+            # The render is a second request to the host.
+            await self.rate_limiter.acquire(url)
+        rendered_links = await extract_links_from_page(
+            self.crawler, url, session_id, self.page_semaphore, self.render_profile, self.rate_limiter, anchor_texts
+        )
+        if rendered_links is None:
+            return FetchResult([], False, None, None, True)
+
+        # Only pin the domain to the browser when rendering actually revealed
+        # links that the raw HTML was missing.
+        if mode is None and len(rendered_links) >= max(self.min_static_links, 2 * len(links)):
+            self.domain_modes[domain] = "browser"
+            logger.info("Rendering all further pages of %s in the browser", domain)
+
+        return FetchResult(rendered_links, False, None, None)
+
+    async def _fetch_html(self, url, etag=None, last_modified=None):
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        start = time.perf_counter()
+        try:
+            response = await self.client.get(url, headers=headers)
+        except httpx.HTTPError as e:
+            FETCH_SECONDS.labels(status="error").observe(time.perf_counter() - start)
+            self.rate_limiter.record(url, error=True)
+            count_error(e)
+            logger.info("HTTP fetch failed for %s: %s", url, str(e))
+            return None, None
+        elapsed = time.perf_counter() - start
+        FETCH_SECONDS.labels(status=response.status_code).observe(elapsed)
+        self.rate_limiter.record(url, elapsed, response.status_code, response.headers.get("retry-after"))
+
+        # Missing pages have no links in the browser either; anything else
+        # but throttling (bot walls, server errors) gets a second chance as a
+        # real render.
+        if response.status_code == 304:
+            return None, response
+        if response.status_code in (404, 410):
+            return "", response
+        if response.status_code != 200:
+            return None, response
+        if "html" not in response.headers.get("content-type", "html"):
+            return "", response
+        return response.text, response
+
+    def _needs_browser(self, domain, html, links):
+        if SPA_SHELL_PATTERN.search(html):
+            self.domain_modes.setdefault(domain, "browser")
+            return True
+        return html != "" and len(links) < self.min_static_links
@@ -0,0 +1,302 @@
+import asyncio
+import heapq
+import logging
+import sys
+import time
+
+from config import (
+    CRAWL_ORDER,
+    FRONTIER_CHECKPOINT_PAGES,
+    FRONTIER_CHECKPOINT_SECONDS,
+    FRONTIER_MEMORY_LIMIT,
+)
+from utils.classifier import ProductMatch
+from utils.db_utils import (
+    clear_frontier,
+    load_frontier_entries,
+    load_visited_urls,
+    save_frontier_checkpoint,
+)
+from utils.link_scorer import LinkScorer, path_prefixes
+from utils.url_utils import canonicalize_url
+
+logger = logging.getLogger(__name__)
+
+CRAWL_ORDERS = ("best_first", "depth_first")
+
+# A best-first heap re-scores all its entries once the scorer has learned
+# from one page per this many entries
+RESCORE_ENTRIES_PER_PAGE = 100
+
+# Priority an entry must have lost against the next one before take() puts it
+# back; smaller drifts wait for the next re-score
+REQUEUE_MARGIN = 0.1
+
+# Depth-first entries: a stack of (url, depth, match), newest on top.
+class LinkStack:
+    def __init__(self):
+        self.items = []
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, url, depth, match, score=None):
+        self.items.append((url, depth, match))
+
+    def take(self):
+        return self.items.pop() if self.items else None
+
+    def trim(self, limit, keep):
+        # Drops the oldest entries beyond limit, except those keep() holds on to.
+        overflow = len(self.items) - limit
+        if overflow <= 0:
+            return False
+        self.items[:overflow] = [entry for entry in self.items[:overflow] if keep(entry[0])]
+        return True
+
+# Best-first entries: a heap of (-priority, sequence, score, prefixes, url,
+# depth, match), where priority is the static score plus what the scorer
+# learned about the URL's path prefixes. Ties go to the older entry.
+class LinkHeap:
+    def __init__(self, scorer):
+        self.scorer = scorer
+        self.items = []
+        self.sequence = 0
+        self.scored_version = scorer.version
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, url, depth, match, score):
+        prefixes = path_prefixes(url)
+        self.sequence += 1
+        heapq.heappush(
+            self.items,
+            (-(score + self.scorer.learned(prefixes)), self.sequence, score, prefixes, url, depth, match),
+        )
+
+    def take(self):
+        if (self.scorer.version - self.scored_version) * RESCORE_ENTRIES_PER_PAGE >= len(self.items):
+            self._rescore()
+        while self.items:
+            item = heapq.heappop(self.items)
+            key = -(item[2] + self.scorer.learned(item[3]))
+            # An entry whose prefix has done worse since it was scored goes
+            # back in behind the entries that now beat it.
+            if self.items and key > self.items[0][0] + REQUEUE_MARGIN:
+                heapq.heappush(self.items, (key,) + item[1:])
+                continue
+            return item[4], item[5], item[6]
+        return None
+
+    def trim(self, limit, keep):
+        # Drops the lowest priority entries beyond limit, except those keep()
+        # holds on to.
+        if len(self.items) <= limit:
+            return False
+        self.items.sort()
+        self.items = self.items[:limit] + [item for item in self.items[limit:] if keep(item[4])]
+        heapq.heapify(self.items)
+        return True
+
+    def _rescore(self):
+        learned = self.scorer.learned
+        self.items = [(-(item[2] + learned(item[3])),) + item[1:] for item in self.items]
+        heapq.heapify(self.items)
+        self.scored_version = self.scorer.version
+
+# A frontier holds (url, depth, match) entries, in depth-first or best-first
+# order, and owns the page budget counter. Entries keep the URL as it was
+# found, which is what gets fetched; seen_urls holds canonical URLs (see
+# utils/url_utils.py). Callers serialize access to it (crawl_domain_for_products
+# only touches it while holding its condition lock), so pop() can claim a URL
+# in seen_urls without racing other workers.
+
+class MemoryFrontier:
+    def __init__(self, seen_urls, order=CRAWL_ORDER):
+        self.seen_urls = seen_urls
+        self.order = order
+        self.scorer = LinkScorer() if order == "best_first" else None
+        self.entries = LinkHeap(self.scorer) if self.scorer is not None else LinkStack()
+        self.pages_visited = 0
+        self.resumed = False
+
+    async def restore(self):
+        return False
+
+    def seed(self, url, depth, match):
+        self.push(url, depth, match)
+
+    def score(self, url, depth, match, anchor_text=None):
+        if self.scorer is None:
+            return None
+        return self.scorer.score(url, depth, match, anchor_text)
+
+    def push(self, url, depth, match, anchor_text=None, key=None):
+        # Returns whether the URL was queued. key is its canonical URL, when
+        # the caller has it already.
+        if (key or canonicalize_url(url)) in self.seen_urls:
+            return False
+        self.entries.add(url, depth, match, self.score(url, depth, match, anchor_text))
+        return True
+
+    async def pop(self):
+        while True:
+            entry = self.entries.take()
+            if entry is None:
+                return None
+            key = canonicalize_url(entry[0])
+            if key in self.seen_urls:
+                continue
+            self.seen_urls.add(key)
+            self.pages_visited += 1
+            return entry
+
+    def complete(self, url, products, product_links=0):
+        # product_links: product URLs the page queued for the first time.
+        if self.scorer is not None:
+            self.scorer.observe(url, len(products) + product_links)
+
+    def checkpoint_due(self):
+        return False
+
+    async def checkpoint(self):
+        pass
+
+    async def finish(self):
+        pass
+
+class PersistentFrontier(MemoryFrontier):
+    # Mirrors the frontier and the completed pages of one crawl job into
+    # crawler.db. Only the top FRONTIER_MEMORY_LIMIT entries stay in memory;
+    # the rest are read back from the database as the stack drains. The
+    # job's product sink, if given, is flushed before every checkpoint.
+
+    def __init__(
+        self,
+        crawl_id,
+        seen_urls,
+        order=CRAWL_ORDER,
+        checkpoint_pages=FRONTIER_CHECKPOINT_PAGES,
+        checkpoint_seconds=FRONTIER_CHECKPOINT_SECONDS,
+        memory_limit=FRONTIER_MEMORY_LIMIT,
+        sink=None,
+    ):
+        super().__init__(seen_urls, order)
+        self.crawl_id = crawl_id
+        self.sink = sink
+        self.checkpoint_pages = checkpoint_pages
+        self.checkpoint_seconds = checkpoint_seconds
+        self.memory_limit = memory_limit
+        self.unsaved_entries = {}
+        self.completed_urls = []
+        self.stored_entries = False
+        self.last_checkpoint = time.monotonic()
+        self.checkpoint_lock = asyncio.Lock()
+
+    async def restore(self):
+        visited = await asyncio.to_thread(lambda: list(load_visited_urls(self.crawl_id)))
+        for url in visited:
+            self.seen_urls.add(url)
+        self.pages_visited = len(visited)
+        self.stored_entries = True
+        self.resumed = bool(visited) or bool(await self._load_entries())
+        if self.resumed and self.sink is not None:
+            await self.sink.restore()
+            self.sink.pages_visited = self.pages_visited
+        if self.resumed:
+            logger.info("Resuming crawl %s: %d pages already visited.", self.crawl_id, self.pages_visited)
+        return self.resumed
+
+    def seed(self, url, depth, match):
+        if not self.resumed:
+            self.push(url, depth, match)
+
+    def push(self, url, depth, match, anchor_text=None, key=None):
+        key = key or canonicalize_url(url)
+        if key in self.seen_urls:
+            return False
+        score = self.score(url, depth, match, anchor_text)
+        self.entries.add(url, depth, match, score)
+        self.unsaved_entries[url] = (key, url, depth, match, score)
+        return True
+
+    async def pop(self):
+        if not self.entries and self.stored_entries:
+            await self.checkpoint()
+            await self._load_entries()
+        return await super().pop()
+
+    def complete(self, url, products, product_links=0):
+        # url is the page's canonical URL, as it goes into seen_urls.
+        super().complete(url, products, product_links)
+        self.completed_urls.append(url)
+
+    def checkpoint_due(self):
+        return (
+            len(self.completed_urls) >= self.checkpoint_pages
+            or (self.completed_urls and time.monotonic() - self.last_checkpoint >= self.checkpoint_seconds)
+        )
+
+    async def checkpoint(self):
+        async with self.checkpoint_lock:
+            entries = list(self.unsaved_entries.values())
+            completed_urls = self.completed_urls
+            self.unsaved_entries = {}
+            self.completed_urls = []
+
+            if entries or completed_urls:
+                try:
+                    # The products of these pages went to the sink before
+                    # the pages completed; save them before marking the
+                    # pages visited.
+                    if self.sink is not None:
+                        await self.sink.flush()
+                    await asyncio.to_thread(
+                        save_frontier_checkpoint,
+                        self.crawl_id,
+                        entries,
+                        completed_urls,
+                    )
+                except Exception:
+                    for entry in entries:
+                        self.unsaved_entries.setdefault(entry[1], entry)
+                    self.completed_urls = completed_urls + self.completed_urls
+                    raise
+            self.last_checkpoint = time.monotonic()
+
+            # Everything beyond the first memory_limit entries to visit is
+            # now safely in the database and can be dropped from memory.
+            if self.entries.trim(self.memory_limit, self.unsaved_entries.__contains__):
+                self.stored_entries = True
+
+    async def finish(self):
+        await self.checkpoint()
+        await asyncio.to_thread(clear_frontier, self.crawl_id)
+
+    async def _load_entries(self):
+        before_rowid = sys.maxsize
+        before_score = float("inf") if self.scorer is not None else None
+        while True:
+            rows = await asyncio.to_thread(
+                load_frontier_entries, self.crawl_id, before_rowid, self.memory_limit // 2 or 1, before_score
+            )
+            if not rows:
+                self.stored_entries = False
+                return False
+
+            loaded = False
+            # Rows come newest first; push them oldest first to keep LIFO order.
+            for rowid, url, depth, is_product, product_id, category, score in reversed(rows):
+                if canonicalize_url(url) in self.seen_urls:
+                    continue
+                match = ProductMatch(product_id, category) if is_product else None
+                if score is None and self.scorer is not None:
+                    score = self.scorer.score(url, depth, match)
+                self.entries.add(url, depth, match, score)
+                loaded = True
+            if loaded:
+                return True
+            before_rowid = rows[-1][0]
+            if before_score is not None:
+                before_score = rows[-1][6] or 0.0
@@ -0,0 +1,95 @@
+import asyncio
+import glob
+import logging
+import os
+import socket
+from contextlib import suppress
+
+from config import JOB_NOTIFY_DIR
+
+logger = logging.getLogger(__name__)
+
+# Every crawler service process binds a datagram socket in JOB_NOTIFY_DIR and
+# the API sends each of them a one-byte datagram after queueing a job, so idle
+# workers wake up immediately instead of on their next poll. A lost datagram
+# only delays a job until the fallback poll.
+
+def notify_supported():
+    return hasattr(socket, "AF_UNIX")
+
+# Receives job notifications for one service process.
+class JobListener:
+    def __init__(self, directory=JOB_NOTIFY_DIR):
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}.sock")
+        self.jobs_available = asyncio.Event()
+        self.sock = None
+
+    @property
+    def active(self):
+        return self.sock is not None
+
+    def start(self):
+        if not notify_supported():
+            return False
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with suppress(FileNotFoundError):
+                os.unlink(self.path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            sock.bind(self.path)
+        except OSError as e:
+            logger.warning("Job notifications unavailable, polling instead: %s", str(e))
+            return False
+        self.sock = sock
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._drain)
+        return True
+
+    def close(self):
+        if self.sock is None:
+            return
+        asyncio.get_running_loop().remove_reader(self.sock.fileno())
+        self.sock.close()
+        self.sock = None
+        with suppress(FileNotFoundError):
+            os.unlink(self.path)
+
+    async def wait(self, timeout):
+        # Callers clear() before checking the queue, so a notification that
+        # arrives while they check is never lost.
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self.jobs_available.wait(), timeout)
+
+    def clear(self):
+        self.jobs_available.clear()
+
+    def _drain(self):
+        while True:
+            try:
+                self.sock.recv(64)
+            except (BlockingIOError, InterruptedError):
+                break
+        self.jobs_available.set()
+
+def notify_workers(directory=JOB_NOTIFY_DIR):
+    if not notify_supported() or not os.path.isdir(directory):
+        return 0
+
+    notified = 0
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        sock.setblocking(False)
+        for path in glob.glob(os.path.join(directory, "*.sock")):
+            try:
+                sock.sendto(b"1", path)
+                notified += 1
+            except BlockingIOError:
+                # The listener already has unread notifications queued.
+                notified += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left behind by a service process that is no longer running.
+                with suppress(OSError):
+                    os.unlink(path)
+            except OSError:
+                pass
+    return notified
@@ -0,0 +1,85 @@
+import re
+from html import unescape
+from urllib.parse import urljoin, urlsplit
+
+# One pass over the markup finds anchor start tags, with all their
+# attributes (quoted values may contain ">"), and steps over comments,
+# scripts and styles, whose anchors are not links. Attributes split only one
+# way: an unquoted value runs up to whitespace or ">" (slashes and quotes
+# included, as html.parser reads it), and neither names nor unquoted values
+# cross a "<". Otherwise a value like /a/b/c could be re-split at every "/"
+# and malformed tags would backtrack exponentially.
+ANCHOR_PATTERN = re.compile(
+    r"""<!--.*?-->"""
+    r"""|<(script|style)\b.*?</\1\s*>"""
+    r"""|<a((?:(?:[\s/]+|(?<=["']))[^\s"'<>/=]+(?:\s*=\s*(?:"[^"]*"|'[^']*'|(?!["'])[^\s<>]+(?=[\s>])))?)*)[\s/]*>""",
+    re.IGNORECASE | re.DOTALL,
+)
+ATTRIBUTE_PATTERN = re.compile(r"""([^\s"'<>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|(?!["'])([^\s<>]+)))?""")
+TAG_PATTERN = re.compile(r"<[^>]*>")
+
+# Longest stretch of markup read for one anchor's text
+MAX_ANCHOR_HTML = 500
+
+def _href(attributes):
+    # The value of the first attribute named exactly href (not data-href).
+    if "href" not in attributes.lower():
+        return None
+    for match in ATTRIBUTE_PATTERN.finditer(attributes):
+        if match.group(1).lower() == "href":
+            return match.group(2) or match.group(3) or match.group(4) or ""
+    return None
+
+def _anchor_text(html, start):
+    end = html.find("</a", start, start + MAX_ANCHOR_HTML)
+    text = TAG_PATTERN.sub(" ", html[start:end if end != -1 else start + MAX_ANCHOR_HTML])
+    if "&" in text:
+        text = unescape(text)
+    return " ".join(text.split()).lower()
+
+def extract_links(html, base_url, anchor_texts=None):
+    # Passing a dict as anchor_texts also collects the lowercased text of each
+    # link's first non-empty anchor, keyed by the returned URL.
+    if not html:
+        return []
+
+    # Parse the base URL once; every same-host check is a prefix comparison.
+    base = urlsplit(base_url)
+    origin = f"{base.scheme}://{base.netloc}"
+    origin_length = len(origin)
+
+    hrefs = {}
+    for match in ANCHOR_PATTERN.finditer(html):
+        attributes = match.group(2)
+        if attributes is None:
+            continue
+        href = _href(attributes)
+        if href is None:
+            continue
+        if anchor_texts is None:
+            hrefs.setdefault(href, None)
+        elif not hrefs.get(href):
+            hrefs[href] = _anchor_text(html, match.end())
+
+    links = {}
+    for href, text in hrefs.items():
+        href = href.strip()
+        if not href or href[0] == "#" or href[:11].lower() == "javascript:":
+            continue
+        if "&" in href:
+            href = unescape(href)
+
+        if href[0] == "/" and href[1:2] != "/" and "/." not in href:
+            url = origin + href
+        else:
+            url = urljoin(base_url, href)
+
+        if url[:origin_length] != origin:
+            continue
+        if len(url) > origin_length and url[origin_length] not in "/?#":
+            continue
+        links.setdefault(url, None)
+        if text:
+            anchor_texts.setdefault(url, text)
+
+    return list(links)
@@ -0,0 +1,113 @@
+import math
+import re
+from urllib.parse import urlsplit
+
+from config import (
+    LISTING_URL_PATTERNS,
+    LOW_VALUE_ANCHOR_WORDS,
+    LOW_VALUE_URL_PATTERNS,
+    PRODUCT_ANCHOR_WORDS,
+)
+
+# Score weights of a link's features; a higher score is visited sooner
+PRODUCT_WEIGHT = 4.0
+LISTING_WEIGHT = 2.0
+PAGINATION_WEIGHT = 1.0
+PRODUCT_ANCHOR_WEIGHT = 1.0
+LOW_VALUE_URL_WEIGHT = -3.0
+LOW_VALUE_ANCHOR_WEIGHT = -2.0
+DEPTH_WEIGHT = -0.2
+YIELD_WEIGHT = 2.0
+
+# Pages of crawl-wide average yield a path prefix starts with, so one lucky
+# or unlucky page does not decide its score
+YIELD_PRIOR_PAGES = 3
+
+PAGINATION_PATTERN = re.compile(r"[?&](?:page|p|pg|start|offset)=\d+|/page/\d+", re.IGNORECASE)
+
+def _fragments_regex(fragments):
+    return re.compile("|".join(re.escape(fragment) for fragment in fragments if fragment) or r"(?!)", re.IGNORECASE)
+
+def _words_regex(words):
+    return re.compile(r"\b(?:" + ("|".join(re.escape(word) for word in words if word) or r"(?!)") + r")\b")
+
+def path_prefixes(url):
+    # The directories of a URL, at most two levels deep, most specific last:
+    # /collections/men/shoes -> ("/collections", "/collections/men").
+    segments = [segment for segment in urlsplit(url).path.split("/") if segment][:-1][:2]
+    if not segments:
+        return ("/",)
+    return tuple("/" + "/".join(segments[:length]) for length in range(1, len(segments) + 1))
+
+# Scores frontier links of one domain crawl by how likely they lead to
+# products: product and listing URL patterns, pagination, anchor text and
+# depth make up a link's static score, fixed when it is queued. On top of
+# that comes what the crawl has learned so far: the product yield of the
+# pages it fetched under the link's path prefix, compared with the crawl's
+# average. version counts the pages learned from, so frontiers know when
+# their priorities went stale.
+class LinkScorer:
+    def __init__(
+        self,
+        listing_patterns=LISTING_URL_PATTERNS,
+        low_value_patterns=LOW_VALUE_URL_PATTERNS,
+        product_anchor_words=PRODUCT_ANCHOR_WORDS,
+        low_value_anchor_words=LOW_VALUE_ANCHOR_WORDS,
+    ):
+        self.listing_regex = _fragments_regex(listing_patterns)
+        self.low_value_regex = _fragments_regex(low_value_patterns)
+        self.product_anchor_regex = _words_regex(product_anchor_words)
+        self.low_value_anchor_regex = _words_regex(low_value_anchor_words)
+        # prefix -> [pages, products]
+        self.prefix_yields = {}
+        self.pages = 0
+        self.products = 0
+        self.version = 0
+        # prefixes -> learned score, valid for the current version
+        self.learned_scores = {}
+
+    def score(self, url, depth, match, anchor_text=None):
+        score = DEPTH_WEIGHT * depth
+        if match is not None:
+            score += PRODUCT_WEIGHT
+        elif self.listing_regex.search(url):
+            score += LISTING_WEIGHT
+        if PAGINATION_PATTERN.search(url):
+            score += PAGINATION_WEIGHT
+        if self.low_value_regex.search(url):
+            score += LOW_VALUE_URL_WEIGHT
+        if anchor_text:
+            if self.low_value_anchor_regex.search(anchor_text):
+                score += LOW_VALUE_ANCHOR_WEIGHT
+            elif self.product_anchor_regex.search(anchor_text):
+                score += PRODUCT_ANCHOR_WEIGHT
+        return score
+
+    def learned(self, prefixes):
+        score = self.learned_scores.get(prefixes)
+        if score is None:
+            score = self.learned_scores[prefixes] = self._learned(prefixes)
+        return score
+
+    def _learned(self, prefixes):
+        if not self.pages:
+            return 0.0
+        average = self.products / self.pages
+        for prefix in reversed(prefixes):
+            stats = self.prefix_yields.get(prefix)
+            if stats is not None:
+                pages, products = stats
+                expected = (products + YIELD_PRIOR_PAGES * average) / (pages + YIELD_PRIOR_PAGES)
+                return YIELD_WEIGHT * (math.log1p(expected) - math.log1p(average))
+        return 0.0
+
+    def observe(self, url, products):
+        # products: the product pages a fetched page was or newly revealed.
+        self.pages += 1
+        self.products += products
+        for prefix in path_prefixes(url):
+            stats = self.prefix_yields.setdefault(prefix, [0, 0])
+            stats[0] += 1
+            stats[1] += products
+        self.version += 1
+        self.learned_scores.clear()
@@ -0,0 +1,48 @@
+import json
+import logging
+
+from config import LOG_FORMAT, LOG_LEVEL
+
+# Attributes every LogRecord has; anything else was passed through extra=
+# and is emitted as a structured field.
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+def _fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(_fields(record))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class KeyValueFormatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+def setup_logging(level=LOG_LEVEL, log_format=LOG_FORMAT):
+    # Leaves an existing configuration alone (cron_job.py sets up its own
+    # file logging before starting the service).
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    handler = logging.StreamHandler()
+    if log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(KeyValueFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(level)
+    # httpx logs every request at INFO.
+    logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -0,0 +1,246 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# A small in-process metrics registry rendered in the Prometheus text format.
+# Counters only ever grow; per-second rates (pages/sec, products/sec) come
+# from rate() over them on the Prometheus side.
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        # Collectors run before every render, for values that are cheaper to
+        # read on demand (such as queue depth) than to keep up to date.
+        if collector not in self.collectors:
+            self.collectors.append(collector)
+
+    def render(self):
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception:
+                logger.exception("Metrics collector failed")
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+        registry.register(self)
+
+    def labels(self, *values, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames) if labels else tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            with self.lock:
+                child = self.children.setdefault(key, self._new_child())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self.children.items()):
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key))
+            lines.extend(child.samples(self.name, labels))
+        return lines
+
+    def _new_child(self):
+        raise NotImplementedError
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def samples(self, name, labels):
+        return [f"{name}{{{labels}}} {self.value}" if labels else f"{name} {self.value}"]
+
+class _CounterValue(_Value):
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+class _GaugeValue(_CounterValue):
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self.lock:
+            self.value = value
+
+    @contextmanager
+    def track(self):
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self, name, labels):
+        prefix = labels + "," if labels else ""
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {total}")
+        lines.append(f"{name}_count{suffix} {cumulative}")
+        return lines
+
+# Metrics without labels can be used directly (COUNTER.inc()); labelled ones
+# through .labels(...).
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def track(self):
+        return self.labels().track()
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+FETCH_SECONDS = Histogram("crawler_fetch_seconds", "Plain HTTP page fetch latency", ["status"])
+RENDER_SECONDS = Histogram("crawler_render_seconds", "Browser page render latency", ["outcome"])
+PARSE_SECONDS = Histogram("crawler_parse_seconds", "Link extraction time per page", ["source"], FAST_BUCKETS)
+CLASSIFY_SECONDS = Histogram("crawler_classify_seconds", "Product classification time per page of links", buckets=FAST_BUCKETS)
+DB_WRITE_SECONDS = Histogram("crawler_db_write_seconds", "Database write transaction time", ["operation"], FAST_BUCKETS)
+PAGES_TOTAL = Counter("crawler_pages_total", "Pages visited", ["domain"])
+PRODUCTS_TOTAL = Counter("crawler_products_total", "Product URLs found", ["domain", "source"])
+QUEUE_JOBS = Gauge("crawler_queue_jobs", "Crawl jobs in urls_to_crawl", ["status"])
+ACTIVE_BROWSER_PAGES = Gauge("crawler_active_browser_pages", "Pages currently rendering in the browser")
+ERRORS_TOTAL = Counter("crawler_errors_total", "Errors by type", ["type"])
+URLS_SKIPPED_TOTAL = Counter("crawler_urls_skipped_total", "Links and pages skipped as crawler traps", ["reason"])
+RATE_LIMIT_WAIT_SECONDS = Counter("crawler_rate_limit_wait_seconds_total", "Time requests waited for their host's rate limit")
+RATE_LIMIT_BACKOFFS_TOTAL = Counter("crawler_rate_limit_backoffs_total", "Host rate reductions by cause", ["reason"])
+BROWSER_POOL_BROWSERS = Gauge("crawler_browser_pool_browsers", "Browsers running in the pool")
+BROWSER_POOL_LEASES = Gauge("crawler_browser_pool_leases", "Jobs currently holding a pooled browser")
+BROWSER_POOL_UTILIZATION = Gauge("crawler_browser_pool_utilization", "Share of the open page cap in use")
+BROWSER_MEMORY_BYTES = Gauge("crawler_browser_memory_bytes", "Resident memory of all pooled browser processes")
+BROWSER_LAUNCH_SECONDS = Histogram("crawler_browser_launch_seconds", "Browser start-up time")
+BROWSER_RECYCLES_TOTAL = Counter("crawler_browser_recycles_total", "Pooled browsers replaced", ["reason"])
+
+def count_error(error):
+    ERRORS_TOTAL.labels(type=error if isinstance(error, str) else type(error).__name__).inc()
+
+def collect_queue_depth():
+    from utils.db_utils import count_urls_by_status
+
+    counts = count_urls_by_status()
+    for status in set(counts) | {"pending", "processing", "completed", "failed"}:
+        QUEUE_JOBS.labels(status=status).set(counts.get(status, 0))
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port, host="0.0.0.0"):
+    # Serves /metrics from a background thread, for processes without an
+    # HTTP server of their own (the crawler service).
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("Serving metrics on port %s", server.server_address[1])
+    return server
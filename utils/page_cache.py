@@ -0,0 +1,93 @@
+import asyncio
+import hashlib
+import logging
+import zlib
+
+from utils.db_utils import (
+    get_known_product_urls,
+    get_page_state,
+    init_db,
+    save_page_states,
+    save_product_changes,
+)
+
+logger = logging.getLogger(__name__)
+
+# Page states are buffered and written in batches of this many rows
+PAGE_STATE_BATCH = 200
+
+def links_fingerprint(links):
+    return hashlib.blake2b("\n".join(sorted(set(links))).encode("utf-8"), digest_size=16).hexdigest()
+
+def pack_links(links):
+    return zlib.compress("\n".join(links).encode("utf-8"))
+
+def unpack_links(packed):
+    return zlib.decompress(packed).decode("utf-8").split("\n") if packed else []
+
+class PageStateCache:
+    # Remembers, per canonical URL, the HTTP validators, a fingerprint and a
+    # compressed copy of the extracted link set from the previous crawl of a
+    # domain. Pages that answer 304 are not parsed at all: their stored links
+    # are queued instead, so the pages below them still get (cheap)
+    # conditional requests and deep changes are still noticed.
+
+    def __init__(self, domain, crawl_id=None):
+        self.domain = domain
+        self.crawl_id = crawl_id
+        self.pending_states = []
+        self.known_products = set()
+        self.visited_products = set()
+        self.unchanged_pages = 0
+
+    async def load(self):
+        # Crawls can run without the service or API having migrated the
+        # database (main.py, scripts); page_state must exist before it is read.
+        await asyncio.to_thread(init_db)
+        self.known_products = await asyncio.to_thread(get_known_product_urls, self.domain)
+
+    async def get(self, url):
+        return await asyncio.to_thread(get_page_state, url)
+
+    def saw_product(self, url):
+        self.visited_products.add(url)
+
+    async def record(self, url, etag, last_modified, links_hash, links, is_product):
+        self.pending_states.append({
+            'url': url,
+            'domain': self.domain,
+            'etag': etag,
+            'last_modified': last_modified,
+            'links_hash': links_hash,
+            'links': links,
+            'is_product': is_product,
+        })
+        if len(self.pending_states) >= PAGE_STATE_BATCH:
+            await self.flush()
+
+    async def flush(self):
+        states = self.pending_states
+        self.pending_states = []
+        if states:
+            await asyncio.to_thread(save_page_states, states)
+
+    async def finish(self, complete, seen_urls=()):
+        # Removals are only trustworthy when the crawl read every page it
+        # reached (complete); otherwise unvisited products would look deleted.
+        # Products the crawl reached without visiting them (listed in a
+        # sitemap) are not gone either.
+        await self.flush()
+        new_urls = sorted(self.visited_products - self.known_products)
+        removed_urls = (
+            sorted(url for url in self.known_products - self.visited_products if url not in seen_urls)
+            if complete else None
+        )
+
+        await asyncio.to_thread(save_product_changes, self.crawl_id, self.domain, new_urls, removed_urls)
+        removed_count = len(removed_urls) if removed_urls is not None else "unknown (crawl incomplete)"
+        logger.info(
+            "Recrawl of %s: %d unchanged pages, %d new and %s removed product URLs.",
+            self.domain, self.unchanged_pages, len(new_urls), removed_count,
+            extra={"domain": self.domain, "unchanged_pages": self.unchanged_pages, "new_products": len(new_urls)},
+        )
+        return new_urls, removed_urls
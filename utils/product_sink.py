@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import time
+
+from config import PRODUCT_SINK_BATCH_SIZE, PRODUCT_SINK_FLUSH_SECONDS
+from utils.db_utils import count_crawl_products, save_product_batch
+
+logger = logging.getLogger(__name__)
+
+# Receives the ProductRecords of one domain crawl as they are found, and the
+# number of pages the crawl has visited. This base sink only counts them;
+# crawl_domain_for_products calls flush() whenever flush_due() says so, and
+# once more at the end.
+class ProductSink:
+    def __init__(self):
+        self.count = 0
+        self.pages_visited = 0
+
+    async def restore(self):
+        pass
+
+    def add(self, products):
+        self.count += len(products)
+
+    def flush_due(self):
+        return False
+
+    async def flush(self):
+        pass
+
+# Keeps every product in memory, for callers that want the whole list once
+# the crawl is done (main.py, the benchmarks).
+class ProductList(ProductSink):
+    def __init__(self):
+        super().__init__()
+        self.products = []
+
+    def add(self, products):
+        super().add(products)
+        self.products.extend(products)
+
+# Writes a service job's products to crawled_products in batches of
+# batch_size, or after flush_seconds, together with the job's progress, so
+# memory stays flat however large the crawl and a crash loses at most one
+# batch. A PersistentFrontier flushes it before each checkpoint. Once saved,
+# count is the number of products stored under the job, which a resumed job
+# (or one that finds a product twice) does not inflate.
+class DatabaseProductSink(ProductSink):
+    def __init__(self, crawl_id, batch_size=PRODUCT_SINK_BATCH_SIZE, flush_seconds=PRODUCT_SINK_FLUSH_SECONDS):
+        super().__init__()
+        self.crawl_id = crawl_id
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self.pending = []
+        self.saved_pages = None
+        self.last_flush = time.monotonic()
+        self.flush_lock = asyncio.Lock()
+
+    async def restore(self):
+        # A resumed job goes on from the products its earlier run saved.
+        self.count = await asyncio.to_thread(count_crawl_products, self.crawl_id)
+
+    def add(self, products):
+        super().add(products)
+        self.pending.extend(products)
+
+    def flush_due(self):
+        if len(self.pending) >= self.batch_size:
+            return True
+        return (
+            (self.pending or self.saved_pages != self.pages_visited)
+            and time.monotonic() - self.last_flush >= self.flush_seconds
+        )
+
+    async def flush(self):
+        async with self.flush_lock:
+            products = self.pending
+            self.pending = []
+            pages_visited = self.pages_visited
+            if products or pages_visited != self.saved_pages:
+                try:
+                    stored = await asyncio.to_thread(
+                        save_product_batch, self.crawl_id, [product.as_dict() for product in products], pages_visited
+                    )
+                except Exception:
+                    self.pending = products + self.pending
+                    raise
+                self.saved_pages = pages_visited
+                # Products added while the batch was being written are not
+                # stored yet.
+                self.count = stored + len(self.pending)
+                logger.debug("Saved %d products of crawl %s.", len(products), self.crawl_id)
+            self.last_flush = time.monotonic()
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from config import (
+    RATE_LIMIT_DECREASE,
+    RATE_LIMIT_INCREASE,
+    RATE_LIMIT_INITIAL,
+    RATE_LIMIT_MAX,
+    RATE_LIMIT_MAX_HOSTS,
+    RATE_LIMIT_MIN,
+    RATE_LIMIT_SLOW_FACTOR,
+)
+from utils.metrics import RATE_LIMIT_BACKOFFS_TOTAL, RATE_LIMIT_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Responses that mean the host wants us to slow down
+THROTTLE_STATUSES = frozenset((429, 503))
+
+# Responses faster than this never count as slow, however quick the host
+# usually is
+SLOW_LATENCY_FLOOR = 1.0
+
+def parse_retry_after(value, now=None):
+    # Retry-After is either delay-seconds or an HTTP date; returns seconds.
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - (now or datetime.now(timezone.utc))).total_seconds())
+
+# Token bucket of one host. Tokens refill at rate per second up to one
+# second's worth; a request takes a token and waits while the bucket is in
+# debt, so concurrent callers are spaced 1/rate apart without a lock.
+# "updated" may lie in the future: the bucket is paused until then
+# (Retry-After) and refills from there.
+class HostBucket:
+    def __init__(self, rate, min_rate, max_rate):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.decreased_at = float("-inf")
+        self.latency = None
+
+    @property
+    def capacity(self):
+        return max(1.0, self.rate)
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def reserve(self, now):
+        # Returns the seconds to wait before sending.
+        self._refill(now)
+        self.tokens -= 1
+        return max(0.0, self.updated - now) + max(0.0, -self.tokens / self.rate)
+
+    def pause(self, seconds, now):
+        self._refill(now)
+        self.updated = max(self.updated, now + seconds)
+        self.tokens = min(self.tokens, 0.0)
+
+    def set_max_rate(self, max_rate):
+        # A cap below the usual floor (a long Crawl-delay) lowers the floor
+        # too, so no backoff can take the rate back above it.
+        self.max_rate = max_rate
+        self.min_rate = min(self.min_rate, max_rate)
+        self.rate = min(self.rate, self.max_rate)
+        self.tokens = min(self.tokens, self.capacity)
+
+    def increase(self, step):
+        self.rate = min(self.max_rate, self.rate + step)
+
+    def decrease(self, factor, now):
+        # Responses to requests sent before the last cut say nothing new, so
+        # the rate is cut at most once per request interval.
+        if now - self.decreased_at < 1 / self.rate:
+            return False
+        self.decreased_at = now
+        self.rate = max(self.min_rate, self.rate * factor)
+        self.tokens = min(self.tokens, self.capacity)
+        return True
+
+# Per-host politeness shared by every job and worker of a process. Each
+# host's rate grows additively while it answers quickly and is cut
+# multiplicatively (AIMD) on errors, 429/503 answers and latency well above
+# its usual, so fast hosts get crawled faster than a fixed delay allows and
+# struggling ones are backed off. Retry-After pauses a host, and a robots.txt
+# Crawl-delay caps its rate.
+class RateLimiter:
+    def __init__(
+        self,
+        initial_rate=RATE_LIMIT_INITIAL,
+        min_rate=RATE_LIMIT_MIN,
+        max_rate=RATE_LIMIT_MAX,
+        increase=RATE_LIMIT_INCREASE,
+        decrease=RATE_LIMIT_DECREASE,
+        slow_factor=RATE_LIMIT_SLOW_FACTOR,
+        max_hosts=RATE_LIMIT_MAX_HOSTS,
+    ):
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_factor = slow_factor
+        self.max_hosts = max_hosts
+        self.hosts = OrderedDict()
+        self.crawl_delays = {}
+
+    def bucket(self, url):
+        host = urlsplit(url).netloc.lower()
+        bucket = self.hosts.get(host)
+        if bucket is None:
+            max_rate = self.max_rate
+            delay = self.crawl_delays.get(host)
+            if delay:
+                max_rate = min(max_rate, 1 / delay)
+            bucket = self.hosts[host] = HostBucket(
+                min(self.initial_rate, max_rate), min(self.min_rate, max_rate), max_rate
+            )
+            # Forget the least recently used hosts of long-running services.
+            while len(self.hosts) > self.max_hosts:
+                self.hosts.popitem(last=False)
+        else:
+            self.hosts.move_to_end(host)
+        return bucket
+
+    async def acquire(self, url):
+        wait = self.bucket(url).reserve(time.monotonic())
+        if wait > 0:
+            RATE_LIMIT_WAIT_SECONDS.inc(wait)
+            await asyncio.sleep(wait)
+
+    def set_crawl_delay(self, url, delay):
+        host = urlsplit(url).netloc.lower()
+        if not delay or delay <= 0:
+            self.crawl_delays.pop(host, None)
+            return
+        self.crawl_delays[host] = delay
+        if host in self.hosts:
+            self.hosts[host].set_max_rate(min(self.max_rate, 1 / delay))
+        logger.info("Honoring Crawl-delay of %ss for %s", delay, host, extra={"host": host})
+
+    def record(self, url, latency=None, status=None, retry_after=None, error=False):
+        # Feeds back one response (or a failed request) of the host.
+        bucket = self.bucket(url)
+        now = time.monotonic()
+
+        if status in THROTTLE_STATUSES or error or (status is not None and status >= 500):
+            reason = "throttled" if status in THROTTLE_STATUSES else "error"
+            if bucket.decrease(self.decrease, now):
+                RATE_LIMIT_BACKOFFS_TOTAL.labels(reason=reason).inc()
+            seconds = parse_retry_after(retry_after)
+            if seconds:
+                bucket.pause(seconds, now)
+                logger.info("Pausing %s for %.1fs (Retry-After)", urlsplit(url).netloc, seconds)
+            return
+
+        if latency is None:
+            return
+        usual = bucket.latency
+        bucket.latency = latency if usual is None else 0.8 * usual + 0.2 * latency
+        if usual is not None and latency > max(SLOW_LATENCY_FLOOR, self.slow_factor * usual):
+            if bucket.decrease((1 + self.decrease) / 2, now):
+                RATE_LIMIT_BACKOFFS_TOTAL.labels(reason="slow").inc()
+        else:
+            bucket.increase(self.increase)
+
+    def rate(self, url):
+        return self.bucket(url).rate
+
+# Shared by all crawls of the process
+RATE_LIMITER = RateLimiter()
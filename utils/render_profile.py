@@ -0,0 +1,85 @@
+import logging
+import weakref
+from functools import partial
+from urllib.parse import urlsplit
+
+from crawl4ai import CacheMode, CrawlerRunConfig
+
+from config import BLOCKED_RESOURCE_TYPES, RENDER_PAGE_TIMEOUT, RENDER_PROFILE, TRACKER_HOSTS
+
+logger = logging.getLogger(__name__)
+
+# Render profiles: "full" loads pages the way a browser does, "links" only
+# what is needed to see the anchors. The links profile aborts requests for
+# images, media, fonts and stylesheets and for anything served by a known
+# tracker host (analytics, ads), returns as soon as the DOM is ready and logs
+# quietly. Other third-party scripts still load: many shops serve their app
+# bundle from a CDN host (cdn.shopify.com, *.cloudfront.net).
+RENDER_PROFILES = ("full", "links")
+
+def make_run_config(session_id, profile=RENDER_PROFILE):
+    if profile == "full":
+        return CrawlerRunConfig(
+            cache_mode=CacheMode.BYPASS,
+            session_id=session_id,
+        )
+    return CrawlerRunConfig(
+        cache_mode=CacheMode.BYPASS,
+        session_id=session_id,
+        wait_until="domcontentloaded",
+        page_timeout=int(RENDER_PAGE_TIMEOUT * 1000),
+        exclude_all_images=True,
+        verbose=False,
+        # Read back by ResourceBlocker, which sees every run's config.
+        shared_data={"render_profile": profile},
+    )
+
+# Routes the requests of links-profile pages. Pages are reused across runs
+# (sessions), so a page is routed once and each run only switches blocking
+# on or off for it.
+class ResourceBlocker:
+    def __init__(self, blocked_types=BLOCKED_RESOURCE_TYPES, tracker_hosts=TRACKER_HOSTS):
+        self.blocked_types = frozenset(blocked_types)
+        self.tracker_hosts = frozenset(host.lower() for host in tracker_hosts)
+        self.page_blocking = weakref.WeakKeyDictionary()
+        self.blocked_requests = 0
+        self.allowed_requests = 0
+
+    def install(self, crawler):
+        crawler.crawler_strategy.set_hook("on_page_context_created", self.on_page_context_created)
+        return self
+
+    async def on_page_context_created(self, page, context=None, config=None, **kwargs):
+        shared_data = getattr(config, "shared_data", None) or {}
+        blocking = shared_data.get("render_profile") == "links"
+        if blocking and page not in self.page_blocking:
+            await page.route("**/*", partial(self._route, page))
+        if page in self.page_blocking or blocking:
+            self.page_blocking[page] = blocking
+        return page
+
+    def blocks(self, resource_type, url):
+        if resource_type in self.blocked_types:
+            return True
+        # A tracker host or any of its subdomains.
+        host = (urlsplit(url).hostname or "").lower()
+        while host:
+            if host in self.tracker_hosts:
+                return True
+            host = host.partition(".")[2]
+        return False
+
+    async def _route(self, page, route):
+        request = route.request
+        if not self.page_blocking.get(page) or request.is_navigation_request():
+            await route.continue_()
+            return
+        if self.blocks(request.resource_type, request.url):
+            self.blocked_requests += 1
+            await route.abort()
+            return
+        self.allowed_requests += 1
+        await route.continue_()
+
+def install_resource_blocker(crawler):
+    return ResourceBlocker().install(crawler)
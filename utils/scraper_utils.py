@@ -1,53 +1,199 @@
 import asyncio
-import re
-from urllib.parse import urljoin, urlparse
-
-from bs4 import BeautifulSoup
-from crawl4ai import (
-    AsyncWebCrawler,
-    BrowserConfig,
-    CacheMode,
-    CrawlerRunConfig,
+import logging
+import zlib
+from urllib.parse import urljoin
+from xml.etree.ElementTree import ParseError, XMLPullParser
+
+from crawl4ai import AsyncWebCrawler, BrowserConfig
+
+from config import (
+    CRAWL_CONCURRENCY,
+    CRAWL_ORDER,
+    DISCOVERY_MODE,
+    HTTP_FAST_PATH,
+    INCREMENTAL_RECRAWL,
+    MAX_OPEN_PAGES,
+    MAX_SITEMAPS,
+    MAX_SITEMAP_URLS,
+    PARALLEL_DOMAINS,
+    RENDER_PROFILE,
+    TRAP_DETECTION,
 )
+from models.product import ProductRecord
+from utils.classifier import get_classifier
+from utils.data_utils import extract_domain
+from utils.db_utils import save_skipped_urls
+from utils.fetcher import FetchResult, TieredFetcher, extract_links_from_page, make_http_client
+from utils.frontier import MemoryFrontier
+from utils.metrics import CLASSIFY_SECONDS, PAGES_TOTAL, PRODUCTS_TOTAL, count_error
+from utils.page_cache import PageStateCache, links_fingerprint, pack_links, unpack_links
+from utils.product_sink import ProductList
+from utils.rate_limiter import RATE_LIMITER
+from utils.render_profile import install_resource_blocker
+from utils.seen_store import make_seen_store
+from utils.trap_detector import TrapDetector
+from utils.url_utils import canonicalize_url
 
-from config import PRODUCT_URL_PATTERNS, REQUEST_DELAY
-from models.product import Product
-from utils.data_utils import extract_domain, is_duplicate_url, is_product_url
+logger = logging.getLogger(__name__)
 
-def get_browser_config():
+def get_browser_config(render_profile=RENDER_PROFILE):
     return BrowserConfig(
         browser_type="chromium",
         headless=True,
-        verbose=True,
+        verbose=render_profile == "full",
     )
 
-async def extract_links_from_page(crawler, url, session_id):
-    print(f"Extracting links from {url}...")
+def make_crawler(render_profile=RENDER_PROFILE):
+    # The resource blocker only acts on runs made with the "links" profile,
+    # so one crawler can serve both.
+    crawler = AsyncWebCrawler(config=get_browser_config(render_profile))
+    install_resource_blocker(crawler)
+    return crawler
+
+def parse_robots(text, robots_url):
+    # Returns the sitemaps a robots.txt lists and the Crawl-delay of its
+    # "User-agent: *" group (None when it has none).
+    sitemaps = []
+    crawl_delay = None
+    agents = []
+    in_rules = False
+    for line in text.splitlines():
+        name, _, value = line.split("#", 1)[0].partition(":")
+        name = name.strip().lower()
+        value = value.strip()
+        if name == "sitemap" and value:
+            sitemaps.append(urljoin(robots_url, value))
+        elif name == "user-agent":
+            # Consecutive User-agent lines share the rules that follow them.
+            if in_rules:
+                agents = []
+                in_rules = False
+            agents.append(value)
+        elif name:
+            in_rules = True
+            if name == "crawl-delay" and "*" in agents:
+                try:
+                    crawl_delay = float(value)
+                except ValueError:
+                    pass
+    return sitemaps, crawl_delay
+
+async def fetch_robots(client, domain):
+    robots_url = urljoin(domain, "/robots.txt")
+    sitemaps = []
+    crawl_delay = None
     
-    result = await crawler.arun(
-        url=url,
-        config=CrawlerRunConfig(
-            cache_mode=CacheMode.BYPASS,
-            session_id=session_id,
-        ),
-    )
+    try:
+        response = await client.get(robots_url)
+        if response.status_code == 200:
+            sitemaps, crawl_delay = parse_robots(response.text, robots_url)
+    except Exception as e:
+        count_error(e)
+        logger.info("Error fetching %s: %s", robots_url, str(e))
+    
+    if not sitemaps:
+        sitemaps = [urljoin(domain, "/sitemap.xml"), urljoin(domain, "/sitemap_index.xml")]
+    return sitemaps, crawl_delay
 
-    if not result.success:
-        print(f"Error fetching page {url}: {result.error_message}")
-        return []
+async def iter_sitemap_urls(client, sitemap_urls, max_sitemaps=MAX_SITEMAPS, max_urls=MAX_SITEMAP_URLS, rate_limiter=RATE_LIMITER):
+    # Streams each sitemap through an incremental XML parser (inflating .gz
+    # files on the fly), so even multi-hundred-MB sitemaps are never held in
+    # memory. Nested sitemap indexes are followed breadth-first.
+    pending = list(sitemap_urls)
+    visited = set()
+    url_count = 0
+    
+    while pending and len(visited) < max_sitemaps and url_count < max_urls:
+        sitemap_url = pending.pop(0)
+        if sitemap_url in visited:
+            continue
+        visited.add(sitemap_url)
+        
+        parser = XMLPullParser(events=("start", "end"))
+        inflater = None
+        root = None
+        
+        await rate_limiter.acquire(sitemap_url)
+        try:
+            async with client.stream("GET", sitemap_url) as response:
+                if response.status_code != 200:
+                    continue
+                
+                async for chunk in response.aiter_bytes():
+                    if inflater is None:
+                        # Gzipped sitemap files (not just gzip transfer encoding)
+                        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS) if chunk[:2] == b"\x1f\x8b" else False
+                    parser.feed(inflater.decompress(chunk) if inflater else chunk)
+                    
+                    for event, element in parser.read_events():
+                        tag = element.tag.rsplit("}", 1)[-1]
+                        if event == "start":
+                            if root is None:
+                                root = element
+                            continue
+                        if tag != "loc" or not element.text:
+                            if tag in ("url", "sitemap"):
+                                root.clear()
+                            continue
+                        
+                        loc = element.text.strip()
+                        if root.tag.endswith("sitemapindex"):
+                            pending.append(loc)
+                        else:
+                            url_count += 1
+                            yield loc
+                            if url_count >= max_urls:
+                                return
+        except (ParseError, zlib.error) as e:
+            count_error("sitemap_parse")
+            logger.warning("Error parsing sitemap %s: %s", sitemap_url, str(e))
+        except Exception as e:
+            count_error(e)
+            logger.warning("Error fetching sitemap %s: %s", sitemap_url, str(e))
 
-    soup = BeautifulSoup(result.cleaned_html, "html.parser")
-    links = []
+async def discover_products_from_sitemaps(
+    client, domain, classifier, seen_urls, sitemaps=None, rate_limiter=RATE_LIMITER, sink=None
+):
+    # Adds the products to sink (a new ProductList by default) and returns
+    # how many there were and how many sitemap URLs were read.
+    if sink is None:
+        sink = ProductList()
+    if sitemaps is None:
+        sitemaps, _ = await fetch_robots(client, domain)
+    logger.info("Reading sitemaps for %s: %s", domain, sitemaps)
     
-    for a_tag in soup.find_all("a", href=True):
-        href = a_tag.get("href")
-        if href and not href.startswith("javascript:") and not href.startswith("#"):
-            absolute_url = urljoin(url, href)
-            if extract_domain(absolute_url) == extract_domain(url):
-                links.append(absolute_url)
+    product_count = 0
+    sitemap_url_count = 0
     
-    print(f"Found {len(links)} links on {url}")
-    return links
+    async for loc in iter_sitemap_urls(client, sitemaps, rate_limiter=rate_limiter):
+        sitemap_url_count += 1
+        url = canonicalize_url(loc)
+        if url in seen_urls:
+            continue
+        match = classifier.classify(url)
+        if match is None:
+            continue
+        
+        # Sitemap products are never fetched, so they don't use the page budget.
+        seen_urls.add(url)
+        sink.add((ProductRecord(url, domain, match.product_id, match.category),))
+        product_count += 1
+        if sink.flush_due():
+            await sink.flush()
+    
+    PRODUCTS_TOTAL.labels(domain=extract_domain(domain), source="sitemap").inc(product_count)
+    logger.info(
+        "Found %d product URLs among %d sitemap URLs for %s.", product_count, sitemap_url_count, domain,
+        extra={"domain": domain, "products": product_count, "sitemap_urls": sitemap_url_count},
+    )
+    return product_count, sitemap_url_count
+
+async def _with_client(fetcher, func, *args, **kwargs):
+    # Runs func on the fetcher's pooled HTTP client, or on a temporary one.
+    if fetcher is not None and fetcher.client is not None:
+        return await func(fetcher.client, *args, **kwargs)
+    async with make_http_client() as client:
+        return await func(client, *args, **kwargs)
 
 async def crawl_domain_for_products(
     crawler,
@@ -56,101 +202,347 @@ async def crawl_domain_for_products(
     max_depth,
     session_id,
     seen_urls,
+    concurrency=CRAWL_CONCURRENCY,
+    page_semaphore=None,
+    fetcher=None,
+    classifier=None,
+    discovery=DISCOVERY_MODE,
+    frontier=None,
+    incremental=INCREMENTAL_RECRAWL,
+    crawl_id=None,
+    render_profile=RENDER_PROFILE,
+    rate_limiter=RATE_LIMITER,
+    crawl_order=CRAWL_ORDER,
+    trap_detection=TRAP_DETECTION,
+    trap_detector=None,
+    sink=None,
 ):
-    print(f"Starting depth-first crawl of domain: {domain}")
+    # Products go to sink as they are found (a new ProductList by default,
+    # see utils/product_sink.py), which is returned.
+    concurrency = max(1, concurrency)
+    if classifier is None:
+        classifier = get_classifier(extract_domain(domain))
+    if frontier is None:
+        frontier = MemoryFrontier(seen_urls, crawl_order)
+    if trap_detector is None and trap_detection:
+        trap_detector = TrapDetector()
+    if sink is None:
+        sink = ProductList()
+    await frontier.restore()
     
-    to_visit = [(domain, 0)]
-    products = []
-    pages_visited = 0
+    sitemaps, crawl_delay = await _with_client(fetcher, fetch_robots, domain)
+    rate_limiter.set_crawl_delay(domain, crawl_delay)
     
-    while to_visit and pages_visited < max_pages:
-        current_url, depth = to_visit.pop()
+    if discovery in ("sitemap", "hybrid"):
+        sitemap_product_count, sitemap_url_count = await _with_client(
+            fetcher, discover_products_from_sitemaps, domain, classifier, seen_urls, sitemaps, rate_limiter, sink
+        )
         
-        if current_url in seen_urls:
-            continue
-        
-        seen_urls.add(current_url)
-        pages_visited += 1
-        
-        print(f"Visiting page {pages_visited}/{max_pages}: {current_url} (depth: {depth})")
+        # Only fall back to rendering pages when the site publishes no sitemap.
+        if discovery == "sitemap" and sitemap_url_count:
+            await sink.flush()
+            await frontier.finish()
+            logger.info("Completed sitemap discovery of %s. Found %d product URLs.", domain, sitemap_product_count)
+            return sink
+    
+    logger.info("Starting %s crawl of domain: %s (%d workers)", frontier.order.replace("_", "-"), domain, concurrency)
+    
+    # The frontier is shared by all workers. Every check-and-update below runs
+    # while holding frontier_changed, so seen_urls and the page budget are
+    # claimed atomically with respect to the other workers on this event loop.
+    # Links are classified in batches when they are queued, so every entry
+    # carries its ProductMatch (or None) with it.
+    root_url = canonicalize_url(domain)
+    frontier.seed(root_url, 0, classifier.classify(root_url))
+    page_cache = None
+    if incremental:
+        page_cache = PageStateCache(extract_domain(root_url), crawl_id)
+        await page_cache.load()
+    in_flight = 0
+    # Pages whose links were not read: failed fetches, errors and pages at
+    # max_depth. Products below them may still exist.
+    unread_pages = 0
+    frontier_changed = asyncio.Condition()
+    pages_counter = PAGES_TOTAL.labels(domain=extract_domain(root_url))
+    products_counter = PRODUCTS_TOTAL.labels(domain=extract_domain(root_url), source="crawl")
+    
+    async def next_page():
+        nonlocal in_flight
+        async with frontier_changed:
+            while True:
+                if frontier.pages_visited >= max_pages:
+                    return None
+                entry = await frontier.pop()
+                if entry is not None:
+                    in_flight += 1
+                    return entry + (frontier.pages_visited,)
+                if in_flight == 0:
+                    return None
+                await frontier_changed.wait()
+    
+    async def worker(worker_id):
+        nonlocal in_flight, unread_pages
+        worker_session_id = session_id if concurrency == 1 else f"{session_id}_{worker_id}"
         
-        if is_product_url(current_url, PRODUCT_URL_PATTERNS):
-            product_id = extract_product_id(current_url)
-            category = extract_category(current_url)
+        while True:
+            page = await next_page()
+            if page is None:
+                break
+            current_url, depth, match, page_number = page
+            # Pages are fetched at the URL they were found under; their
+            # canonical URL is what the crawl stores and compares.
+            page_key = canonicalize_url(current_url)
+            links = []
+            keys = []
+            matches = {}
+            # Anchor texts only matter to best-first scoring.
+            anchor_texts = {} if frontier.scorer is not None else None
+            page_products = []
             
-            product = Product(
-                url=current_url,
-                domain=domain,
-                product_id=product_id,
-                category=category
-            )
-            products.append(product)
-            print(f"Found product URL: {current_url}")
-        
-        if depth < max_depth:
-            links = await extract_links_from_page(crawler, current_url, session_id)
+            try:
+                logger.debug("Visiting page %d/%d: %s (depth: %d)", page_number, max_pages, current_url, depth)
+                pages_counter.inc()
+                
+                if match is not None:
+                    page_products.append(ProductRecord(page_key, domain, match.product_id, match.category))
+                    products_counter.inc()
+                
+                state = await page_cache.get(page_key) if page_cache is not None else None
+                result = FetchResult([], False, None, None)
+                
+                if depth < max_depth:
+                    await rate_limiter.acquire(current_url)
+                else:
+                    unread_pages += 1
+                if depth < max_depth and fetcher is not None:
+                    result = await fetcher.fetch_page(
+                        current_url,
+                        worker_session_id,
+                        state and state['etag'],
+                        state and state['last_modified'],
+                        anchor_texts,
+                    )
+                    links = result.links
+                elif depth < max_depth:
+                    links = await extract_links_from_page(
+                        crawler, current_url, worker_session_id, page_semaphore, render_profile, rate_limiter,
+                        anchor_texts,
+                    )
+                    if links is None:
+                        result = FetchResult([], False, None, None, True)
+                        links = []
+                if result.failed:
+                    unread_pages += 1
+                
+                keys = [canonicalize_url(link) for link in links]
+                if page_cache is not None:
+                    if match is not None:
+                        page_cache.saw_product(page_key)
+                    links, keys = await _record_page_state(
+                        page_cache, page_key, state, result, links, keys, depth < max_depth, match is not None,
+                    )
+                # A listing nearly identical to one already expanded (a facet or
+                # sort variant) adds nothing but more variants to the frontier.
+                if trap_detector is not None and trap_detector.is_near_duplicate(page_key, keys):
+                    logger.debug("Not expanding near-duplicate page %s", current_url)
+                    links = keys = []
+                with CLASSIFY_SECONDS.time():
+                    matches = classifier.classify_many(keys)
+            except Exception as e:
+                unread_pages += 1
+                count_error(e)
+                logger.warning("Error crawling page %s: %s", current_url, str(e))
+            finally:
+                async with frontier_changed:
+                    product_links = 0
+                    for link, key in zip(links, keys):
+                        link_match = matches.get(key)
+                        if (
+                            trap_detector is not None
+                            and key not in frontier.seen_urls
+                            and trap_detector.check_url(key, link_match is not None)
+                        ):
+                            # Marked seen so it is judged (and counted) only once.
+                            frontier.seen_urls.add(key)
+                            continue
+                        anchor_text = anchor_texts.get(link) if anchor_texts else None
+                        if frontier.push(link, depth + 1, link_match, anchor_text, key):
+                            product_links += link_match is not None
+                    sink.add(page_products)
+                    sink.pages_visited = frontier.pages_visited
+                    frontier.complete(page_key, page_products, product_links)
+                    in_flight -= 1
+                    frontier_changed.notify_all()
             
-            for link in links:
-                if link not in seen_urls:
-                    # have a rabbitmq queue for this and have a worker that consumes the queue and crawls the links and saves the products to the db
-                    # have a worker that consumes the queue and crawls the links and saves the products to the db
-                    to_visit.append((link, depth + 1))
+            if sink.flush_due():
+                await sink.flush()
+            if frontier.checkpoint_due():
+                await frontier.checkpoint()
+        
+        # Wake the remaining workers so they can observe the exhausted budget.
+        async with frontier_changed:
+            frontier_changed.notify_all()
         
-        await asyncio.sleep(REQUEST_DELAY)
+        # Close this worker's tab so finished crawls don't hold browser pages open.
+        await crawler.crawler_strategy.kill_session(worker_session_id)
     
-    print(f"Completed crawl of {domain}. Visited {pages_visited} pages, found {len(products)} product URLs.")
-    return products
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    sink.pages_visited = frontier.pages_visited
+    await sink.flush()
+    await frontier.finish()
+    skipped = dict(trap_detector.skipped) if trap_detector is not None else {}
+    if page_cache is not None:
+        # Only a crawl that read every page it reached can tell a product
+        # that is gone from one it did not get to.
+        complete = (
+            not frontier.resumed
+            and frontier.pages_visited < max_pages
+            and not unread_pages
+            and not skipped
+        )
+        await page_cache.finish(complete, frontier.seen_urls)
+    if crawl_id is not None and trap_detector is not None:
+        await asyncio.to_thread(save_skipped_urls, crawl_id, skipped)
+    
+    logger.info(
+        "Completed crawl of %s. Visited %d pages, found %d product URLs, skipped %d trap URLs%s.",
+        domain, frontier.pages_visited, sink.count, sum(skipped.values()),
+        " (" + ", ".join(f"{reason}: {count}" for reason, count in sorted(skipped.items())) + ")" if skipped else "",
+        extra={"domain": domain, "pages": frontier.pages_visited, "products": sink.count, "skipped": sum(skipped.values())},
+    )
+    return sink
 
-def extract_product_id(url):
-    patterns = [
-        r"/p/([\w-]+)",
-        r"/product/([\w-]+)",
-        r"/products/([\w-]+)",
-        r"pid=([\w]+)",
-        r"product_id=([\w]+)",
-        r"id=([\w]+)",
-    ]
+async def _record_page_state(page_cache, url, state, result, links, keys, fetched, is_product):
+    # Returns the page's links and their canonical URLs (keys). A 304 answer
+    # is never parsed: the links stored by the previous crawl are returned
+    # instead. The fingerprint covers the keys, so links that differ only in
+    # tracking parameters do not count as a change.
+    if not fetched:
+        state = state or {}
+        await page_cache.record(
+            url, state.get('etag'), state.get('last_modified'), state.get('links_hash'),
+            state.get('links'), is_product,
+        )
+        return links, keys
     
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
+    if result.not_modified and state:
+        page_cache.unchanged_pages += 1
+        await page_cache.record(
+            url, state['etag'], state['last_modified'], state['links_hash'], state['links'], is_product
+        )
+        links = unpack_links(state['links'])
+        return links, [canonicalize_url(link) for link in links]
     
-    return None
+    links_hash = links_fingerprint(keys)
+    if state and state['links_hash'] == links_hash:
+        page_cache.unchanged_pages += 1
+    await page_cache.record(
+        url, result.etag, result.last_modified, links_hash, pack_links(links), is_product
+    )
+    return links, keys
+
+def extract_product_id(url):
+    match = get_classifier().classify(url)
+    return match.product_id if match else None
 
 def extract_category(url):
-    path = urlparse(url).path.strip("/")
-    parts = path.split("/")
-    
-    if len(parts) >= 2 and any(pattern in url for pattern in PRODUCT_URL_PATTERNS):
-        return parts[-2]
-    
-    return None
+    match = get_classifier().classify(url)
+    return match.category if match else None
 
 async def crawl_multiple_domains(
     domains,
     max_pages_per_domain,
     max_depth,
+    concurrency=CRAWL_CONCURRENCY,
+    parallel=PARALLEL_DOMAINS,
+    max_open_pages=MAX_OPEN_PAGES,
+    http_fast_path=HTTP_FAST_PATH,
+    discovery=DISCOVERY_MODE,
+    render_profile=RENDER_PROFILE,
+    crawl_order=CRAWL_ORDER,
 ):
-    browser_config = get_browser_config()
     session_id = "ecommerce_product_crawler"
     
+    seen_urls = make_seen_store()
+    page_semaphore = asyncio.Semaphore(max(1, max_open_pages)) if parallel else None
+    
+    async with make_crawler(render_profile) as crawler:
+        if not http_fast_path:
+            return await _crawl_domains(
+                crawler, domains, max_pages_per_domain, max_depth, session_id,
+                seen_urls, concurrency, parallel, page_semaphore, None, discovery, render_profile, crawl_order,
+            )
+        
+        async with TieredFetcher(crawler, page_semaphore, render_profile=render_profile) as fetcher:
+            return await _crawl_domains(
+                crawler, domains, max_pages_per_domain, max_depth, session_id,
+                seen_urls, concurrency, parallel, page_semaphore, fetcher, discovery, render_profile, crawl_order,
+            )
+
+async def _crawl_domains(
+    crawler,
+    domains,
+    max_pages_per_domain,
+    max_depth,
+    session_id,
+    seen_urls,
+    concurrency,
+    parallel,
+    page_semaphore,
+    fetcher,
+    discovery,
+    render_profile,
+    crawl_order,
+):
     results = {}
-    seen_urls = set()
     
-    async with AsyncWebCrawler(config=browser_config) as crawler:
+    if not parallel:
         for domain in domains:
-            domain_products = await crawl_domain_for_products(
+            domain_sink = await crawl_domain_for_products(
                 crawler,
                 domain,
                 max_pages_per_domain,
                 max_depth,
                 session_id,
                 seen_urls,
+                concurrency=concurrency,
+                fetcher=fetcher,
+                discovery=discovery,
+                render_profile=render_profile,
+                crawl_order=crawl_order,
             )
             
-            results[domain] = domain_products
-            
-            await asyncio.sleep(REQUEST_DELAY * 2)
+            results[domain] = domain_sink.products
+        
+        return results
+    
+    # Every domain gets its own page budget and sessions, while the
+    # semaphore caps how many pages the shared browser renders at once.
+    crawls = [
+        crawl_domain_for_products(
+            crawler,
+            domain,
+            max_pages_per_domain,
+            max_depth,
+            f"{session_id}_{index}",
+            seen_urls,
+            concurrency=concurrency,
+            page_semaphore=page_semaphore,
+            fetcher=fetcher,
+            discovery=discovery,
+            render_profile=render_profile,
+            crawl_order=crawl_order,
+        )
+        for index, domain in enumerate(domains)
+    ]
+    domain_results = await asyncio.gather(*crawls, return_exceptions=True)
+    
+    for domain, domain_sink in zip(domains, domain_results):
+        if isinstance(domain_sink, Exception):
+            count_error(domain_sink)
+            logger.error("Error crawling domain %s: %s", domain, str(domain_sink))
+            results[domain] = []
+        else:
+            results[domain] = domain_sink.products
     
     return results
\ No newline at end of file
@@ -0,0 +1,117 @@
+import hashlib
+import math
+from array import array
+
+from config import SEEN_STORE, SEEN_STORE_CAPACITY, SEEN_STORE_ERROR_RATE
+
+# All stores support the `url in store` / `store.add(url)` subset of the set
+# API that the crawl loop uses, so a plain set can still be passed in.
+
+def url_fingerprint(url):
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little")
+
+class SetSeenStore:
+    def __init__(self):
+        self.urls = set()
+
+    def __contains__(self, url):
+        return url in self.urls
+
+    def __len__(self):
+        return len(self.urls)
+
+    def add(self, url):
+        self.urls.add(url)
+
+class FingerprintSeenStore:
+    # Open-addressing hash set of 64-bit URL fingerprints packed in an array,
+    # roughly 16 bytes per URL instead of a full string per URL.
+
+    def __init__(self, initial_slots=1024):
+        self.slots = array("Q", bytes(8 * initial_slots))
+        self.mask = initial_slots - 1
+        self.count = 0
+
+    def __contains__(self, url):
+        return self._find(self._key(url))[1]
+
+    def __len__(self):
+        return self.count
+
+    def add(self, url):
+        key = self._key(url)
+        index, found = self._find(key)
+        if found:
+            return
+        self.slots[index] = key
+        self.count += 1
+        if self.count * 2 > len(self.slots):
+            self._grow()
+
+    def _key(self, url):
+        # Zero marks an empty slot.
+        return url_fingerprint(url) or 1
+
+    def _find(self, key):
+        slots = self.slots
+        mask = self.mask
+        index = key & mask
+        while True:
+            value = slots[index]
+            if value == 0:
+                return index, False
+            if value == key:
+                return index, True
+            index = (index + 1) & mask
+
+    def _grow(self):
+        old_slots = self.slots
+        self.slots = array("Q", bytes(16 * len(old_slots)))
+        self.mask = len(self.slots) - 1
+        for key in old_slots:
+            if key:
+                self.slots[self._find(key)[0]] = key
+
+class BloomSeenStore:
+    # Fixed-size bloom filter: memory never grows, at the cost of treating a
+    # small fraction (error_rate at capacity) of new URLs as already seen.
+
+    def __init__(self, capacity=SEEN_STORE_CAPACITY, error_rate=SEEN_STORE_ERROR_RATE):
+        capacity = max(1, capacity)
+        self.bit_count = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.bit_count / capacity * math.log(2)))
+        self.bits = bytearray((self.bit_count + 7) // 8)
+        self.count = 0
+
+    def __contains__(self, url):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(url))
+
+    def __len__(self):
+        return self.count
+
+    def add(self, url):
+        bits = self.bits
+        added = False
+        for position in self._positions(url):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+
+    def _positions(self, url):
+        digest = hashlib.blake2b(url.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.bit_count for i in range(self.hash_count)]
+
+def make_seen_store(kind=SEEN_STORE, capacity=SEEN_STORE_CAPACITY, error_rate=SEEN_STORE_ERROR_RATE):
+    if kind == "set":
+        return SetSeenStore()
+    if kind == "fingerprint":
+        return FingerprintSeenStore()
+    if kind == "bloom":
+        return BloomSeenStore(capacity, error_rate)
+    raise ValueError(f"Unknown seen store: {kind}")
@@ -0,0 +1,157 @@
+import hashlib
+import re
+from collections import Counter
+from urllib.parse import parse_qsl, urlsplit
+
+from config import (
+    TRAP_BOILERPLATE_SHARE,
+    TRAP_MAX_PAGINATION,
+    TRAP_MAX_PARAM_VALUES,
+    TRAP_MAX_SEGMENT_REPEATS,
+    TRAP_MIN_FINGERPRINT_LINKS,
+    TRAP_SIMHASH_DISTANCE,
+)
+from utils.metrics import URLS_SKIPPED_TOTAL
+
+PAGE_NUMBER_PATTERN = re.compile(r"(?:[?&](?:page|p|pg)=|/page/)(\d+)", re.IGNORECASE)
+DIGITS_PATTERN = re.compile(r"\d+")
+
+def path_template(path):
+    # Numbers vary between pages of one template: /c/12/shoes -> /c/0/shoes.
+    return DIGITS_PATTERN.sub("0", path)
+
+def _link_hash(link):
+    return int.from_bytes(hashlib.blake2b(link.encode("utf-8"), digest_size=8).digest(), "big")
+
+def simhash(links):
+    # 64-bit SimHash of a set of links, each weighted equally: bit i is set
+    # when most link hashes have it set. Similar sets get fingerprints a few
+    # bits apart.
+    bits = [format(_link_hash(link), "064b") for link in set(links)]
+    half = len(bits) / 2
+    return int("".join("1" if column.count("1") > half else "0" for column in map("".join, zip(*bits))), 2)
+
+# Finds fingerprints within max_distance bits of a new one without comparing
+# it to every page: split into max_distance + 1 bands, two fingerprints that
+# close agree on at least one whole band, so only fingerprints sharing a band
+# are compared.
+class SimHashIndex:
+    def __init__(self, max_distance=TRAP_SIMHASH_DISTANCE):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        edges = [64 * band // bands for band in range(bands + 1)]
+        self.bands = [(start, (1 << (end - start)) - 1) for start, end in zip(edges, edges[1:])]
+        self.tables = [{} for _ in self.bands]
+
+    def find(self, fingerprint):
+        for (shift, mask), table in zip(self.bands, self.tables):
+            for other in table.get((fingerprint >> shift) & mask, ()):
+                if (fingerprint ^ other).bit_count() <= self.max_distance:
+                    return other
+        return None
+
+    def add(self, fingerprint):
+        for (shift, mask), table in zip(self.bands, self.tables):
+            table.setdefault((fingerprint >> shift) & mask, []).append(fingerprint)
+
+# Spots the URL spaces e-commerce sites never stop generating: facet and
+# sort parameters (too many distinct values of one parameter on one path
+# template), paths that repeat a segment (relative-link loops), deep
+# pagination, and listings whose links are nearly the same as a page already
+# expanded. Links on most pages of the crawl (menus, footers) are left out of
+# that comparison, or every page would look alike. One detector serves one
+# domain crawl; skipped counts the URLs and pages skipped by reason.
+class TrapDetector:
+    def __init__(
+        self,
+        max_param_values=TRAP_MAX_PARAM_VALUES,
+        max_segment_repeats=TRAP_MAX_SEGMENT_REPEATS,
+        max_pagination=TRAP_MAX_PAGINATION,
+        simhash_distance=TRAP_SIMHASH_DISTANCE,
+        min_fingerprint_links=TRAP_MIN_FINGERPRINT_LINKS,
+        boilerplate_share=TRAP_BOILERPLATE_SHARE,
+    ):
+        self.max_param_values = max_param_values
+        self.max_segment_repeats = max_segment_repeats
+        self.max_pagination = max_pagination
+        self.min_fingerprint_links = min_fingerprint_links
+        self.boilerplate_share = boilerplate_share
+        # Pages (URLs without their query) seen by is_near_duplicate, and on
+        # how many of them each link was found
+        self.pages = set()
+        self.link_pages = Counter()
+        # (path template, parameter) -> values seen
+        self.param_values = {}
+        self.fingerprints = SimHashIndex(simhash_distance)
+        self.skipped = Counter()
+
+    def check_url(self, url, is_product=False):
+        # Returns why a URL should not be queued, or None. Product URLs are
+        # only held to the path checks: their ids are meant to vary.
+        parts = urlsplit(url)
+        reason = self._check_path(parts.path)
+        if reason is None and not is_product:
+            reason = self._check_query(parts.path, parts.query)
+        if reason is not None:
+            self._skip(reason)
+        return reason
+
+    def _check_path(self, path):
+        segments = [segment for segment in path.split("/") if segment]
+        if len(segments) > self.max_segment_repeats:
+            counts = Counter(segments)
+            if counts.most_common(1)[0][1] > self.max_segment_repeats:
+                return "repeated_segments"
+        return None
+
+    def _check_query(self, path, query):
+        found = PAGE_NUMBER_PATTERN.search(path + ("?" + query if query else ""))
+        if found is not None and int(found.group(1)) > self.max_pagination:
+            return "pagination_depth"
+        if not query:
+            return None
+
+        # A new value is only recorded once the whole URL passes, so skipped
+        # URLs do not use up the allowance of the others.
+        template = path_template(path)
+        new_values = []
+        for name, value in parse_qsl(query, keep_blank_values=True):
+            if name.lower() in ("page", "p", "pg"):
+                continue
+            values = self.param_values.get((template, name))
+            if values is None or value not in values:
+                if values is not None and len(values) >= self.max_param_values:
+                    return "param_cardinality"
+                new_values.append((name, value))
+        for name, value in new_values:
+            self.param_values.setdefault((template, name), set()).add(value)
+        return None
+
+    def is_near_duplicate(self, url, links):
+        # Records the fingerprint of a page's links and returns whether a page
+        # with nearly the same links was expanded before. Links to variants of
+        # the page itself (its sort, filter and page links) are left out: they
+        # differ on every variant while the listing stays the same.
+        base = url.partition("?")[0]
+        links = {link for link in links if link.partition("?")[0] != base}
+        # Variants of one page count as one page, so their shared links do not
+        # pass for boilerplate.
+        if base not in self.pages:
+            self.pages.add(base)
+            self.link_pages.update(links)
+        # A link on a single page is never boilerplate, so variants of the
+        # first page are compared before the crawl has seen any other.
+        limit = max(1, self.boilerplate_share * len(self.pages))
+        links = [link for link in links if self.link_pages[link] <= limit]
+        if len(links) < self.min_fingerprint_links:
+            return False
+        fingerprint = simhash(links)
+        if self.fingerprints.find(fingerprint) is not None:
+            self._skip("near_duplicate")
+            return True
+        self.fingerprints.add(fingerprint)
+        return False
+
+    def _skip(self, reason):
+        self.skipped[reason] += 1
+        URLS_SKIPPED_TOTAL.labels(reason=reason).inc()
@@ -0,0 +1,46 @@
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from config import TRACKING_PARAMS
+
+_TRACKING_PARAMS = frozenset(param.lower() for param in TRACKING_PARAMS)
+_DEFAULT_PORTS = {"http": "80", "https": "443"}
+# Java servlet session ids carried in the path: /cart;jsessionid=ABC123
+_SESSION_PATH_PARAM = re.compile(r";jsessionid=[^/;]*", re.IGNORECASE)
+
+def is_tracking_param(name):
+    name = name.lower()
+    return name.startswith("utm_") or name in _TRACKING_PARAMS
+
+def canonicalize_url(url):
+    # Two URLs that differ only by fragment, tracking parameters, query
+    # order or encoding, host case, default port or a trailing slash map to
+    # one string. It is a key for deduplication, not a URL to fetch: servers
+    # may answer /a/ and /a, or ?flag and ?flag=, differently.
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+
+    netloc = parts.netloc.lower()
+    userinfo, at, host_port = netloc.rpartition("@")
+    host, _, port = host_port.rpartition(":")
+    # An IPv6 host has colons of its own; its port follows the "]".
+    if host and port == _DEFAULT_PORTS.get(scheme) and (host.endswith("]") or ":" not in host):
+        netloc = userinfo + at + host
+
+    path = parts.path or "/"
+    if ";" in path:
+        path = _SESSION_PATH_PARAM.sub("", path) or "/"
+    if len(path) > 1 and path.endswith("/"):
+        path = path.rstrip("/") or "/"
+
+    query = parts.query
+    if query:
+        params = [
+            (name, value)
+            for name, value in parse_qsl(query, keep_blank_values=True)
+            if not is_tracking_param(name)
+        ]
+        params.sort()
+        query = urlencode(params)
+
+    return urlunsplit((scheme, netloc, path, query, ""))